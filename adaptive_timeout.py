@@ -0,0 +1,213 @@
+import os
+import math
+import time
+import bisect
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from env_flags import env_flag
+from metrics import AGENT_EFFECTIVE_TIMEOUT, AGENT_LATENCY_QUANTILE, AGENT_LATENCY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 0.1 秒～約 300 秒的等比區間（每格 +20%），分位數誤差不超過一格
+LATENCY_BUCKETS = tuple(round(0.1 * 1.2 ** i, 3) for i in range(45))
+
+RUN = "run"
+STREAM = "stream"
+
+
+def product_of(customer_data):
+    """客戶的保單類別（希望購買保單），作為延遲分組的標籤"""
+    return (customer_data or {}).get("希望購買保單") or "unknown"
+
+
+class RollingHistogram:
+    """
+    滾動延遲直方圖：依時間分成 slots 個區段，只保留最近 window 秒的觀測值，
+    舊區段整段淘汰，每次觀測只做一次二分搜尋與一個加法
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=600.0, slots=10):
+        self.buckets = tuple(buckets)
+        self.slot_seconds = window / slots
+        self._slots = deque(maxlen=slots)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, now=None):
+        index = int((time.monotonic() if now is None else now) // self.slot_seconds)
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            if not self._slots or self._slots[-1][0] != index:
+                self._slots.append((index, [0] * (len(self.buckets) + 1)))
+            self._slots[-1][1][bucket] += 1
+
+    def counts(self, now=None):
+        """視窗內各區間（非累積）的次數，最後一格為 +Inf"""
+        oldest = int((time.monotonic() if now is None else now) // self.slot_seconds) - self._slots.maxlen + 1
+        totals = [0] * (len(self.buckets) + 1)
+        with self._lock:
+            for index, counts in self._slots:
+                if index >= oldest:
+                    totals = [a + b for a, b in zip(totals, counts)]
+        return totals
+
+    def quantile(self, q, now=None):
+        """
+        視窗內第 q 分位數的上界（保守估計）
+        Returns:
+            tuple: (分位數秒數, 視窗內樣本數)；無資料時為 (None, 0)
+        """
+        counts = self.counts(now)
+        total = sum(counts)
+        if not total:
+            return None, 0
+        rank = max(1, math.ceil(q * total))
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            if running >= rank:
+                return bound, total
+        return float("inf"), total
+
+    def snapshot(self, now=None):
+        """回傳 {"buckets": [(上界, 累積次數), ...], "count": 次數}，只列出有資料的區間"""
+        cumulative, running = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts(now)):
+            running += count
+            if count:
+                cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": running}
+
+
+class AdaptiveTimeouts:
+    """
+    依端點（run/stream）與保單類別分別維護滾動延遲直方圖，逾時秒數 = 分位數 × headroom，
+    限制在 [min_timeout, max_timeout] 之間；樣本數不足 min_samples 時使用 default。
+    逾時的請求以實際等待秒數計入，持續逾時會使下一次的逾時逐步放寬到上限
+    """
+
+    def __init__(self, default=60.0, quantile=0.99, headroom=1.5, min_timeout=5.0, max_timeout=120.0,
+                 min_samples=20, window=600.0, enabled=True):
+        self.default = default
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_samples = min_samples
+        self.window = window
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, endpoint, product):
+        key = (endpoint, product)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, RollingHistogram(window=self.window))
+        return histogram
+
+    def observe(self, endpoint, product, seconds, timed_out=False):
+        self._histogram(endpoint, product).observe(seconds)
+        AGENT_LATENCY_SECONDS.observe(seconds, endpoint=endpoint, product=product)
+        if timed_out:
+            logger.warning(f"{endpoint}／{product} 請求逾時（{seconds:.1f} 秒），之後的逾時將依延遲分佈放寬")
+
+    @contextmanager
+    def measure(self, endpoint, product):
+        """
+        量測區塊耗時：區塊內將 sample["ok"] 設為 True 時記為成功樣本；逾時例外記為逾時樣本；
+        其他失敗（連線錯誤、4xx/5xx、取消）不計入，避免快速失敗拉低逾時
+        """
+        sample = {"ok": False}
+        started = time.perf_counter()
+        try:
+            yield sample
+        except (asyncio.TimeoutError, TimeoutError):
+            self.observe(endpoint, product, time.perf_counter() - started, timed_out=True)
+            raise
+        if sample["ok"]:
+            self.observe(endpoint, product, time.perf_counter() - started)
+
+    def timeout_for(self, endpoint, product):
+        """
+        回傳此端點與保單類別目前的逾時秒數
+        Returns:
+            tuple: (逾時秒數, 依據："observed" 或 "default")
+        """
+        histogram = self._histograms.get((endpoint, product))
+        value, samples = histogram.quantile(self.quantile) if histogram is not None else (None, 0)
+        if value is not None:
+            AGENT_LATENCY_QUANTILE.set(value, endpoint=endpoint, product=product)
+        if not self.enabled or samples < self.min_samples:
+            timeout, source = self.default, "default"
+        else:
+            timeout, source = min(self.max_timeout, max(self.min_timeout, value * self.headroom)), "observed"
+        AGENT_EFFECTIVE_TIMEOUT.set(timeout, endpoint=endpoint, product=product)
+        return timeout, source
+
+    def snapshot(self):
+        """各端點與保單類別的樣本數、分位數、目前逾時與直方圖，供儀表板顯示"""
+        with self._lock:
+            keys = sorted(self._histograms)
+        rows = []
+        for endpoint, product in keys:
+            histogram = self._histograms[(endpoint, product)]
+            value, samples = histogram.quantile(self.quantile)
+            timeout, source = self.timeout_for(endpoint, product)
+            rows.append({"endpoint": endpoint, "product": product, "samples": samples, "quantile": self.quantile,
+                         "quantile_seconds": value, "timeout": timeout, "source": source,
+                         "histogram": histogram.snapshot()})
+        return rows
+
+
+_default_timeouts = None
+_default_timeouts_lock = threading.Lock()
+
+
+def get_adaptive_timeouts():
+    """
+    取得程序內共用的 AdaptiveTimeouts，設定由環境變數讀取：
+        AGENT_TIMEOUT（樣本不足或停用時的逾時秒數，預設 60）、AGENT_ADAPTIVE_TIMEOUT（預設 1，0 為固定逾時）、
+        AGENT_TIMEOUT_QUANTILE（預設 0.99）、AGENT_TIMEOUT_HEADROOM（倍數，預設 1.5）、
+        AGENT_TIMEOUT_MIN / AGENT_TIMEOUT_MAX（秒，預設 5 / 120）、
+        AGENT_TIMEOUT_MIN_SAMPLES（預設 20）、AGENT_TIMEOUT_WINDOW（滾動視窗秒數，預設 600）
+    """
+    global _default_timeouts
+    with _default_timeouts_lock:
+        if _default_timeouts is None:
+            _default_timeouts = AdaptiveTimeouts(
+                default=float(os.getenv("AGENT_TIMEOUT", "60")),
+                quantile=float(os.getenv("AGENT_TIMEOUT_QUANTILE", "0.99")),
+                headroom=float(os.getenv("AGENT_TIMEOUT_HEADROOM", "1.5")),
+                min_timeout=float(os.getenv("AGENT_TIMEOUT_MIN", "5")),
+                max_timeout=float(os.getenv("AGENT_TIMEOUT_MAX", "120")),
+                min_samples=int(os.getenv("AGENT_TIMEOUT_MIN_SAMPLES", "20")),
+                window=float(os.getenv("AGENT_TIMEOUT_WINDOW", "600")),
+                enabled=env_flag("AGENT_ADAPTIVE_TIMEOUT", True),
+            )
+        return _default_timeouts
+
+
+def resolve_timeout(timeout, endpoint, customer_data):
+    """呼叫端有指定 timeout 時直接採用，否則依該端點與客戶保單類別的近期延遲決定"""
+    if timeout is not None:
+        return timeout
+    return get_adaptive_timeouts().timeout_for(endpoint, product_of(customer_data))[0]
+
+
+if __name__ == "__main__":
+    # 模擬兩種保單類別的延遲分佈，印出各自的分位數與逾時
+    import random
+    timeouts = AdaptiveTimeouts()
+    rng = random.Random(1)
+    for _ in range(500):
+        timeouts.observe(STREAM, "醫療險", rng.lognormvariate(math.log(4), 0.3))
+        timeouts.observe(STREAM, "壽險", rng.lognormvariate(math.log(12), 0.3))
+    for row in timeouts.snapshot():
+        print(f"{row['endpoint']:<7}{row['product']:<6}{row['samples']:>5} 筆  p{row['quantile'] * 100:g} "
+              f"{row['quantile_seconds']:.1f} 秒 → 逾時 {row['timeout']:.1f} 秒（{row['source']}）")
@@ -1,9 +1,26 @@
 import os
 import json
+import math
+import time
 import logging
-import requests
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from dotenv import load_dotenv
+from adaptive_timeout import RUN, STREAM, get_adaptive_timeouts, resolve_timeout
+from analysis_snapshots import record_analysed
+from agent_async_client import async_call_agent_api, async_stream_agent_api, iter_sync, run_sync
+from payload_builder import build_agent_payload
+from response_parser import parse_agent_response
+from result_cache import cache_key, canonical_json, get_result_cache
+from results_store import get_result_store
+from result_writer import WriteBehindWriter, atomic_write_json, file_lock
+from customer_store import get_customer_repository, merge_customer_data
+from customer_stream import iter_customers
+from env_flags import env_flag
+from single_flight import get_single_flight, single_flight_enabled
+from tracing import span
+from metrics import AGENT_CACHE_LOOKUPS, AGENT_PARSE_RESULTS, AGENT_RATE_LIMIT_WAIT_SECONDS, AGENT_THROTTLED
 
 # 設定 logging
 logging.basicConfig(level=logging.INFO)
@@ -12,92 +29,399 @@ logger = logging.getLogger(__name__)
 # 讀取 .env 檔案
 load_dotenv()
 
-def call_agent_api(customer_data: dict, rules: dict, timeout: int = 60):
+def call_agent_api(customer_data: dict, rules: dict, timeout: int = None):
     """
     自動化呼叫 AGENT API，傳送客戶資訊與規則，回傳 API 結果或 None。
-    timeout: 逾時秒數，預設 60 秒
+    timeout: 逾時秒數，未指定時依此保單類別近期的延遲分佈決定（見 adaptive_timeout，樣本不足時為 AGENT_TIMEOUT 預設 60 秒）
+    實際請求由 agent_async_client 的共用連線池處理，多次呼叫可重用 keep-alive 連線。
+    相同客戶資料與規則的請求同時進行時只呼叫一次上游，其餘呼叫者共用同一份結果（見 single_flight）；
+    leader 的重試、退避與限流等待都有各自的上限，等待者不另設期限，與 leader 同時結束。
     """
-    api_url = os.getenv("API_URL")
-    api_token = os.getenv("API_TOKEN")  # 若 API 不需 token，可忽略此變數
-    if not api_url:
-        logger.error("缺少 API_URL，請確認 .env 檔案設定。")
-        return None
-
-    # 封裝 input_value 與 payload
-    input_content = {
-        "customer_info": customer_data,
-        "rules": rules
-    }
-    payload = {
-        "input_value": json.dumps(input_content, ensure_ascii=False),
-        "output_type": "chat",
-        "input_type": "chat",
-        "tweaks": {}
-    }
-    headers = {'Content-Type': 'application/json'}
-    if api_token:
-        headers['Authorization'] = f'Bearer {api_token}'
-
-    try:
-        response = requests.post(api_url, json=payload, headers=headers, timeout=timeout)
-        logger.info(f"API 回應狀態碼: {response.status_code}")
-        logger.debug(f"API 回應內容: {response.text}")
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        logger.error(f"API 呼叫失敗：{e}")
-        return None
+    timeout = resolve_timeout(timeout, RUN, customer_data)
+    with span("agent.call", customer_id=customer_data.get("customer_id"), timeout=round(timeout, 1)) as s:
+        call = lambda: run_sync(async_call_agent_api(customer_data, rules, timeout=timeout))
+        if single_flight_enabled():
+            result, shared = get_single_flight().do(cache_key(customer_data, rules), call)
+            s.set(shared=shared)
+        else:
+            result = call()
+        s.set(ok=result is not None)
+        return result
 
 # 自動解析最終回傳小工具
 
-def extract_final_results(api_response):
+def extract_final_results(api_response, with_status=False):
     """
     從Langflow智慧核保API回傳物件中自動萃取'擷取結果'與'分析'內容
+    線性掃描回覆文字，可處理多個或無 code block、前後說明文字，並在本機修復安全可修復的截斷 JSON；
+    只採用含 score_table/total_score/grade 的評分結果，格式範例、錯誤訊息等其他 JSON 回傳 None
     Args:
         api_response (dict): API呼叫回傳的原始JSON物件
+        with_status (bool): 是否一併回傳解析狀態
     Returns:
-        dict: {"extracted": {...}, "analysis": {...}} 或 None
+        dict: 評分結果或 None；with_status 時為 (結果, 狀態)，狀態 "repaired" 表示回覆被截斷、內容不完整
     """
-    text = ""
-    try:
-        # 多層message
-        text = (
-            api_response["outputs"][0]
-            ["outputs"][0]
-            ["results"]["message"]["text"]
-        )
-        # 去掉 markdown 或 codeblock
-        # 改用非貪婪模式，支援多層巢狀或多個 code block
-        match = re.search(r"```json\s*([\s\S]*?)\s*```", text)
-        json_text = match.group(1) if match else text
-        result = json.loads(json_text)
-        result = json.loads(json_text)
-        return result
-    except Exception as e:
-        logger.error(f"解析API回應內容失敗：{e}")
+    with span("agent.parse") as s:
+        try:
+            result, status, text = parse_agent_response(api_response)
+        except Exception as e:
+            logger.error(f"解析API回應內容失敗：{e}")
+            s.set(status="error")
+            AGENT_PARSE_RESULTS.inc(status="error")
+            return (None, "error") if with_status else None
+        s.set(status=status)
+        AGENT_PARSE_RESULTS.inc(status=status)
+    if status == "repaired":
+        logger.warning("API 回應 JSON 不完整，已於本機修復（僅保留完整的欄位，不寫入快取）")
+    elif result is None:
+        logger.error(f"解析API回應內容失敗：{status}")
         logger.error(f"解析失敗內容原文: {text}")
-        return None
+    return (result, status) if with_status else result
+
+
+def _results_dir():
+    """最新結果檔的資料夾，預設為 Results，可由環境變數 RESULTS_DIR 指定"""
+    return os.getenv("RESULTS_DIR", os.path.join(os.path.dirname(__file__), "Results"))
 
 
-def save_results(data, customer_id, filename_prefix="result"):
+def _write_results(data, customer_id, filename_prefix="result", rules=None, source="agent"):
     """
-    將資料以 .json 格式儲存於 Results 資料夾，檔名格式: {prefix}_{customer_id}.json，若已存在則覆蓋
+    實際寫入：於檔案鎖內依序新增至結果庫，並以原子方式（暫存檔＋rename）覆寫最新結果檔，
+    多個程序同時寫入同一客戶時，最新結果檔必與結果庫最新一筆一致。
+    source 為 "cache"（沿用快取）且與結果庫最新一筆相同時不再新增，避免重複的歷史版本
     """
-    results_dir = os.path.join(os.path.dirname(__file__), "Results")
+    results_dir = _results_dir()
     os.makedirs(results_dir, exist_ok=True)
     filename = f"{filename_prefix}_{customer_id}.json"
     filepath = os.path.join(results_dir, filename)
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with span("results.write", customer_id=customer_id), file_lock(filepath):
+            try:
+                store = get_result_store()
+                if source == "cache" and canonical_json(store.latest_result(customer_id)) == canonical_json(data):
+                    logger.info(f"快取結果與結果庫最新一筆相同，不重複新增：{customer_id}")
+                    return
+                store.append(customer_id, data, rules=rules, source=source)
+            except Exception as e:
+                logger.error(f"寫入結果庫失敗: {e}")
+            atomic_write_json(filepath, data)
         logger.info(f"結果已儲存於 {filepath}")
     except Exception as e:
         logger.error(f"儲存結果失敗: {e}")
 
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+
+def _get_write_behind():
+    global _write_behind
+    with _write_behind_lock:
+        if _write_behind is None:
+            _write_behind = WriteBehindWriter(_write_results)
+        return _write_behind
+
+
+def save_results(data, customer_id, filename_prefix="result", rules=None, background=None, source="agent"):
+    """
+    儲存分析結果：新增一筆至結果庫（保留所有歷史版本），
+    並將最新結果以 .json 格式寫入 Results 資料夾，檔名格式: {prefix}_{customer_id}.json，若已存在則覆蓋
+    background: 是否交由背景 thread 寫入（呼叫端不需等待磁碟），預設依環境變數 RESULTS_WRITE_BEHIND（預設關閉）
+    source: 結果來源，記錄於結果庫：agent（實際呼叫）、cache（沿用快取）、repaired（回覆被截斷，本機修復的不完整結果）
+    """
+    if background is None:
+        background = env_flag("RESULTS_WRITE_BEHIND")
+    with span("results.save", customer_id=customer_id, background=background):
+        if background:
+            _get_write_behind().submit((filename_prefix, customer_id), data, customer_id,
+                                       filename_prefix=filename_prefix, rules=rules, source=source)
+            return
+        _write_results(data, customer_id, filename_prefix=filename_prefix, rules=rules, source=source)
+
+
+def load_latest_result(customer_id, filename_prefix="result"):
+    """
+    讀取客戶最新一次的分析結果：背景寫入中尚未落地的結果優先，其次查詢結果庫，
+    查無時改讀 Results/{prefix}_{customer_id}.json；皆無則回傳 None
+    """
+    if _write_behind is not None:
+        pending = _write_behind.pending((filename_prefix, customer_id))
+        if pending is not None:
+            return pending
+    try:
+        result = get_result_store().latest_result(customer_id)
+        if result is not None:
+            return result
+    except Exception as e:
+        logger.error(f"查詢結果庫失敗: {e}")
+    filepath = os.path.join(_results_dir(), f"{filename_prefix}_{customer_id}.json")
+    if not os.path.exists(filepath):
+        return None
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"讀取結果失敗: {e}")
+        return None
+
+
+def analyze_customer(customer_data: dict, rules: dict, timeout: int = None, use_cache: bool = True):
+    """
+    呼叫 AGENT API 並解析結果；客戶資料與規則皆未變動時直接回傳快取中的解析結果。
+    回覆被截斷、於本機修復的不完整結果照樣回傳，但不寫入快取也不記錄分析快照
+    Returns:
+        tuple: (解析後結果 dict 或 None, 是否來自快取, 結果是否完整)
+    """
+    with span("agent.analyze", customer_id=customer_data.get("customer_id")) as s:
+        cache = get_result_cache() if use_cache else None
+        if cache is not None:
+            cached = cache.get(customer_data, rules)
+            AGENT_CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                logger.info(f"結果快取命中：{customer_data.get('customer_id')}")
+                s.set(from_cache=True)
+                record_analysed(customer_data, rules)
+                return cached, True, True
+        result = call_agent_api(customer_data, rules, timeout=timeout)
+        final_result, status = extract_final_results(result, with_status=True) if result else (None, "failed")
+        complete = status == "ok"
+        if final_result and complete:
+            # 記錄本次分析的資料，供增量重新分析比對（見 incremental_rescore）
+            record_analysed(customer_data, rules)
+            if cache is not None:
+                cache.put(customer_data, rules, final_result)
+        s.set(from_cache=False, ok=final_result is not None, complete=complete)
+        return final_result, False, complete
+
+def stream_agent_api(customer_data: dict, rules: dict, timeout: int = None):
+    """
+    以串流模式呼叫 AGENT API（同步 generator），逐一產出
+    {"event": "token", "chunk": ..., "text": 累積文字}，最後產出 {"event": "end", "result": 完整 API 結果}；
+    失敗時拋出例外（AgentAPIError、TimeoutError 等）
+    """
+    return iter_sync(async_stream_agent_api(customer_data, rules, timeout=timeout))
+
+
+def analyze_customer_stream(customer_data: dict, rules: dict, timeout: int = None, use_cache: bool = True):
+    """
+    analyze_customer 的串流版本：分析進行中逐一產出 token 事件，最後產出
+    {"event": "result", "result": 解析後結果 dict 或 None, "from_cache": 是否來自快取, "complete": 結果是否完整}
+    """
+    with span("agent.analyze", customer_id=customer_data.get("customer_id"), stream=True) as s:
+        cache = get_result_cache() if use_cache else None
+        if cache is not None:
+            cached = cache.get(customer_data, rules)
+            AGENT_CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                logger.info(f"結果快取命中：{customer_data.get('customer_id')}")
+                s.set(from_cache=True)
+                record_analysed(customer_data, rules)
+                yield {"event": "result", "result": cached, "from_cache": True, "complete": True}
+                return
+        timeout = resolve_timeout(timeout, STREAM, customer_data)
+        s.set(timeout=round(timeout, 1))
+        # 相同請求已在進行中時不另開串流，等待該請求完成後共用其結果（不會產出 token 事件）；
+        # leader 可能重試、退避或等待限流，等待者不另設期限，以 leader 的結束（成功或失敗）為準
+        flights = get_single_flight() if single_flight_enabled() else None
+        key = cache_key(customer_data, rules) if flights else None
+        flight, leader = flights.join(key) if flights else (None, True)
+        result = None
+        if not leader:
+            s.set(shared=True)
+            try:
+                result = flight.wait()
+            except Exception as e:
+                logger.error(f"API 呼叫失敗：{e}")
+        else:
+            claim = flights.claim(key) if flights else None
+            try:
+                if claim is not None and claim.shared:
+                    s.set(shared=True)
+                    result = claim.result
+                else:
+                    with span("agent.stream", customer_id=customer_data.get("customer_id")) as stream_span:
+                        chunks = 0
+                        for event in stream_agent_api(customer_data, rules, timeout=timeout):
+                            if event["event"] == "token":
+                                if not chunks:
+                                    # 首個 token 到達時間（相對於送出請求）
+                                    stream_span.set(first_token_ms=round((time.time() - stream_span.start) * 1000, 1))
+                                chunks += 1
+                                yield event
+                            elif event["event"] == "end":
+                                stream_span.set(chunks=chunks)
+                                result = event["result"]
+            except TimeoutError:
+                logger.error(f"API 呼叫失敗：逾時 {timeout} 秒")
+            except Exception as e:
+                logger.error(f"API 呼叫失敗：{e}")
+            finally:
+                if claim is not None:
+                    claim.release(result)
+                if flights:
+                    flights.finish(flight, result)
+        final_result, status = extract_final_results(result, with_status=True) if result else (None, "failed")
+        complete = status == "ok"
+        if final_result and complete:
+            record_analysed(customer_data, rules)
+            if cache is not None:
+                cache.put(customer_data, rules, final_result)
+        s.set(from_cache=False, ok=final_result is not None, complete=complete)
+        yield {"event": "result", "result": final_result, "from_cache": False, "complete": complete}
+
+
+_JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+def extract_streaming_field(text: str, field: str):
+    """
+    從串流中尚未完整的 JSON 文字取出字串欄位目前已收到的內容（如「專家綜合說明」），
+    欄位尚未出現時回傳 None；結尾不完整的跳脫字元會先略過，等下一段文字到達
+    """
+    match = re.search(r'"' + re.escape(field) + r'"\s*:\s*"', text)
+    if not match:
+        return None
+    value = []
+    i = match.end()
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            break
+        if char == "\\":
+            if i + 1 >= len(text):
+                break
+            escape = text[i + 1]
+            if escape == "u":
+                if i + 6 > len(text):
+                    break
+                value.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            value.append(_JSON_ESCAPES.get(escape, escape))
+            i += 2
+            continue
+        value.append(char)
+        i += 1
+    return "".join(value)
+
+
+def _percentile(sorted_values, pct):
+    """
+    以最近秩法（nearest-rank）計算百分位數，sorted_values 需已排序
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _analyze_one(customer_id, customer_data, rules, timeout):
+    """
+    批次模式的單一工作：呼叫 API、解析並儲存結果，回傳 (customer_id, 是否成功, 耗時秒數)
+    """
+    started = time.perf_counter()
+    ok = False
+    with span("batch.analyze", new_trace=True, customer_id=customer_id) as s:
+        result = call_agent_api(customer_data, rules, timeout=timeout)
+        if result:
+            final_result, status = extract_final_results(result, with_status=True)
+            if final_result:
+                save_results(final_result, customer_id, rules=rules, source="agent" if status == "ok" else "repaired")
+                if status == "ok":
+                    record_analysed(customer_data, rules)
+                ok = True
+        s.set(ok=ok)
+    return customer_id, ok, time.perf_counter() - started
+
+
+def run_batch(customers, rules, concurrency=4, timeout=None):
+    """
+    批次分析多位客戶：逐筆取用合併後的客戶資料，以有上限的 worker pool 併發呼叫 AGENT API，
+    每位客戶各自寫入 Results/result_<id>.json
+    Args:
+        customers (iterable): 合併後的客戶資料（可為 customer_stream.iter_customers 的串流）
+        rules (dict): 規則
+        concurrency (int): 同時進行中的 API 呼叫上限
+        timeout (int): 單次呼叫逾時秒數，None 時依近期延遲自動決定
+    Returns:
+        dict: 統計結果（總數、成功、失敗、吞吐量、p50/p95/p99 延遲）
+    """
+    concurrency = max(1, concurrency)
+    latencies = []
+    failed = []
+    total = 0
+
+    def collect(done):
+        for future in done:
+            customer_id, ok, elapsed = future.result()
+            latencies.append(elapsed)
+            if ok:
+                logger.info(f"[{customer_id}] 分析完成，耗時 {elapsed:.2f} 秒")
+            else:
+                logger.warning(f"[{customer_id}] 分析失敗，耗時 {elapsed:.2f} 秒")
+                failed.append(customer_id)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # 只預先送出有限筆工作，串流輸入時記憶體不隨客戶數成長
+        pending = set()
+        for customer_data in customers:
+            total += 1
+            pending.add(executor.submit(_analyze_one, customer_data.get("customer_id"), customer_data, rules, timeout))
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(as_completed(pending))
+    wall_time = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "total": total,
+        "succeeded": total - len(failed),
+        "failed": failed,
+        "wall_time_sec": wall_time,
+        "throughput_per_min": (total / wall_time * 60) if wall_time > 0 else 0.0,
+        "latency_p50_sec": _percentile(latencies, 50),
+        "latency_p95_sec": _percentile(latencies, 95),
+        "latency_p99_sec": _percentile(latencies, 99),
+    }
+
+
+def _read_ids_file(path):
+    """
+    讀取 customer_id 清單檔：一行一個 id，忽略空行與 # 開頭的註解
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+
+def _select_customers(customers, wanted):
+    """
+    從客戶資料流中只取出 wanted 內的 customer_id；取出的 id 會自 wanted 移除，結束後剩下的即為找不到的客戶
+    """
+    for customer_data in customers:
+        customer_id = customer_data.get("customer_id")
+        if customer_id in wanted:
+            wanted.discard(customer_id)
+            yield customer_data
+
+
 if __name__ == "__main__":
 
     # 讀入規則
-    import sys
+    import argparse
+    from metrics import start_exporters
+
+    def _positive_int(value):
+        """argparse 用：轉成正整數，否則回報用法錯誤"""
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            number = 0
+        if number < 1:
+            raise argparse.ArgumentTypeError(f"須為正整數：{value!r}")
+        return number
+
     import config_rules
     rules = None
     for var in dir(config_rules):
@@ -109,80 +433,120 @@ if __name__ == "__main__":
     if rules is None:
         raise ValueError('config_rules.py 未找到任何 dict 規則變數')
 
+    parser = argparse.ArgumentParser(description="智慧承保分析 AGENT API 命令列工具")
+    parser.add_argument("customer_id", nargs="?", help="要查詢的 customer_id（如 C00009）")
+    parser.add_argument("timeout", nargs="?", help="逾時秒數，未指定時依近期延遲自動決定（樣本不足時 60 秒）")
+    parser.add_argument("--all", action="store_true", help="批次分析基本資訊.json 中的所有客戶")
+    parser.add_argument("--ids-file", help="批次分析檔案中列出的 customer_id（一行一個）")
+    # 預設值以字串交給 argparse，由 type 轉換：BATCH_CONCURRENCY 不是正整數時顯示用法錯誤，--help 仍可正常顯示
+    parser.add_argument("--concurrency", type=_positive_int, default=os.getenv("BATCH_CONCURRENCY", "4"),
+                        help="批次模式同時進行的 API 呼叫數，預設 4（可由 BATCH_CONCURRENCY 設定）")
+    parser.add_argument("--stream", action="store_true", help="以串流模式呼叫，即時印出 AI 回覆內容")
+    parser.add_argument("--tpm", type=float, help="部署的每分鐘 token 配額（覆寫 AGENT_TPM），送出前依配額排程")
+    parser.add_argument("--rpm", type=float, help="部署的每分鐘請求配額（覆寫 AGENT_RPM）")
+    args = parser.parse_args()
+    # 依 METRICS_PORT / METRICS_FILE 啟動 Prometheus 指標輸出（未設定時不啟動）
+    start_exporters()
+    # 限流器於第一次呼叫時依環境變數建立
+    if args.tpm:
+        os.environ["AGENT_TPM"] = str(args.tpm)
+    if args.rpm:
+        os.environ["AGENT_RPM"] = str(args.rpm)
+    batch_mode = args.all or bool(args.ids_file)
+
     # 取得 customer_id（命令列參數優先，否則互動輸入）
-    if len(sys.argv) > 1:
-        customer_id = sys.argv[1]
-    else:
+    customer_id = args.customer_id
+    if not batch_mode and not customer_id:
         customer_id = input("請輸入要查詢的 customer_id（如 C00009）：").strip()
 
-    # 取得 timeout（可選，命令列第2參數，否則預設60秒）
-    if len(sys.argv) > 2:
+    # 取得 timeout（可選，命令列第2參數，否則依近期延遲自動決定）
+    timeout = None
+    if args.timeout is not None:
         try:
-            timeout = int(sys.argv[2])
+            timeout = int(args.timeout)
         except ValueError:
-            print("timeout 參數需為整數，將使用預設60秒")
-            timeout = 60
-    else:
-        timeout = 60
+            print("timeout 參數需為整數，將自動決定逾時")
 
-    # 讀取客戶基本資料
-    try:
-        with open("客戶基本資訊/基本資訊.json", "r", encoding="utf-8") as f:
-            basic_info = json.load(f)
-    except Exception as e:
-        logger.error(f"讀取基本資訊失敗：{e}")
-        exit(1)
+    if batch_mode:
+        # 批次模式：串流讀取並合併客戶資料，併發呼叫 API
+        customers = iter_customers()
+        missing = set()
+        if args.ids_file:
+            missing = set(_read_ids_file(args.ids_file))
+            customers = _select_customers(customers, missing)
+        try:
+            summary = run_batch(customers, rules, concurrency=args.concurrency, timeout=timeout)
+        except (OSError, ValueError) as e:
+            logger.error(f"讀取客戶資料失敗：{e}")
+            exit(1)
+        for customer_id in sorted(missing):
+            logger.error(f"找不到 {customer_id} 的基本資料")
+        summary["failed"].extend(sorted(missing))
+        summary["total"] += len(missing)
+        print("="*30)
+        print("【批次分析統計】")
+        print(f"客戶數：{summary['total']}（成功 {summary['succeeded']}，失敗 {len(summary['failed'])}）")
+        print(f"總耗時：{summary['wall_time_sec']:.2f} 秒，併發數：{args.concurrency}")
+        print(f"吞吐量：{summary['throughput_per_min']:.2f} 位客戶/分鐘")
+        if summary["latency_p50_sec"] is not None:
+            print(f"延遲 p50/p95/p99：{summary['latency_p50_sec']:.2f} / "
+                  f"{summary['latency_p95_sec']:.2f} / {summary['latency_p99_sec']:.2f} 秒")
+        throttled = AGENT_THROTTLED.value(mode="sync")
+        waited = AGENT_RATE_LIMIT_WAIT_SECONDS.snapshot(mode="sync")["sum"]
+        if throttled or waited:
+            print(f"限流：上游 429 共 {throttled} 次，等待配額合計 {waited:.1f} 秒")
+        if timeout is None:
+            for row in get_adaptive_timeouts().snapshot():
+                if row["quantile_seconds"] is not None:
+                    print(f"逾時（{row['endpoint']}／{row['product']}）：p{row['quantile'] * 100:g} "
+                          f"{row['quantile_seconds']:.1f} 秒 → {row['timeout']:.1f} 秒（{row['samples']} 筆樣本）")
+        if summary["failed"]:
+            print(f"失敗客戶：{', '.join(summary['failed'])}")
+        exit(0 if not summary["failed"] else 1)
 
-    # 讀取客戶過往紀錄
+    # 依指定 customer_id 查詢（客戶資料庫以主鍵查詢，來源 JSON 有異動時自動重新匯入）
     try:
-        with open("客戶過往紀錄/過往紀錄.json", "r", encoding="utf-8") as f:
-            history_info = json.load(f)
+        customer_base, customer_hist = get_customer_repository().get_parts(customer_id)
     except Exception as e:
-        logger.error(f"讀取過往紀錄失敗：{e}")
+        logger.error(f"讀取客戶資料失敗：{e}")
         exit(1)
 
-    # 依指定 customer_id 查詢
-    customer_base = next((c for c in basic_info if c.get("customer_id") == customer_id), None)
-    customer_hist = next((h for h in history_info if h.get("customer_id") == customer_id), None)
-
     if not customer_base:
         logger.error(f"找不到 {customer_id} 的基本資料")
     # 合併欄位（flat結構）
-    import copy  # 加入 內建 copy 函式庫
-    customer_data = copy.deepcopy(customer_base)
-    if customer_hist:
-        for k, v in customer_hist.items():
-            if k != "customer_id":
-                customer_data[k] = v
-            if k != "customer_id":
-                customer_data[k] = v
-
-    # 呼叫 API 並顯示
-    result = call_agent_api(customer_data, rules, timeout=timeout)
+    customer_data = merge_customer_data(customer_base, customer_hist)
+
+    # 呼叫 API 並顯示（--stream 時邊接收邊印出 AI 回覆）
+    if args.stream:
+        result = None
+        try:
+            for event in stream_agent_api(customer_data, rules, timeout=timeout):
+                if event["event"] == "token":
+                    print(event["chunk"], end="", flush=True)
+                elif event["event"] == "end":
+                    result = event["result"]
+            print()
+        except Exception as e:
+            logger.error(f"API 呼叫失敗：{e}")
+    else:
+        result = call_agent_api(customer_data, rules, timeout=timeout)
     print("="*30)
     print("本次傳送 payload：")
-    input_content = {
-        "customer_info": customer_data,
-        "rules": rules
-    }
-    payload = {
-        "input_value": json.dumps(input_content, ensure_ascii=False),
-        "output_type": "chat",
-        "input_type": "chat",
-        "tweaks": {}
-    }
+    payload = build_agent_payload(customer_data, rules)
     print(json.dumps(payload, ensure_ascii=False, indent=2))
 
     print("="*30)
     if result:
         # Canvas小工具自動解析
-        final_result = extract_final_results(result)
+        final_result, status = extract_final_results(result, with_status=True)
         print("="*30)
         if final_result:
-            print("【自動解析最終擷取結果與分析】")
+            print("【自動解析最終擷取結果與分析】" if status == "ok" else "【回覆被截斷，以下為本機修復的不完整結果】")
             print(json.dumps(final_result, ensure_ascii=False, indent=2))
-            # 儲存結果
-            save_results(final_result, customer_id)
+            # 儲存結果（不完整的結果標記為 repaired，不作為增量重新分析的基準）
+            save_results(final_result, customer_id, rules=rules, source="agent" if status == "ok" else "repaired")
+            if status == "ok":
+                record_analysed(customer_data, rules)
         else:
             print("❌ 解析 API 回傳內容失敗，請檢查結構或日誌")
     else:
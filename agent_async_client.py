@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+
+import httpx
+
+from adaptive_timeout import RUN, STREAM, get_adaptive_timeouts, product_of, resolve_timeout
+from metrics import AGENT_IN_FLIGHT, AGENT_PARSE_RESULTS, AGENT_PAYLOAD_BYTES, AGENT_REQUESTS, AGENT_REQUEST_SECONDS
+from payload_builder import build_agent_payload
+from rate_limiter import estimate_request_tokens, get_rate_limiter, parse_retry_after
+from resilience import CircuitOpenError, get_resilience
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _track_request(mode, payload_bytes):
+    """
+    記錄一次請求的指標（請求數依狀態碼、耗時、payload 大小、進行中請求數）；
+    區塊內將 outcome["status"] 設為 HTTP 狀態碼，逾時記為 timeout，其他例外記為 error
+    """
+    AGENT_PAYLOAD_BYTES.observe(payload_bytes, mode=mode)
+    AGENT_IN_FLIGHT.inc()
+    outcome = {"status": None}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except (asyncio.TimeoutError, TimeoutError):
+        outcome["status"] = "timeout"
+        raise
+    except asyncio.CancelledError:
+        # hedge 的落後請求被取消
+        outcome["status"] = "cancelled"
+        raise
+    except BaseException:
+        if outcome["status"] is None:
+            outcome["status"] = "error"
+        raise
+    finally:
+        AGENT_IN_FLIGHT.dec()
+        AGENT_REQUESTS.inc(mode=mode, status=outcome["status"] or "error")
+        AGENT_REQUEST_SECONDS.observe(time.perf_counter() - started, mode=mode)
+
+
+def _throttle_retries():
+    """收到 429 後依 Retry-After 重送的次數上限（AGENT_THROTTLE_RETRIES，預設 3）"""
+    return int(os.getenv("AGENT_THROTTLE_RETRIES", "3"))
+
+
+class AgentAPIError(Exception):
+    """AGENT API 回傳非 2xx 狀態碼或無法解析的回應"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class AgentClient:
+    """
+    非同步 AGENT API 用戶端：以 httpx.AsyncClient 對 API_URL 維持一組 keep-alive 連線池，
+    可在單一 event loop 上同時進行多筆分析，不需每次重新建立 TCP/TLS 連線。
+    代理伺服器（HTTP(S)_PROXY/NO_PROXY）、重新導向、gzip 與各種 body 長度格式皆由 httpx 處理
+
+    用法：
+        async with AgentClient() as client:
+            result = await client.analyze(customer_data, rules)
+    """
+
+    def __init__(self, api_url=None, api_token=None, max_connections=None):
+        self.api_url = api_url if api_url is not None else os.getenv("API_URL")
+        self.api_token = api_token if api_token is not None else os.getenv("API_TOKEN")
+        if max_connections is None:
+            max_connections = int(os.getenv("AGENT_MAX_CONNECTIONS", "10"))
+        self.max_connections = max(1, max_connections)
+        self._semaphore = None
+        headers = {"Content-Type": "application/json"}
+        if self.api_token:
+            headers["Authorization"] = f"Bearer {self.api_token}"
+        # 逾時由 asyncio.wait_for 控制（逾時秒數依保單類別調整，且排隊等連線的時間不計入），httpx 本身不設逾時
+        self._http = httpx.AsyncClient(
+            headers=headers, timeout=None, follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """關閉連線池"""
+        await self._http.aclose()
+
+    def _slot(self):
+        """同時進行的請求數上限；等待名額的時間不計入逾時"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        return self._semaphore
+
+    async def _post(self, body: bytes):
+        try:
+            response = await self._http.post(self.api_url, content=body, headers={"Accept": "application/json"})
+        except httpx.TransportError as e:
+            # 轉成內建的 ConnectionError，重試與斷路器（resilience）不需認得 httpx 的例外
+            raise ConnectionError(f"{type(e).__name__}: {e}") from e
+        except httpx.HTTPError as e:
+            raise AgentAPIError(f"{type(e).__name__}: {e}") from e
+        return response.status_code, response.headers, response.content
+
+    async def post_json(self, payload: dict, timeout: float = 60, product=None):
+        """
+        送出 JSON payload，回傳 (狀態碼, 已解析的 JSON)；狀態碼 >= 400 時拋出 AgentAPIError
+        product: 保單類別，成功或逾時的耗時計入該類別的延遲直方圖（見 adaptive_timeout）
+        """
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        limiter = get_rate_limiter()
+        tokens = estimate_request_tokens(payload)
+        for attempt in range(_throttle_retries() + 1):
+            # 先等限流額度再占用連線，排隊等待配額時不占連線數
+            await limiter.acquire(tokens, mode="sync")
+            with _track_request("sync", len(body)) as outcome:
+                async with self._slot():
+                    with get_adaptive_timeouts().measure(RUN, product or "unknown") as sample:
+                        status, headers, data = await asyncio.wait_for(self._post(body), timeout=timeout)
+                        sample["ok"] = status < 400
+                outcome["status"] = status
+            if status != 429 or attempt == _throttle_retries():
+                break
+            limiter.throttled(parse_retry_after(headers.get("retry-after"), default=2 ** attempt), mode="sync")
+        logger.info(f"API 回應狀態碼: {status}")
+        text = data.decode("utf-8", errors="replace")
+        logger.debug(f"API 回應內容: {text}")
+        if status >= 400:
+            raise AgentAPIError(f"{status} Error: {text[:200]}", status=status)
+        return status, _decode_body(text)
+
+    async def stream_json(self, payload: dict, timeout: float = 60, product=None):
+        """
+        以 Langflow 串流模式（?stream=true）送出 payload，逐一產出伺服器送來的事件 dict
+        （{"event": ..., "data": ...}）。支援每行一個 JSON 與 SSE「data: ...」兩種格式；
+        伺服器不支援串流而直接回傳完整 JSON 時，產出單一 end 事件。
+        timeout 為整個串流的時間上限，逾時拋出 asyncio.TimeoutError；
+        product 為保單類別，讀完整個串流或逾時的耗時計入該類別的延遲直方圖
+        """
+        loop = asyncio.get_running_loop()
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        limiter = get_rate_limiter()
+        tokens = estimate_request_tokens(payload)
+
+        async def within_deadline(awaitable):
+            return await asyncio.wait_for(awaitable, timeout=max(0.0, deadline - loop.time()))
+
+        for attempt in range(_throttle_retries() + 1):
+            await limiter.acquire(tokens, mode="stream")
+            deadline = loop.time() + timeout
+            with _track_request("stream", len(body)) as outcome, \
+                    get_adaptive_timeouts().measure(STREAM, product or "unknown") as sample:
+                async with self._slot():
+                    request = self._http.build_request(
+                        "POST", self.api_url, params={"stream": "true"}, content=body,
+                        headers={"Accept": "text/event-stream, application/json"})
+                    try:
+                        response = await within_deadline(self._http.send(request, stream=True))
+                    except httpx.TransportError as e:
+                        raise ConnectionError(f"{type(e).__name__}: {e}") from e
+                    try:
+                        status = outcome["status"] = response.status_code
+                        logger.info(f"API 回應狀態碼: {status}（串流）")
+                        if status == 429 and attempt < _throttle_retries():
+                            # 尚未產出任何事件，依 Retry-After 暫停後重送
+                            limiter.throttled(parse_retry_after(response.headers.get("retry-after"), default=2 ** attempt),
+                                              mode="stream")
+                            continue
+                        if status >= 400:
+                            data = await within_deadline(response.aread())
+                            raise AgentAPIError(f"{status} Error: {data.decode('utf-8', errors='replace')[:200]}", status=status)
+
+                        content_type = response.headers.get("content-type", "")
+                        if "text/event-stream" not in content_type and "ndjson" not in content_type:
+                            data = await within_deadline(response.aread())
+                            yield {"event": "end", "data": {"result": _decode_body(data.decode("utf-8"))}}
+                        else:
+                            lines = response.aiter_lines()
+                            while True:
+                                try:
+                                    line = await within_deadline(lines.__anext__())
+                                except StopAsyncIteration:
+                                    break
+                                event = _parse_stream_line(line)
+                                if event is not None:
+                                    yield event
+                        sample["ok"] = True
+                    except httpx.TransportError as e:
+                        raise ConnectionError(f"{type(e).__name__}: {e}") from e
+                    except httpx.HTTPError as e:
+                        raise AgentAPIError(f"{type(e).__name__}: {e}") from e
+                    finally:
+                        # 讀完的連線放回連線池；提前結束或失敗時 httpx 會關閉連線
+                        await response.aclose()
+            return
+
+    async def analyze(self, customer_data: dict, rules: dict, timeout: float = None, slim=None):
+        """
+        傳送客戶資訊與規則，回傳 API 結果或 None（與 call_agent_api 行為一致）
+        timeout: 逾時秒數，未指定時依此保單類別的近期延遲決定（見 adaptive_timeout）
+        slim: 是否只送出對應保單的規則組與引用欄位，預設依 AGENT_SLIM_PAYLOAD
+        """
+        if not self.api_url:
+            logger.error("缺少 API_URL，請確認 .env 檔案設定。")
+            return None
+        payload = build_agent_payload(customer_data, rules, slim=slim)
+        product = product_of(customer_data)
+        timeout = resolve_timeout(timeout, RUN, customer_data)
+        try:
+            # 重試、斷路器與 hedge 由 resilience 處理（見 get_resilience 的環境變數）
+            _, result = await get_resilience().call(lambda: self.post_json(payload, timeout=timeout, product=product))
+            return result
+        except CircuitOpenError as e:
+            logger.error(f"API 呼叫略過：{e}")
+            return None
+        except asyncio.TimeoutError:
+            logger.error(f"API 呼叫失敗：逾時 {timeout} 秒")
+            return None
+        except Exception as e:
+            logger.error(f"API 呼叫失敗：{e}")
+            return None
+
+
+def _decode_body(text):
+    """解析回應 body 的 JSON；無法解析（空白、HTML 錯誤頁、截斷）時記錄為解析失敗並拋出 ValueError"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        AGENT_PARSE_RESULTS.inc(status="invalid_body")
+        raise
+
+
+def _parse_stream_line(line: str):
+    """
+    解析串流回應中的一行：Langflow 每行一個 JSON 事件，SSE 則為「data: {...}」；
+    空行、SSE 註解與 event:/id: 欄位回傳 None
+    """
+    line = line.strip()
+    if not line or line.startswith(":"):
+        return None
+    if line.startswith("data:"):
+        line = line[len("data:"):].strip()
+    elif line.startswith(("event:", "id:", "retry:")):
+        return None
+    if line == "[DONE]":
+        return None
+    try:
+        event = json.loads(line)
+    except ValueError:
+        logger.warning(f"無法解析的串流事件：{line[:200]!r}")
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def _message_envelope(text):
+    """將串流累積的訊息文字包成與非串流回應相同的 outputs 結構"""
+    return {"outputs": [{"outputs": [{"results": {"message": {"text": text}}}]}]}
+
+
+# 每個 event loop 各自持有一個共用 client（連線綁定於建立它的 loop）
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(api_url=None, api_token=None):
+    """
+    取得目前 event loop 的共用 AgentClient；API_URL/API_TOKEN 變更時會重新建立
+    """
+    loop = asyncio.get_running_loop()
+    api_url = api_url if api_url is not None else os.getenv("API_URL")
+    api_token = api_token if api_token is not None else os.getenv("API_TOKEN")
+    client = _loop_clients.get(loop)
+    if client is None or client.api_url != api_url or client.api_token != api_token:
+        if client is not None:
+            loop.create_task(client.close())
+        client = AgentClient(api_url=api_url, api_token=api_token)
+        _loop_clients[loop] = client
+    return client
+
+
+async def async_call_agent_api(customer_data: dict, rules: dict, timeout: float = None):
+    """
+    call_agent_api 的 asyncio 版本，透過共用連線池呼叫 AGENT API，回傳 API 結果或 None
+    """
+    return await get_client().analyze(customer_data, rules, timeout=timeout)
+
+
+async def async_stream_agent_api(customer_data: dict, rules: dict, timeout: float = None):
+    """
+    以串流模式呼叫 AGENT API，逐一產出：
+        {"event": "token", "chunk": 本次新增文字, "text": 目前累積的完整文字}
+        {"event": "end", "result": 與 call_agent_api 相同結構的完整 API 結果}
+    串流未送出 end 事件就結束時，以累積文字組成相同結構的結果
+    """
+    client = get_client()
+    if not client.api_url:
+        raise AgentAPIError("缺少 API_URL，請確認 .env 檔案設定。")
+    text = ""
+    result = None
+    payload = build_agent_payload(customer_data, rules)
+    product = product_of(customer_data)
+    timeout = resolve_timeout(timeout, STREAM, customer_data)
+    # 讀完整個串流（end 之後才結束），連線才能放回連線池
+    async for event in get_resilience().stream(lambda: client.stream_json(payload, timeout=timeout, product=product)):
+        name = event.get("event")
+        data = event.get("data") or {}
+        if name == "token":
+            chunk = data.get("chunk") or ""
+            if chunk:
+                text += chunk
+                yield {"event": "token", "chunk": chunk, "text": text}
+        elif name == "end":
+            result = data.get("result") or _message_envelope(text)
+        elif name == "error":
+            raise AgentAPIError(f"串流回傳錯誤：{data.get('error') or data.get('text') or data}")
+    if result is None:
+        if not text:
+            raise AgentAPIError("串流結束但未收到任何內容")
+        result = _message_envelope(text)
+    yield {"event": "end", "result": result}
+
+
+# --- 同步呼叫用的背景 event loop ---
+
+_background_loop = None
+_background_lock = threading.Lock()
+
+
+def _get_background_loop():
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="agent-api-loop", daemon=True)
+            thread.start()
+            _background_loop = loop
+        return _background_loop
+
+
+def run_sync(coro):
+    """
+    在背景 event loop 上執行 coroutine 並等待結果；同步呼叫端（CLI、Streamlit、thread pool）
+    因此能共用同一組 keep-alive 連線
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop()).result()
+
+
+def iter_sync(async_iterable):
+    """
+    在背景 event loop 上逐一取出 async generator 的項目，讓同步呼叫端（Streamlit、CLI）以一般 for 迴圈使用；
+    提前結束迭代時會關閉 async generator 並釋放連線
+    """
+    loop = _get_background_loop()
+    iterator = async_iterable.__aiter__()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(iterator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            asyncio.run_coroutine_threadsafe(aclose(), loop).result()
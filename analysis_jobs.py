@@ -0,0 +1,186 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from agent_api_client import analyze_customer, analyze_customer_stream, save_results
+from env_flags import env_flag
+from metrics import ANALYSIS_JOBS, ANALYSIS_JOBS_ACTIVE
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class AnalysisJob:
+    """
+    單一客戶的背景分析工作；狀態與進度由 worker thread 更新，頁面只讀取
+    """
+
+    def __init__(self, customer_data, rules, owner=None, label=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.customer_id = customer_data.get("customer_id")
+        self.label = label or customer_data.get("name") or self.customer_id
+        self.owner = owner
+        self.customer_data = customer_data
+        self.rules = rules
+        self.status = QUEUED
+        self.stage = "排隊中"
+        self.received_chars = 0
+        self.partial_text = ""
+        self.result = None
+        self.from_cache = False
+        self.complete = True
+        self.error = None
+        self.trace_id = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def elapsed(self):
+        """已執行秒數（尚未開始為 0）"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobExecutor:
+    """
+    跨 session 共用的背景分析佇列：submit() 立即回傳，以固定數量的 worker 依序執行；
+    同一客戶（同一份規則）已在排隊或執行中時直接回傳該工作，不重複送出
+    """
+
+    def __init__(self, max_workers=None, max_finished=None, timeout=None, stream=None):
+        self.max_workers = max_workers or int(os.getenv("ANALYSIS_JOB_WORKERS", "4"))
+        # 保留的已結束工作數（所有 session 合計），超過時移除最舊的
+        self.max_finished = max_finished or int(os.getenv("ANALYSIS_JOB_HISTORY", "200"))
+        # 未設定 ANALYSIS_JOB_TIMEOUT 時，逾時依近期延遲自動決定（見 adaptive_timeout）
+        self.timeout = timeout or (int(os.getenv("ANALYSIS_JOB_TIMEOUT")) if os.getenv("ANALYSIS_JOB_TIMEOUT") else None)
+        self.stream = stream if stream is not None else env_flag("AGENT_STREAM", True)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="analysis-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, customer_data, rules, owner=None, label=None):
+        """加入一位客戶的分析工作，回傳 AnalysisJob（可能是已在進行中的同一工作）"""
+        with self._lock:
+            for job in self._jobs.values():
+                if not job.finished and job.customer_id == customer_data.get("customer_id") and job.rules is rules:
+                    return job
+            job = AnalysisJob(customer_data, rules, owner=owner, label=label)
+            self._jobs[job.id] = job
+            ANALYSIS_JOBS_ACTIVE.inc(state=QUEUED)
+            job.future = self._executor.submit(self._run, job)
+            self._prune_locked()
+        logger.info(f"[{job.customer_id}] 已加入分析佇列（工作 {job.id}）")
+        return job
+
+    def cancel(self, job_id):
+        """取消尚未開始的工作，回傳是否成功"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED or not job.future.cancel():
+                return False
+            self._finish(job, CANCELLED, QUEUED)
+            job.stage = "已取消"
+            return True
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self, owner=None):
+        """依送出順序回傳工作清單，可只取某個 session 送出的工作"""
+        with self._lock:
+            return [job for job in self._jobs.values() if owner is None or job.owner == owner]
+
+    def counts(self):
+        """各狀態的工作數"""
+        counts = {}
+        for job in self.jobs():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _prune_locked(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _finish(self, job, status, previous):
+        job.status = status
+        job.finished_at = time.time()
+        ANALYSIS_JOBS_ACTIVE.dec(state=previous)
+        ANALYSIS_JOBS.inc(status=status)
+
+    def _run(self, job):
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+            ANALYSIS_JOBS_ACTIVE.dec(state=QUEUED)
+            ANALYSIS_JOBS_ACTIVE.inc(state=RUNNING)
+        status = FAILED
+        try:
+            with span("job.analyze", new_trace=True, customer_id=job.customer_id, job_id=job.id,
+                      queued_ms=round((job.started_at - job.submitted_at) * 1000, 1)) as job_span:
+                job.trace_id = job_span.trace_id
+                job.stage = "AI 分析中"
+                if self.stream:
+                    for event in analyze_customer_stream(job.customer_data, job.rules, timeout=self.timeout):
+                        if event["event"] == "token":
+                            job.received_chars = len(event["text"])
+                            job.partial_text = event["text"]
+                        elif event["event"] == "result":
+                            job.result, job.from_cache, job.complete = event["result"], event["from_cache"], event["complete"]
+                else:
+                    job.result, job.from_cache, job.complete = analyze_customer(job.customer_data, job.rules,
+                                                                                timeout=self.timeout)
+                if job.result:
+                    job.stage = "儲存結果"
+                    save_results(job.result, job.customer_id, rules=job.rules,
+                                 source="cache" if job.from_cache else "agent" if job.complete else "repaired")
+                    status = DONE
+                    job.stage = ("完成（沿用快取）" if job.from_cache else "完成" if job.complete
+                                 else "完成（回覆被截斷，結果不完整）")
+                else:
+                    job.error = "API 呼叫失敗或回傳內容解析失敗"
+                    job.stage = "失敗"
+                job_span.set(ok=status == DONE, from_cache=job.from_cache)
+        except Exception as e:
+            logger.exception(f"[{job.customer_id}] 背景分析發生錯誤")
+            job.error = f"{type(e).__name__}: {e}"
+            job.stage = "失敗"
+        finally:
+            # 釋放不再需要的資料，工作紀錄只保留結果
+            job.customer_data = None
+            job.partial_text = ""
+            with self._lock:
+                self._finish(job, status, RUNNING)
+        logger.info(f"[{job.customer_id}] 背景分析{'完成' if status == DONE else '失敗'}，耗時 {job.elapsed():.2f} 秒")
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    """取得程序內共用的 JobExecutor（worker 數由 ANALYSIS_JOB_WORKERS 設定，預設 4）"""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = JobExecutor()
+        return _default_executor
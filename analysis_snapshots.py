@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from payload_builder import select_rule_group
+from result_cache import canonical_json, rules_fingerprint
+from results_store import RESULTS_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(RESULTS_DIR, "analysis_snapshots.sqlite3")
+
+
+def group_fingerprint(customer_data: dict, rules: dict):
+    """客戶保單類別對應規則組的指紋；其他保單類別的規則變動不影響此客戶。找不到規則組時以整份規則計算"""
+    group_name, rule_group = select_rule_group(customer_data, rules)
+    return rules_fingerprint({group_name: rule_group} if rule_group is not None else rules)
+
+
+class AnalysisSnapshots:
+    """
+    每位客戶最近一次成功分析時的客戶資料（合併後）與規則組指紋，
+    供增量重新分析比對「上次分析之後改了哪些欄位」。以 SQLite（WAL 模式）持久化，每位客戶一列
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("ANALYSIS_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " customer_id TEXT PRIMARY KEY,"
+                " analysed_at REAL NOT NULL,"
+                " product TEXT,"
+                " rules_fingerprint TEXT,"
+                " data TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row(row):
+        customer_id, analysed_at, product, fingerprint, data = row
+        return {"customer_id": customer_id, "analysed_at": analysed_at, "product": product,
+                "rules_fingerprint": fingerprint, "data": json.loads(data)}
+
+    def record(self, customer_data: dict, rules: dict, analysed_at=None):
+        """記錄（覆蓋）某客戶本次分析所用的資料與規則組指紋"""
+        customer_id = customer_data.get("customer_id")
+        if not customer_id:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (customer_id, analysed_at, product, rules_fingerprint, data)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (customer_id, analysed_at if analysed_at is not None else time.time(),
+                 customer_data.get("希望購買保單"), group_fingerprint(customer_data, rules), canonical_json(customer_data))
+            )
+
+    def get(self, customer_id):
+        """取得某客戶上次分析的快照，沒有則回傳 None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT customer_id, analysed_at, product, rules_fingerprint, data"
+                               " FROM snapshots WHERE customer_id = ?", (customer_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def all(self):
+        """一次讀出所有快照 {customer_id: 快照}"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT customer_id, analysed_at, product, rules_fingerprint, data FROM snapshots").fetchall()
+        return {row[0]: self._row(row) for row in rows}
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+
+
+_default_snapshots = None
+_default_snapshots_lock = threading.Lock()
+
+
+def get_analysis_snapshots():
+    """取得程序內共用的 AnalysisSnapshots（路徑可由 ANALYSIS_SNAPSHOT_PATH 設定）"""
+    global _default_snapshots
+    with _default_snapshots_lock:
+        if _default_snapshots is None:
+            _default_snapshots = AnalysisSnapshots()
+        return _default_snapshots
+
+
+def record_analysed(customer_data: dict, rules: dict):
+    """分析成功後記錄快照；失敗只記錄警告，不影響分析結果"""
+    try:
+        get_analysis_snapshots().record(customer_data, rules)
+    except Exception as e:
+        logger.warning(f"記錄分析快照失敗（{customer_data.get('customer_id')}）：{e}")
@@ -0,0 +1,129 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from response_parser import parse_agent_response  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "response_corpus.jsonl")
+
+
+def _envelope(text):
+    return {"session_id": "corpus", "outputs": [{"inputs": {"input_value": ""},
+                                                 "outputs": [{"results": {"message": {"text": text}}}]}]}
+
+
+def build_corpus(results_dir=os.path.join(BASE_DIR, "Results")):
+    """
+    由 Results/result_*.json 的實際分析結果產生各種回覆格式的測試樣本
+    Returns:
+        list: [{"name", "expect", "total_score", "response"}, ...]
+    """
+    with open(os.path.join(results_dir, "result_C00009.json"), "r", encoding="utf-8") as f:
+        result_a = json.load(f)
+    with open(os.path.join(results_dir, "result_C00013.json"), "r", encoding="utf-8") as f:
+        result_b = json.load(f)
+    pretty = json.dumps(result_a, ensure_ascii=False, indent=2)
+    # LLM 常在字串中直接輸出換行（非 \n 跳脫）
+    multiline = dict(result_a, 專家綜合說明="綜合評估如下：\n" + result_a.get("專家綜合說明", ""))
+    raw_newlines = json.dumps(multiline, ensure_ascii=False, indent=2).replace("\\n", "\n")
+    compact = json.dumps(result_b, ensure_ascii=False)
+    narrative_at = pretty.index("專家綜合說明")
+    score_table_at = pretty.index('"分數"', pretty.index("score_table"))
+
+    cases = [
+        ("fenced_json", "ok", result_a, _envelope(f"```json\n{pretty}\n```")),
+        ("fenced_no_language", "ok", result_a, _envelope(f"```\n{pretty}\n```")),
+        ("unfenced", "ok", result_b, _envelope(compact)),
+        ("prose_before_and_after", "ok", result_a,
+         _envelope(f"以下為本次核保評分結果：\n```json\n{pretty}\n```\n如需進一步說明請告知。")),
+        ("multiple_blocks_example_first", "ok", result_a,
+         _envelope('評分項目格式範例：\n```json\n{"項目": "age", "分數": 5}\n```\n實際結果：\n```json\n' + pretty + "\n```")),
+        ("trailing_prose_with_braces", "ok", result_b, _envelope(f"{compact}\n\n備註：{{分數}} 依規則計算。")),
+        ("raw_newlines_in_strings", "ok", result_a,
+         _envelope("```json\n" + raw_newlines + "\n```")),
+        ("crlf_line_endings", "ok", result_a, _envelope(f"```json\r\n{pretty}\r\n```".replace("\n", "\r\n"))),
+        ("double_encoded_text", "ok", result_b, _envelope(json.dumps(compact, ensure_ascii=False))),
+        ("message_data_text_envelope", "ok", result_a,
+         {"outputs": [{"outputs": [{"results": {"message": {"data": {"text": f"```json\n{pretty}\n```"}}}}]}]}),
+        ("truncated_in_narrative", "repaired", result_a, _envelope("```json\n" + pretty[:narrative_at + 60])),
+        ("truncated_in_score_table", "failed", None, _envelope("```json\n" + pretty[:score_table_at + 3])),
+        ("no_json", "failed", None, _envelope("抱歉，目前無法完成評分，請稍後再試。")),
+        ("example_only", "failed", None, _envelope('格式範例：{"項目": "age", "分數": 5}')),
+        ("error_body", "failed", None, _envelope('{"error": "rate limited"}')),
+    ]
+    return [{"name": name, "expect": expect, "total_score": result.get("total_score") if result else None,
+             "response": response} for name, expect, result, response in cases]
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def legacy_extract(api_response):
+    """原本的 extract_final_results：固定路徑 + regex + json.loads（兩次）"""
+    try:
+        text = api_response["outputs"][0]["outputs"][0]["results"]["message"]["text"]
+        match = re.search(r"```json\s*([\s\S]*?)\s*```", text)
+        json_text = match.group(1) if match else text
+        result = json.loads(json_text)
+        result = json.loads(json_text)
+        return result
+    except Exception:
+        return None
+
+
+def _throughput(parse, response, seconds):
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(20):
+            parse(response)
+        count += 20
+    return count / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="extract_final_results 解析正確性與吞吐量量測")
+    parser.add_argument("--regenerate", action="store_true", help="由 Results/*.json 重新產生 response_corpus.jsonl")
+    parser.add_argument("--seconds", type=float, default=0.3, help="每個樣本的量測秒數，預設 0.3")
+    parser.add_argument("--json", help="將量測結果寫入此 JSON 檔")
+    args = parser.parse_args()
+
+    if args.regenerate or not os.path.exists(CORPUS_PATH):
+        with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+            for case in build_corpus():
+                f.write(json.dumps(case, ensure_ascii=False) + "\n")
+        print(f"已產生 {CORPUS_PATH}")
+
+    rows = []
+    failures = 0
+    print(f"{'樣本':<32}{'預期':<10}{'結果':<10}{'舊版':<6}{'新版 parses/s':>16}{'舊版 parses/s':>16}")
+    for case in load_corpus():
+        result, status, _ = parse_agent_response(case["response"])
+        got = status if status in ("repaired", "failed") else "ok"
+        correct = got == case["expect"] and (result or {}).get("total_score") == case["total_score"]
+        failures += not correct
+        legacy_result = legacy_extract(case["response"])
+        legacy_ok = (case["expect"] != "failed" and isinstance(legacy_result, dict)
+                     and legacy_result.get("total_score") == case["total_score"])
+        new_rate = _throughput(parse_agent_response, case["response"], args.seconds)
+        legacy_rate = _throughput(legacy_extract, case["response"], args.seconds)
+        rows.append({"name": case["name"], "expect": case["expect"], "status": status, "correct": correct,
+                     "legacy_ok": legacy_ok, "parses_per_sec": new_rate, "legacy_parses_per_sec": legacy_rate})
+        print(f"{case['name']:<32}{case['expect']:<10}{got + ('' if correct else ' ✗'):<10}"
+              f"{'✓' if legacy_ok else '✗':<6}{new_rate:>16,.0f}{legacy_rate:>16,.0f}")
+
+    recovered = sum(1 for row in rows if row["expect"] != "failed" and not row["legacy_ok"])
+    print(f"\n正確 {len(rows) - failures}/{len(rows)}；舊版解析失敗或取錯物件、新版可正確解析的樣本：{recovered} 個")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "parser", "cases": rows}, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from itertools import islice
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import config_rules  # noqa: E402
+from customer_stream import BASIC_INFO_PATH, HISTORY_PATH, iter_json_array, merge_join  # noqa: E402
+from payload_builder import build_agent_payload  # noqa: E402
+from report_html import build_score_table_html  # noqa: E402
+from rule_compiler import RuleIndex  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_pipeline.json")
+STAGES = ("load", "merge", "payload", "http", "parse", "save", "html")
+BATCH_SIZE = 10000
+
+
+def write_synthetic_files(directory, size):
+    """
+    將既有客戶資料重複填充為 size 筆，依 customer_id 排序逐筆寫出（不在記憶體中建立整份清單）
+    Returns:
+        tuple: (基本資訊檔路徑, 過往紀錄檔路徑)
+    """
+    with open(BASIC_INFO_PATH, "r", encoding="utf-8") as f:
+        basic_info = json.load(f)
+    with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+        history_by_id = {h.get("customer_id"): h for h in json.load(f)}
+    basic_path = os.path.join(directory, f"basic_{size}.json")
+    history_path = os.path.join(directory, f"history_{size}.json")
+    with open(basic_path, "w", encoding="utf-8") as basic_file, open(history_path, "w", encoding="utf-8") as history_file:
+        basic_file.write("[\n")
+        history_file.write("[\n")
+        for i in range(size):
+            template = basic_info[i % len(basic_info)]
+            customer_id = f"S{i:08d}"
+            separator = ",\n" if i else ""
+            basic_file.write(separator + json.dumps(dict(template, customer_id=customer_id), ensure_ascii=False))
+            # 每位客戶都寫一筆過往紀錄（沒有時只含 customer_id），兩檔筆數與順序一一對應
+            history = history_by_id.get(template.get("customer_id")) or {}
+            history_file.write(separator + json.dumps(dict(history, customer_id=customer_id), ensure_ascii=False))
+        basic_file.write("\n]\n")
+        history_file.write("\n]\n")
+    return basic_path, history_path
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _stage(ops, seconds, latencies=None, **extra):
+    stage = {"ops": ops, "seconds": round(seconds, 6), "ops_per_sec": round(ops / seconds, 2) if seconds else None}
+    if latencies:
+        latencies = sorted(latencies)
+        stage.update({f"p{int(q * 100)}_ms": round(_percentile(latencies, q) * 1000, 3) for q in (0.5, 0.95, 0.99)})
+    stage.update(extra)
+    return stage
+
+
+def _repeat(fn, items, min_seconds):
+    """對 items 逐一呼叫 fn，至少完整跑一輪且累計超過 min_seconds；回傳 (呼叫次數, 秒數)"""
+    count = 0
+    started = time.perf_counter()
+    while True:
+        for item in items:
+            fn(item)
+        count += len(items)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds or not items:
+            return count, elapsed
+
+
+def bench_portfolio(basic_path, history_path, size, sample_size):
+    """
+    load / merge：串流讀取並合併整份合成資料（分批計時，兩個階段分開累計）；
+    同時每隔固定間隔抽樣客戶，供後續逐筆階段使用
+    """
+    basic_iter = iter_json_array(basic_path)
+    history_iter = iter_json_array(history_path)
+    load_seconds = merge_seconds = 0.0
+    loaded = merged = 0
+    step = max(1, size // sample_size)
+    sample = []
+    while True:
+        started = time.perf_counter()
+        basic_batch = list(islice(basic_iter, BATCH_SIZE))
+        # 合成資料的兩檔 customer_id 一一對應，過往紀錄取同樣筆數即為同一批客戶
+        history_batch = list(islice(history_iter, len(basic_batch)))
+        load_seconds += time.perf_counter() - started
+        if not basic_batch:
+            break
+        loaded += len(basic_batch) + len(history_batch)
+
+        started = time.perf_counter()
+        customers = list(merge_join(basic_batch, history_batch))
+        merge_seconds += time.perf_counter() - started
+        for customer in customers[(-merged) % step::step]:
+            if len(sample) < sample_size:
+                sample.append(customer)
+        merged += len(customers)
+    return {"load": _stage(loaded, load_seconds), "merge": _stage(merged, merge_seconds)}, sample
+
+
+def bench_calls(sample, calls, min_seconds, rules):
+    """
+    payload / http / parse / save / html：以抽樣客戶逐筆量測（成本與資料總筆數無關）
+    """
+    from agent_api_client import call_agent_api, extract_final_results, save_results
+
+    # agent_api_client 匯入時設定 INFO 日誌，每次呼叫/儲存都會輸出；量測時只保留警告以上
+    logging.getLogger().setLevel(logging.WARNING)
+    stages = {}
+    payload_sizes = []
+
+    def serialise(customer):
+        payload_sizes.append(len(json.dumps(build_agent_payload(customer, rules), ensure_ascii=False).encode("utf-8")))
+
+    ops, seconds = _repeat(serialise, sample, min_seconds)
+    stages["payload"] = _stage(ops, seconds, avg_bytes=round(sum(payload_sizes) / len(payload_sizes)))
+
+    targets = sample[:calls]
+    responses, latencies = [], []
+    started = time.perf_counter()
+    for customer in targets:
+        call_started = time.perf_counter()
+        responses.append(call_agent_api(customer, rules))
+        latencies.append(time.perf_counter() - call_started)
+    errors = sum(response is None for response in responses)
+    stages["http"] = _stage(len(targets), time.perf_counter() - started, latencies, errors=errors)
+
+    responses = [response for response in responses if response is not None]
+    ops, seconds = _repeat(extract_final_results, responses, min_seconds)
+    stages["parse"] = _stage(ops, seconds)
+
+    results = [(customer["customer_id"], extract_final_results(response)) for customer, response in zip(targets, responses)]
+    results = [(customer_id, result) for customer_id, result in results if result]
+    latencies = []
+    started = time.perf_counter()
+    for customer_id, result in results:
+        call_started = time.perf_counter()
+        save_results(result, customer_id, rules=rules, background=False)
+        latencies.append(time.perf_counter() - call_started)
+    stages["save"] = _stage(len(results), time.perf_counter() - started, latencies)
+
+    rule_index = RuleIndex(rules)
+    ops, seconds = _repeat(lambda result: build_score_table_html(result, rule_index), [r for _, r in results], min_seconds)
+    stages["html"] = _stage(ops, seconds)
+    return stages
+
+
+def compare(report, baseline, threshold):
+    """
+    依 (客戶筆數, 階段) 比對 ops_per_sec，低於基準 (1 - threshold) 倍視為退化
+    Returns:
+        list: [{"customers", "stage", "baseline", "current", "ratio", "regression"}, ...]
+    """
+    baseline_runs = {run["customers"]: run["stages"] for run in baseline.get("runs", [])}
+    rows = []
+    for run in report["runs"]:
+        for stage, current in run["stages"].items():
+            reference = baseline_runs.get(run["customers"], {}).get(stage)
+            if not reference or not reference.get("ops_per_sec") or not current.get("ops_per_sec"):
+                continue
+            ratio = current["ops_per_sec"] / reference["ops_per_sec"]
+            rows.append({"customers": run["customers"], "stage": stage, "baseline": reference["ops_per_sec"],
+                         "current": current["ops_per_sec"], "ratio": round(ratio, 3), "regression": ratio < 1 - threshold})
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分析流程各階段效能量測（合成客戶資料 + 本機 mock Langflow）")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 100000, 1000000],
+                        help="合成資料筆數，預設 1000 100000 1000000")
+    parser.add_argument("--sample", type=int, default=1000, help="payload/parse/html 階段的抽樣客戶數，預設 1000")
+    parser.add_argument("--calls", type=int, default=200, help="http/save 階段的呼叫次數，預設 200")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="CPU 階段的最短量測秒數，預設 0.5")
+    parser.add_argument("--latency", default="0", help="mock server 延遲分佈（見 mock_langflow_server.parse_latency），預設 0")
+    parser.add_argument("--json", help="將量測結果寫入此 JSON 檔")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help=f"比對的基準檔，預設 {BASELINE_PATH}")
+    parser.add_argument("--save-baseline", action="store_true", help="以本次結果覆寫基準檔")
+    parser.add_argument("--threshold", type=float, default=0.25, help="吞吐量低於基準多少比例視為退化，預設 0.25")
+    args = parser.parse_args()
+
+    from mock_langflow_server import start_in_thread
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 結果檔、結果庫與 trace 檔寫入暫存資料夾，不影響 Results/
+        os.environ["RESULTS_DIR"] = os.path.join(tmp_dir, "Results")
+        os.environ["RESULTS_DB_PATH"] = os.path.join(tmp_dir, "Results", "results.sqlite3")
+        os.environ["TRACE_PATH"] = os.path.join(tmp_dir, "Results", "traces.jsonl")
+        server, url = start_in_thread(latency=args.latency)
+        os.environ["API_URL"] = url
+        os.environ.pop("API_TOKEN", None)
+
+        report = {"benchmark": "pipeline", "created_at": datetime.now().isoformat(timespec="seconds"),
+                  "python": platform.python_version(), "platform": platform.platform(),
+                  "options": {"sample": args.sample, "calls": args.calls, "latency": args.latency}, "runs": []}
+        try:
+            for size in args.sizes:
+                started = time.perf_counter()
+                basic_path, history_path = write_synthetic_files(tmp_dir, size)
+                generated = time.perf_counter() - started
+                stages, sample = bench_portfolio(basic_path, history_path, size, args.sample)
+                os.remove(basic_path)
+                os.remove(history_path)
+                stages.update(bench_calls(sample, args.calls, args.min_seconds, config_rules.config_rules))
+                report["runs"].append({"customers": size, "generate_seconds": round(generated, 3), "stages": stages})
+
+                print(f"\n{size:,} 位客戶（產生合成資料 {generated:.1f} 秒）")
+                print(f"{'階段':<10}{'次數':>10}{'秒數':>10}{'ops/sec':>14}{'p50 ms':>10}{'p95 ms':>10}")
+                for name in STAGES:
+                    stage = stages[name]
+                    p50, p95 = stage.get("p50_ms"), stage.get("p95_ms")
+                    print(f"{name:<10}{stage['ops']:>10,}{stage['seconds']:>10.3f}{stage['ops_per_sec'] or 0:>14,.0f}"
+                          f"{'' if p50 is None else f'{p50:.2f}':>10}{'' if p95 is None else f'{p95:.2f}':>10}")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    regressions = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        report["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "stages": rows}
+        regressions = sum(row["regression"] for row in rows)
+        print(f"\n與基準比對（{baseline.get('created_at')}，{baseline.get('platform')}）：")
+        for row in rows:
+            print(f"  {row['customers']:>9,} {row['stage']:<8}{row['ratio']:>7.2f}x{'  ✗ 退化' if row['regression'] else ''}")
+        print(f"退化 {regressions}/{len(rows)} 項（門檻 {args.threshold:.0%}）")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n已寫入基準檔 {args.baseline}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from customer_store import BASIC_INFO_PATH, HISTORY_PATH
+from metrics import CUSTOMER_DATA_CHANGES, CUSTOMER_DATA_CHECKS, CUSTOMER_DATA_LOAD_SECONDS, CUSTOMER_DATA_RECORDS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+def _file_signature(path):
+    """以 (inode, mtime_ns, size) 判斷檔案是否異動；原子替換（rename）會改變 inode"""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class JsonArrayFile:
+    """
+    單一 JSON 陣列檔的快取：mtime/size 未變時直接回傳上次解析的結果；
+    異動時重新解析並依 key 逐筆比對，內容未變的元素沿用原本的物件，只有新增/修改的元素是新物件
+    """
+
+    def __init__(self, path, key, label=None):
+        self.path = path
+        self.key = key
+        self.label = label or os.path.basename(path)
+        self.records = []
+        self.by_key = {}
+        self.signature = None
+        self.version = 0
+        self.load_ms = None
+        self.loaded_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        檢查檔案是否異動，必要時重新載入；回傳是否有重新載入。
+        讀取或解析失敗時記錄錯誤並保留上一次成功載入的內容
+        """
+        with self._lock:
+            try:
+                signature = _file_signature(self.path)
+            except OSError as e:
+                return self._fail(f"找不到客戶資料檔 {self.path}：{e}")
+            if signature == self.signature:
+                CUSTOMER_DATA_CHECKS.inc(file=self.label, result="hit")
+                return False
+
+            with span("data.load", file=self.label) as load_span:
+                started = time.perf_counter()
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        records = json.load(f)
+                except (OSError, ValueError) as e:
+                    load_span.set(ok=False)
+                    return self._fail(f"讀取客戶資料檔 {self.path} 失敗：{e}")
+                if not isinstance(records, list):
+                    load_span.set(ok=False)
+                    return self._fail(f"客戶資料檔 {self.path} 不是 JSON 陣列")
+                added, changed = self._merge(records)
+                removed = max(0, len(self.by_key) - (len(records) - added))
+                elapsed = time.perf_counter() - started
+                load_span.set(ok=True, records=len(records), added=added, changed=changed, removed=removed)
+
+            self.records = records
+            self.by_key = {record.get(self.key): record for record in records
+                           if isinstance(record, dict) and record.get(self.key)}
+            # 解析期間檔案又被改寫時，記錄讀取前的簽章，下次檢查會再載入一次
+            self.signature = signature
+            self.version += 1
+            self.load_ms = elapsed * 1000
+            self.loaded_at = time.time()
+            self.last_error = None
+            CUSTOMER_DATA_CHECKS.inc(file=self.label, result="reload")
+            CUSTOMER_DATA_LOAD_SECONDS.observe(elapsed, file=self.label)
+            CUSTOMER_DATA_RECORDS.set(len(records), file=self.label)
+            for change, count in (("added", added), ("changed", changed), ("removed", removed)):
+                if count:
+                    CUSTOMER_DATA_CHANGES.inc(count, file=self.label, change=change)
+            logger.info(f"已載入 {self.label}：{len(records)} 筆（新增 {added}、修改 {changed}、移除 {removed}），"
+                        f"耗時 {self.load_ms:.1f} ms")
+            return True
+
+    def _merge(self, records):
+        """將未變動的元素換回舊物件（就地修改 records），回傳 (新增數, 修改數)"""
+        added = changed = 0
+        for i, record in enumerate(records):
+            previous = self.by_key.get(record.get(self.key)) if isinstance(record, dict) else None
+            if previous is None:
+                added += 1
+            elif previous == record:
+                records[i] = previous
+            else:
+                changed += 1
+        return added, changed
+
+    def _fail(self, message):
+        self.last_error = message
+        CUSTOMER_DATA_CHECKS.inc(file=self.label, result="error")
+        logger.error(message)
+        return False
+
+    def stats(self):
+        return {"file": self.label, "path": self.path, "records": len(self.records), "version": self.version,
+                "load_ms": self.load_ms, "loaded_at": self.loaded_at, "error": self.last_error}
+
+
+class CustomerData:
+    """
+    客戶基本資訊與過往紀錄的共用快取（程序內所有 session 共用同一份，資料請勿就地修改）。
+    每次 snapshot() 只需 stat 兩個檔案；有檔案異動時才重新解析該檔並重建查詢表。
+    兩個頁面都需要完整的客戶姓名清單，故使用此快取；只查單一客戶的 CLI 與批次工作使用 customer_store.CustomerRepository
+    """
+
+    def __init__(self, basic_info_path=BASIC_INFO_PATH, history_path=HISTORY_PATH):
+        self.basic_info = JsonArrayFile(basic_info_path, "customer_id", label="basic_info")
+        self.history = JsonArrayFile(history_path, "customer_id", label="history")
+        self._lock = threading.Lock()
+        self._versions = None
+        self._snapshot = ([], {}, {})
+
+    def snapshot(self):
+        """
+        Returns:
+            tuple: (客戶清單, 姓名 -> 基本資訊, customer_id -> 過往紀錄)
+        """
+        with self._lock:
+            self.basic_info.refresh()
+            self.history.refresh()
+            versions = (self.basic_info.version, self.history.version)
+            if versions != self._versions:
+                customers = self.basic_info.records
+                customer_dict = {c.get("name"): c for c in customers if isinstance(c, dict) and c.get("name")}
+                self._snapshot = (customers, customer_dict, self.history.by_key)
+                self._versions = versions
+            return self._snapshot
+
+    @property
+    def last_error(self):
+        return self.basic_info.last_error or self.history.last_error
+
+    def stats(self):
+        """各檔案的筆數、版本、上次載入耗時與錯誤"""
+        return [self.basic_info.stats(), self.history.stats()]
+
+
+_default_customer_data = None
+_default_customer_data_lock = threading.Lock()
+
+
+def get_customer_data():
+    """取得程序內共用的 CustomerData"""
+    global _default_customer_data
+    with _default_customer_data_lock:
+        if _default_customer_data is None:
+            _default_customer_data = CustomerData()
+        return _default_customer_data
+
+
+def load_customer_data():
+    """
+    取得目前的客戶資料（檔案有異動時自動重新載入）
+    Returns:
+        tuple: (客戶清單, 姓名 -> 基本資訊, customer_id -> 過往紀錄)
+    """
+    return get_customer_data().snapshot()
+
+
+if __name__ == "__main__":
+    # 量測首次載入與之後每次檢查（未異動）的耗時
+    data = CustomerData()
+    started = time.perf_counter()
+    customers, customer_dict, id_to_record = data.snapshot()
+    cold_ms = (time.perf_counter() - started) * 1000
+    n = 10000
+    started = time.perf_counter()
+    for _ in range(n):
+        data.snapshot()
+    warm_us = (time.perf_counter() - started) / n * 1e6
+    for stats in data.stats():
+        print(f"{stats['file']:<12}{stats['records']:>8} 筆  版本 {stats['version']}  解析 {stats['load_ms']:.2f} ms")
+    print(f"首次載入 {cold_ms:.2f} ms，之後每次檢查 {warm_us:.1f} µs（{len(customers)} 位客戶，{len(id_to_record)} 筆過往紀錄）")
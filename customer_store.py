@@ -0,0 +1,202 @@
+import os
+import copy
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASIC_INFO_PATH = os.path.join(BASE_DIR, "客戶基本資訊/基本資訊.json")
+HISTORY_PATH = os.path.join(BASE_DIR, "客戶過往紀錄/過往紀錄.json")
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, "customers.sqlite3")
+
+
+def merge_customer_data(customer_base, customer_hist):
+    """
+    合併客戶基本資料與過往紀錄（flat 結構），回傳新的 dict，不修改原始資料
+    """
+    customer_data = copy.deepcopy(customer_base) if customer_base else {}
+    if customer_hist:
+        for k, v in customer_hist.items():
+            if k != "customer_id":
+                customer_data[k] = v
+    return customer_data
+
+
+class CustomerRepository:
+    """
+    客戶資料庫：以 SQLite 儲存基本資訊與過往紀錄，customer_id 為主鍵、name 建索引，
+    查詢單一客戶只需讀取一列，不必解析整份 JSON。
+
+    用法：
+        repo = CustomerRepository()
+        repo.import_json()                 # 由 基本資訊.json / 過往紀錄.json 匯入
+        customer = repo.get("C00009")      # 合併後的客戶資料
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("CUSTOMER_DB_PATH", DEFAULT_DB_PATH)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS customers ("
+                " customer_id TEXT PRIMARY KEY,"
+                " name TEXT,"
+                " product TEXT,"
+                " basic TEXT,"
+                " history TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # --- 匯入 ---
+
+    def import_records(self, basic_info, history_info, replace_all=False):
+        """
+        批次匯入客戶資料（單一交易），回傳匯入的客戶數；同一 customer_id 會被覆蓋
+        Args:
+            basic_info (iterable): 基本資訊 dict
+            history_info (iterable): 過往紀錄 dict
+            replace_all (bool): 是否先清空既有資料（與匯入在同一交易內，讀取端不會看到空表）
+        """
+        rows = {}
+        for customer in basic_info:
+            customer_id = customer.get("customer_id")
+            if customer_id:
+                rows[customer_id] = [customer.get("name"), customer.get("希望購買保單"),
+                                     json.dumps(customer, ensure_ascii=False), None]
+        for record in history_info:
+            customer_id = record.get("customer_id")
+            if customer_id:
+                rows.setdefault(customer_id, [None, None, None, None])[3] = json.dumps(record, ensure_ascii=False)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if replace_all:
+                conn.execute("DELETE FROM customers")
+            conn.executemany(
+                "INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?)",
+                ((customer_id, *row) for customer_id, row in rows.items())
+            )
+            conn.execute("COMMIT")
+        return len(rows)
+
+    def import_json(self, basic_info_path=BASIC_INFO_PATH, history_path=HISTORY_PATH):
+        """
+        由 基本資訊.json 與 過往紀錄.json 全量重建資料庫，並記錄來源檔案的 mtime/size
+        """
+        with open(basic_info_path, "r", encoding="utf-8") as f:
+            basic_info = json.load(f)
+        with open(history_path, "r", encoding="utf-8") as f:
+            history_info = json.load(f)
+        count = self.import_records(basic_info, history_info, replace_all=True)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('source_signature', ?)",
+                         (self._source_signature(basic_info_path, history_path),))
+        logger.info(f"已匯入 {count} 位客戶至 {self.path}")
+        return count
+
+    @staticmethod
+    def _source_signature(*paths):
+        parts = []
+        for path in paths:
+            stat = os.stat(path)
+            parts.append(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}")
+        return "|".join(parts)
+
+    def refresh_if_stale(self, basic_info_path=BASIC_INFO_PATH, history_path=HISTORY_PATH):
+        """
+        來源 JSON 的 mtime/size 與上次匯入不同時重新匯入，回傳是否有重新匯入
+        """
+        signature = self._source_signature(basic_info_path, history_path)
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'source_signature'").fetchone()
+        if row and row[0] == signature:
+            return False
+        self.import_json(basic_info_path, history_path)
+        return True
+
+    # --- 查詢 ---
+
+    def _fetch(self, where, params):
+        with self._connect() as conn:
+            return conn.execute(f"SELECT basic, history FROM customers WHERE {where} LIMIT 1", params).fetchone()
+
+    @staticmethod
+    def _decode(row, merged=True):
+        if row is None:
+            return None
+        basic = json.loads(row[0]) if row[0] else None
+        history = json.loads(row[1]) if row[1] else None
+        if not merged:
+            return basic, history
+        if basic is None:
+            return None
+        return merge_customer_data(basic, history)
+
+    def get(self, customer_id):
+        """依 customer_id 取得合併後的客戶資料，找不到回傳 None"""
+        return self._decode(self._fetch("customer_id = ?", (customer_id,)))
+
+    def get_by_name(self, name):
+        """依姓名取得合併後的客戶資料（同名時取第一筆），找不到回傳 None"""
+        return self._decode(self._fetch("name = ?", (name,)))
+
+    def get_parts(self, customer_id):
+        """依 customer_id 取得 (基本資訊, 過往紀錄)，找不到回傳 (None, None)"""
+        return self._decode(self._fetch("customer_id = ?", (customer_id,)), merged=False) or (None, None)
+
+    def list_customers(self):
+        """回傳所有客戶的 (customer_id, name) 清單，依 customer_id 排序（不解析個別資料）"""
+        with self._connect() as conn:
+            return conn.execute("SELECT customer_id, name FROM customers ORDER BY customer_id").fetchall()
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+
+
+_default_repository = None
+_default_repository_lock = threading.Lock()
+
+
+def get_customer_repository(auto_refresh=True):
+    """
+    取得程序內共用的 CustomerRepository；auto_refresh 時若來源 JSON 有異動會先重新匯入
+    """
+    global _default_repository
+    with _default_repository_lock:
+        if _default_repository is None:
+            _default_repository = CustomerRepository()
+        if auto_refresh:
+            try:
+                _default_repository.refresh_if_stale()
+            except OSError as e:
+                logger.error(f"檢查客戶資料來源失敗：{e}")
+        return _default_repository
+
+
+if __name__ == "__main__":
+    # 由 JSON 重建客戶資料庫
+    import argparse
+
+    parser = argparse.ArgumentParser(description="由 基本資訊.json / 過往紀錄.json 匯入客戶資料庫")
+    parser.add_argument("--db", help="資料庫路徑，預設 customers.sqlite3（可由 CUSTOMER_DB_PATH 設定）")
+    parser.add_argument("--basic", default=BASIC_INFO_PATH, help="基本資訊.json 路徑")
+    parser.add_argument("--history", default=HISTORY_PATH, help="過往紀錄.json 路徑")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    repo = CustomerRepository(args.db)
+    count = repo.import_json(args.basic, args.history)
+    print(f"已匯入 {count} 位客戶：{repo.path}")
@@ -0,0 +1,215 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASIC_INFO_PATH = os.path.join(BASE_DIR, "客戶基本資訊/基本資訊.json")
+HISTORY_PATH = os.path.join(BASE_DIR, "客戶過往紀錄/過往紀錄.json")
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def iter_json_array(path, chunk_size=CHUNK_SIZE):
+    """
+    逐筆讀取 JSON 陣列檔案中的元素，不會一次載入整個檔案；
+    記憶體用量只與讀取區塊大小及單筆元素大小有關
+    Args:
+        path (str): 內容為 JSON 陣列（[{...}, {...}]）的檔案
+        chunk_size (int): 每次讀取的字元數
+    Yields:
+        陣列中的每個元素
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+        started = False
+
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            # 丟棄已解析的部分，避免緩衝區隨檔案大小成長
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    raise ValueError(f"{path} 的 JSON 陣列未正常結束")
+                fill()
+                continue
+
+            char = buffer[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError(f"{path} 不是 JSON 陣列")
+                started = True
+                pos += 1
+                continue
+            if char == "]":
+                return
+            if char == ",":
+                pos += 1
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # 數值可能在區塊邊界被截斷（如 "2." + "5"），需確認其後緊接分隔字元
+            if not eof and (end >= len(buffer) or buffer[end] not in _DELIMITERS):
+                fill()
+                continue
+            pos = end
+            yield item
+
+
+def merge_records(customer_base, customer_hist):
+    """
+    合併一筆基本資訊與過往紀錄（flat 結構）；串流讀出的資料為新物件，直接淺層合併不需 deepcopy
+    """
+    customer_data = dict(customer_base)
+    if customer_hist:
+        customer_data.update((k, v) for k, v in customer_hist.items() if k != "customer_id")
+    return customer_data
+
+
+def merge_join(basic_records, history_records):
+    """
+    依 customer_id 對兩個已排序的資料流做 sorted-merge join（以基本資訊為主的 left join），
+    同時只保留各一筆資料在記憶體中
+    Args:
+        basic_records (iterable): 依 customer_id 遞增排序的基本資訊
+        history_records (iterable): 依 customer_id 遞增排序的過往紀錄
+    Yields:
+        dict: 合併後的客戶資料；沒有過往紀錄的客戶只含基本資訊
+    Raises:
+        ValueError: 任一資料流未依 customer_id 排序
+    """
+    history_iter = iter(history_records)
+    current_hist = None
+    last_hist_id = None
+    last_base_id = None
+
+    def next_history():
+        nonlocal last_hist_id
+        for record in history_iter:
+            hist_id = record.get("customer_id")
+            if hist_id is None:
+                continue
+            if last_hist_id is not None and hist_id < last_hist_id:
+                raise ValueError(f"過往紀錄未依 customer_id 排序（{last_hist_id} 之後為 {hist_id}），請改用 hash_join")
+            last_hist_id = hist_id
+            return record
+        return None
+
+    current_hist = next_history()
+    for customer_base in basic_records:
+        base_id = customer_base.get("customer_id")
+        if base_id is None:
+            continue
+        if last_base_id is not None and base_id < last_base_id:
+            raise ValueError(f"基本資訊未依 customer_id 排序（{last_base_id} 之後為 {base_id}），請改用 hash_join")
+        last_base_id = base_id
+
+        while current_hist is not None and current_hist["customer_id"] < base_id:
+            logger.debug(f"過往紀錄 {current_hist['customer_id']} 沒有對應的基本資訊，略過")
+            current_hist = next_history()
+        matched = None
+        if current_hist is not None and current_hist["customer_id"] == base_id:
+            matched = current_hist
+            current_hist = next_history()
+        yield merge_records(customer_base, matched)
+    # 讀完其餘過往紀錄以檢查排序，否則順序錯誤的紀錄會被靜默略過（未與對應客戶合併）
+    while current_hist is not None:
+        current_hist = next_history()
+
+
+def hash_join(basic_records, history_records):
+    """
+    依 customer_id 做 hash join（以基本資訊為主的 left join），適用未排序的資料；
+    過往紀錄會先建成 dict，記憶體用量與過往紀錄筆數成正比，已配對的紀錄會立即釋放
+    """
+    hist_by_id = {}
+    for record in history_records:
+        hist_id = record.get("customer_id")
+        if hist_id is not None:
+            hist_by_id[hist_id] = record
+    for customer_base in basic_records:
+        base_id = customer_base.get("customer_id")
+        if base_id is None:
+            continue
+        yield merge_records(customer_base, hist_by_id.pop(base_id, None))
+
+
+def iter_customers(basic_info_path=BASIC_INFO_PATH, history_path=HISTORY_PATH, strategy=None):
+    """
+    串流讀取兩份客戶 JSON 並依 customer_id 合併，逐筆產生合併後的客戶資料
+    Args:
+        strategy (str): "hash"（預設，不需排序）或 "merge"（兩檔需依 customer_id 排序，記憶體用量固定；
+            未排序時會在讀到順序錯誤的那筆丟出 ValueError，此前的客戶已產生），預設依環境變數 CUSTOMER_JOIN_STRATEGY
+    """
+    strategy = strategy or os.getenv("CUSTOMER_JOIN_STRATEGY", "hash")
+    join = merge_join if strategy == "merge" else hash_join
+    return join(iter_json_array(basic_info_path), iter_json_array(history_path))
+
+
+if __name__ == "__main__":
+    # 與整檔載入的合併結果比對，並量測合成資料的串流合併吞吐量與記憶體峰值
+    import time
+    import argparse
+    import tempfile
+    import tracemalloc
+    from customer_store import merge_customer_data
+
+    parser = argparse.ArgumentParser(description="串流合併客戶資料與效能量測")
+    parser.add_argument("--rows", type=int, default=100000, help="合成資料筆數，預設 100000")
+    args = parser.parse_args()
+
+    with open(BASIC_INFO_PATH, "r", encoding="utf-8") as f:
+        basic_info = json.load(f)
+    with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+        history_info = json.load(f)
+    history_by_id = {h.get("customer_id"): h for h in history_info}
+    expected = [merge_customer_data(c, history_by_id.get(c.get("customer_id"))) for c in basic_info]
+    streamed = list(iter_customers())
+    print(f"與整檔載入合併比對：{'一致' if streamed == expected else '不一致'}（{len(streamed)} 位客戶）")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        basic_path = os.path.join(tmp_dir, "basic.json")
+        history_path = os.path.join(tmp_dir, "history.json")
+        for path, records in ((basic_path, basic_info), (history_path, history_info)):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("[\n")
+                for i in range(args.rows):
+                    record = dict(records[i % len(records)], customer_id=f"S{i:08d}")
+                    f.write((",\n" if i else "") + json.dumps(record, ensure_ascii=False))
+                f.write("\n]\n")
+        size_mb = (os.path.getsize(basic_path) + os.path.getsize(history_path)) / 1024 / 1024
+
+        # 合成資料依 customer_id 排序，兩種合併方式皆適用
+        for strategy in ("hash", "merge"):
+            started = time.perf_counter()
+            count = sum(1 for _ in iter_customers(basic_path, history_path, strategy=strategy))
+            elapsed = time.perf_counter() - started
+            # tracemalloc 會拖慢執行，記憶體峰值另跑一次量測
+            tracemalloc.start()
+            for _ in iter_customers(basic_path, history_path, strategy=strategy):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"[{strategy}] {count:,} 筆（{size_mb:.1f} MB）：{elapsed:.2f} 秒，{count / elapsed:,.0f} rows/sec，"
+                  f"記憶體峰值 {peak / 1024:.0f} KB")
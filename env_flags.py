@@ -0,0 +1,14 @@
+import os
+
+# 視為開啟的環境變數值；其餘值（含打錯字）一律視為關閉，避免選用功能被意外開啟
+TRUE_VALUES = ("1", "true", "yes")
+
+
+def env_flag(name, default=False):
+    """
+    讀取開關型環境變數：未設定或空字串時回傳 default，否則只有 1 / true / yes（不分大小寫）為開啟
+    """
+    value = os.getenv(name, "").strip().lower()
+    if not value:
+        return default
+    return value in TRUE_VALUES
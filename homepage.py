@@ -1,4 +1,10 @@
 import streamlit as st
+from dotenv import load_dotenv
+from metrics import start_exporters
+
+# 依 METRICS_PORT / METRICS_FILE 啟動指標輸出（每個程序只啟動一次，Streamlit rerun 不會重複啟動）
+load_dotenv()
+start_exporters()
 
 # --- Page Configuration ---
 st.set_page_config(
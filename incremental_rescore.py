@@ -0,0 +1,224 @@
+import logging
+
+import config_rules
+from analysis_jobs import DONE, get_job_executor
+from analysis_snapshots import get_analysis_snapshots, group_fingerprint
+from customer_stream import iter_customers
+from metrics import RESCORE_DECISIONS
+from rule_compiler import get_compiled_rules
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# 需要重新分析的原因
+NEW = "new"                    # 尚未分析過（沒有快照），include_new 時才送出
+PRODUCT = "product"            # 希望購買保單改變，適用的規則組不同
+RULES = "rules"                # 此保單類別的規則組內容改變
+FIELDS = "fields"              # 規則引用的欄位有異動
+# 可略過的原因
+UNCHANGED = "unchanged"        # 資料與上次分析相同
+UNREFERENCED = "unreferenced"  # 有異動，但都不是此保單類別規則引用的欄位
+
+
+def changed_paths(old, new, prefix=""):
+    """
+    比較兩份客戶資料，回傳有差異的 dotted path 集合。
+    清單逐筆比對且路徑不含索引（與 config_rules keywords 的寫法一致，如 claim_records.disputed）；
+    清單筆數不同、欄位新增或移除、型別不同時回傳該欄位本身的路徑
+    """
+    if old == new:
+        return set()
+    if isinstance(old, dict) and isinstance(new, dict):
+        paths = set()
+        for key in old.keys() | new.keys():
+            path = f"{prefix}.{key}" if prefix else str(key)
+            old_value, new_value = old.get(key, _MISSING), new.get(key, _MISSING)
+            if old_value is _MISSING or new_value is _MISSING:
+                paths.add(path)
+            else:
+                paths |= changed_paths(old_value, new_value, path)
+        return paths
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        paths = set()
+        for old_item, new_item in zip(old, new):
+            paths |= changed_paths(old_item, new_item, prefix)
+        return paths
+    return {prefix}
+
+
+class RuleDependencies:
+    """
+    依保單類別建立 keyword path → 規則類別 的相依表，判斷異動欄位會影響哪些規則類別。
+    異動路徑等於 keyword、是 keyword 的上層（整個物件或清單被替換），或在 keyword 之下時皆視為相依
+    """
+
+    def __init__(self, rules: dict):
+        self.rules = rules
+        # 保單類別 -> {keyword 或其上層路徑: {規則類別, ...}}
+        self._covers = {}
+        # 保單類別 -> {keyword: {規則類別, ...}}
+        self._keywords = {}
+        for group_name, compiled_group in get_compiled_rules(rules).items():
+            product = group_name[:-len("規則")] if group_name.endswith("規則") else group_name
+            covers = self._covers.setdefault(product, {})
+            keywords = self._keywords.setdefault(product, {})
+            for compiled in compiled_group:
+                for kw in compiled.keywords:
+                    keywords.setdefault(kw, set()).add(compiled.rule_class)
+                    parts = kw.split(".")
+                    for i in range(1, len(parts) + 1):
+                        covers.setdefault(".".join(parts[:i]), set()).add(compiled.rule_class)
+
+    def affected_classes(self, product, paths):
+        """
+        回傳異動路徑影響的規則類別（排序後的 list）；沒有對應規則組時回傳 None
+        """
+        covers = self._covers.get(product)
+        if covers is None:
+            return None
+        keywords = self._keywords[product]
+        classes = set()
+        for path in paths:
+            if path in covers:
+                classes |= covers[path]
+                continue
+            # 異動在 keyword 之下（如 keyword 為 review_records、異動 review_records.pending）
+            parts = path.split(".")
+            for i in range(len(parts) - 1, 0, -1):
+                classes |= keywords.get(".".join(parts[:i]), set())
+        return sorted(classes)
+
+
+def classify(customer_data: dict, snapshot, rules: dict, dependencies: RuleDependencies, conservative=False):
+    """
+    判斷一位客戶是否需要重新分析；預設只有規則引用的欄位異動才重新分析，
+    conservative 為 True 時任何欄位異動都重新分析（例如希望專家綜合說明也反映未被規則引用的欄位）
+    Returns:
+        dict: {"customer_id", "dirty", "reason", "classes"（受影響的規則類別）, "paths"（有異動的欄位）}
+    """
+    decision = {"customer_id": customer_data.get("customer_id"), "name": customer_data.get("name"),
+                "product": customer_data.get("希望購買保單"), "dirty": True, "classes": [], "paths": []}
+    if snapshot is None:
+        return dict(decision, reason=NEW)
+    if snapshot["product"] != decision["product"]:
+        return dict(decision, reason=PRODUCT)
+    if snapshot["rules_fingerprint"] != group_fingerprint(customer_data, rules):
+        return dict(decision, reason=RULES)
+    paths = sorted(changed_paths(snapshot["data"], customer_data))
+    if not paths:
+        return dict(decision, dirty=False, reason=UNCHANGED)
+    if conservative:
+        return dict(decision, reason=FIELDS, paths=paths)
+    classes = dependencies.affected_classes(decision["product"], paths)
+    if classes is None:
+        # 找不到對應規則組時送出的是完整資料，任何異動都可能影響結果
+        return dict(decision, reason=FIELDS, paths=paths)
+    if not classes:
+        return dict(decision, dirty=False, reason=UNREFERENCED, paths=paths)
+    return dict(decision, reason=FIELDS, classes=classes, paths=paths)
+
+
+def plan_rescore(customers, rules: dict = None, snapshots=None, include_new=False, conservative=False):
+    """
+    比對每位客戶與上次分析的快照，決定哪些客戶需要重新分析
+    Args:
+        customers (iterable): 合併後的客戶資料（預設串流讀取兩份客戶 JSON）
+        rules (dict): 規則，預設為 config_rules.config_rules
+        snapshots (dict): {customer_id: 快照}，預設讀取 AnalysisSnapshots
+        include_new (bool): 是否一併分析尚未分析過的客戶
+        conservative (bool): 任何欄位異動都重新分析，不依規則相依性略過
+    Returns:
+        dict: {"dirty": [客戶資料, ...], "decisions": [classify 的結果, ...], "counts": {原因: 人數},
+               "avoided": 因資料未變或異動欄位未被引用而略過的呼叫數,
+               "avoided_changed": 其中資料有異動、但不影響規則的客戶數}
+    """
+    rules = rules if rules is not None else config_rules.config_rules
+    snapshots = snapshots if snapshots is not None else get_analysis_snapshots().all()
+    dependencies = RuleDependencies(rules)
+    plan = {"dirty": [], "decisions": [], "counts": {}, "avoided": 0, "avoided_changed": 0}
+    with span("rescore.plan", conservative=conservative) as s:
+        for customer_data in customers:
+            decision = classify(customer_data, snapshots.get(customer_data.get("customer_id")), rules, dependencies,
+                                conservative=conservative)
+            plan["decisions"].append(decision)
+            plan["counts"][decision["reason"]] = plan["counts"].get(decision["reason"], 0) + 1
+            if decision["dirty"] and (decision["reason"] != NEW or include_new):
+                plan["dirty"].append(customer_data)
+                RESCORE_DECISIONS.inc(decision="rescore", reason=decision["reason"])
+            else:
+                RESCORE_DECISIONS.inc(decision="skip", reason=decision["reason"])
+                if not decision["dirty"]:
+                    plan["avoided"] += 1
+                    plan["avoided_changed"] += decision["reason"] == UNREFERENCED
+        s.set(customers=len(plan["decisions"]), dirty=len(plan["dirty"]), avoided=plan["avoided"])
+    return plan
+
+
+def rescore_dirty(rules: dict = None, customers=None, executor=None, include_new=False, dry_run=False,
+                  conservative=False):
+    """
+    只為需要重新分析的客戶送出背景分析工作（JobExecutor），回傳 plan_rescore 的結果並加上 "jobs"
+    """
+    rules = rules if rules is not None else config_rules.config_rules
+    plan = plan_rescore(customers if customers is not None else iter_customers(), rules, include_new=include_new,
+                        conservative=conservative)
+    plan["jobs"] = []
+    if not dry_run and plan["dirty"]:
+        executor = executor or get_job_executor()
+        for customer_data in plan["dirty"]:
+            plan["jobs"].append(executor.submit(customer_data, rules, label=customer_data.get("name")))
+    logger.info(f"增量重新分析：{len(plan['decisions'])} 位客戶，重新分析 {len(plan['dirty'])} 位，"
+                f"略過 {plan['avoided']} 次呼叫（其中 {plan['avoided_changed']} 位資料有異動但不影響規則）")
+    return plan
+
+
+if __name__ == "__main__":
+    # 依客戶資料異動重新分析受影響的客戶，並列出每位客戶的判斷結果
+    import argparse
+    from agent_api_client import load_latest_result
+    from metrics import start_exporters
+
+    parser = argparse.ArgumentParser(description="依規則相依性只重新分析資料異動受影響的客戶")
+    parser.add_argument("--dry-run", action="store_true", help="只列出判斷結果，不呼叫 API")
+    parser.add_argument("--include-new", action="store_true", help="一併分析尚未分析過（沒有快照）的客戶")
+    parser.add_argument("--baseline", action="store_true",
+                        help="為已有分析結果但沒有快照的客戶記錄目前資料作為快照（啟用本功能前的分析）")
+    parser.add_argument("--conservative", action="store_true",
+                        help="任何欄位異動都重新分析（預設只重新分析規則引用的欄位有異動的客戶）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="列出異動欄位")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    start_exporters()
+
+    if args.baseline:
+        snapshots = get_analysis_snapshots()
+        existing = snapshots.all()
+        recorded = 0
+        for customer_data in iter_customers():
+            customer_id = customer_data.get("customer_id")
+            if customer_id not in existing and load_latest_result(customer_id) is not None:
+                snapshots.record(customer_data, config_rules.config_rules)
+                recorded += 1
+        print(f"已記錄 {recorded} 位客戶的快照")
+
+    plan = rescore_dirty(include_new=args.include_new, dry_run=args.dry_run,
+                         conservative=args.conservative)
+    for decision in plan["decisions"]:
+        action = "重新分析" if decision["dirty"] and (decision["reason"] != NEW or args.include_new) else "略過"
+        classes = f"，影響：{'、'.join(decision['classes'])}" if decision["classes"] else ""
+        print(f"{decision['customer_id']}（{decision['product']}）{action}［{decision['reason']}］{classes}")
+        if args.verbose and decision["paths"]:
+            print(f"    異動欄位：{', '.join(decision['paths'])}")
+    succeeded = 0
+    for job in plan["jobs"]:
+        job.future.result()
+        succeeded += job.status == DONE
+    print("=" * 30)
+    print(f"客戶數：{len(plan['decisions'])}，重新分析 {len(plan['dirty'])} 位"
+          f"{f'（成功 {succeeded}）' if plan['jobs'] else ''}")
+    print(f"避免的 API 呼叫：{plan['avoided']} 次（資料未變 {plan['counts'].get(UNCHANGED, 0)}，"
+          f"異動欄位未被規則引用 {plan['avoided_changed']}）")
+    if plan["counts"].get(NEW) and not args.include_new:
+        print(f"尚未分析過：{plan['counts'][NEW]} 位（加上 --include-new 一併分析，或 --baseline 以目前資料為基準）")
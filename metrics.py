@@ -0,0 +1,292 @@
+import os
+import time
+import bisect
+import logging
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self):
+        """回傳 Prometheus 文字格式的各行"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """只增不減的計數器"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """可增可減的目前值（如進行中的請求數）"""
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """累積分佈直方圖：每個觀測值只做一次二分搜尋與三個加法"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各區間（非累積）計數，最後一格為 +Inf；輸出時才累加
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self, **labels):
+        """回傳 {"buckets": [(上界, 累積次數), ...], "sum": 總和, "count": 次數}"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            counts, total, count = (list(state[0]), state[1], state[2]) if state else ([0] * (len(self.buckets) + 1), 0.0, 0)
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            keys = sorted(self._values)
+        for key in keys:
+            snapshot = self.snapshot(**dict(zip(self.labelnames, key)))
+            for bound, count in snapshot["buckets"]:
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(snapshot['sum'])}")
+            lines.append(f"{self.name}_count{labels} {snapshot['count']}")
+        return lines
+
+
+def render_metrics():
+    """以 Prometheus 文字格式（text/plain; version=0.0.4）輸出所有指標"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+# --- AGENT API 指標 ---
+
+AGENT_REQUESTS = Counter("agent_requests_total", "AGENT API 請求數（依 HTTP 狀態碼，逾時為 timeout、連線錯誤為 error）",
+                         ("mode", "status"))
+AGENT_REQUEST_SECONDS = Histogram("agent_request_duration_seconds", "AGENT API 請求耗時（秒，串流模式為讀完整個串流）",
+                                  (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120), ("mode",))
+AGENT_PAYLOAD_BYTES = Histogram("agent_request_payload_bytes", "送出的 payload 大小（bytes）",
+                                (1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144), ("mode",))
+AGENT_IN_FLIGHT = Gauge("agent_requests_in_flight", "進行中的 AGENT API 請求數（含等待連線）")
+AGENT_PARSE_RESULTS = Counter("agent_parse_results_total",
+                              "回應解析結果（ok 為成功、repaired 為截斷後修復的不完整結果，failed/no_text/error/invalid_body 為失敗）", ("status",))
+AGENT_CACHE_LOOKUPS = Counter("agent_cache_lookups_total", "分析結果快取查詢次數", ("result",))
+AGENT_ESTIMATED_TOKENS = Counter("agent_estimated_tokens_total", "送出請求的估計 token 數（計入 TPM 配額）", ("mode",))
+AGENT_RATE_LIMIT_WAIT_SECONDS = Histogram("agent_rate_limit_wait_seconds", "送出前等待 TPM/RPM 額度的秒數",
+                                          (0, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120), ("mode",))
+AGENT_THROTTLED = Counter("agent_throttled_total", "上游回傳 429 的次數（之後依 Retry-After 暫停並重送）", ("mode",))
+AGENT_RETRIES = Counter("agent_retries_total", "重試次數（依失敗原因：timeout/connection/status_<碼>）", ("mode", "reason"))
+AGENT_CIRCUIT_STATE = Gauge("agent_circuit_breaker_state", "斷路器狀態（0=closed，1=half_open，2=open）")
+AGENT_CIRCUIT_REJECTIONS = Counter("agent_circuit_breaker_rejections_total", "斷路器開啟期間直接拒絕的請求數")
+AGENT_HEDGED_REQUESTS = Counter("agent_hedged_requests_total",
+                                "hedge 請求（sent 為送出第二份，primary_won/hedge_won 為先完成者）", ("mode", "outcome"))
+AGENT_LATENCY_SECONDS = Histogram("agent_request_latency_seconds",
+                                  "依端點（run/stream）與保單類別的請求耗時（秒，成功與逾時的請求；逾時以實際等待秒數計）",
+                                  (0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120, 180), ("endpoint", "product"))
+AGENT_EFFECTIVE_TIMEOUT = Gauge("agent_effective_timeout_seconds", "目前採用的逾時秒數（依近期延遲分位數與餘裕計算）",
+                                ("endpoint", "product"))
+AGENT_LATENCY_QUANTILE = Gauge("agent_latency_window_quantile_seconds", "滾動視窗內的延遲分位數（AGENT_TIMEOUT_QUANTILE）",
+                               ("endpoint", "product"))
+AGENT_SINGLE_FLIGHT = Counter("agent_single_flight_total",
+                              "相同請求合併次數（leader 實際呼叫上游，follower 等待同程序的結果，process_follower 等待其他程序）",
+                              ("role",))
+
+# --- 客戶資料載入指標 ---
+
+CUSTOMER_DATA_CHECKS = Counter("customer_data_checks_total",
+                               "客戶資料檔檢查次數（hit 為未異動沿用快取，reload 為重新解析，error 為讀取/解析失敗）",
+                               ("file", "result"))
+CUSTOMER_DATA_LOAD_SECONDS = Histogram("customer_data_load_seconds", "客戶資料檔解析耗時（秒）",
+                                       (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30), ("file",))
+CUSTOMER_DATA_RECORDS = Gauge("customer_data_records", "目前快取中的資料筆數", ("file",))
+CUSTOMER_DATA_CHANGES = Counter("customer_data_changed_records_total", "重新載入時新增/修改/移除的筆數",
+                                ("file", "change"))
+
+# --- 背景分析工作指標 ---
+
+ANALYSIS_JOBS = Counter("analysis_jobs_total", "已結束的背景分析工作數（done/failed/cancelled）", ("status",))
+ANALYSIS_JOBS_ACTIVE = Gauge("analysis_jobs_active", "排隊中（queued）與執行中（running）的背景分析工作數", ("state",))
+RESCORE_DECISIONS = Counter("rescore_decisions_total",
+                            "增量重新分析的判斷結果（rescore 為送出分析，skip 為略過；reason 見 incremental_rescore）",
+                            ("decision", "reason"))
+
+
+# --- 輸出方式 ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """於背景 thread 提供 GET /metrics，回傳 server（port=0 時由系統指定，可由 server.server_address 取得）"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Prometheus 指標：http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def write_metrics_file(path):
+    """以原子方式（暫存檔＋rename）寫出指標檔，供 node_exporter textfile collector 讀取"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(render_metrics())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _file_exporter(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_metrics_file(path)
+        except OSError as e:
+            logger.warning(f"寫出指標檔失敗：{e}")
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_exporters():
+    """
+    依環境變數啟動指標輸出（每個程序只啟動一次，皆未設定時不做任何事）：
+        METRICS_PORT：提供 HTTP /metrics 的 port
+        METRICS_FILE：定期寫出的指標檔路徑，間隔 METRICS_FILE_INTERVAL 秒（預設 15）
+    """
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    port = os.getenv("METRICS_PORT")
+    if port:
+        try:
+            start_http_server(int(port), os.getenv("METRICS_HOST", "0.0.0.0"))
+        except OSError as e:
+            # 同一台機器上的其他程序已佔用此 port
+            logger.warning(f"無法於 port {port} 提供指標：{e}")
+    path = os.getenv("METRICS_FILE")
+    if path:
+        interval = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+        threading.Thread(target=_file_exporter, args=(path, interval), name="metrics-file", daemon=True).start()
+
+
+if __name__ == "__main__":
+    # 量測記錄指標的額外開銷，並輸出目前的指標內容
+    n = 200000
+    started = time.perf_counter()
+    for i in range(n):
+        AGENT_REQUESTS.inc(mode="sync", status="200")
+    counter_us = (time.perf_counter() - started) / n * 1e6
+    started = time.perf_counter()
+    for i in range(n):
+        AGENT_REQUEST_SECONDS.observe((i % 1000) / 100, mode="sync")
+    histogram_us = (time.perf_counter() - started) / n * 1e6
+    print(render_metrics())
+    print(f"Counter.inc：{counter_us:.2f} µs/次，Histogram.observe：{histogram_us:.2f} µs/次")
@@ -0,0 +1,404 @@
+import os
+import glob
+import json
+import math
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from payload_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Results")
+
+
+def load_replay_results(results_dir=RESULTS_DIR):
+    """
+    讀取 Results/result_<customer_id>.json 作為回放內容，回傳 {customer_id: 結果 dict}
+    """
+    replay = {}
+    for path in sorted(glob.glob(os.path.join(results_dir, "result_*.json"))):
+        customer_id = os.path.basename(path)[len("result_"):-len(".json")]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                replay[customer_id] = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"略過無法讀取的回放檔 {path}：{e}")
+    return replay
+
+
+def parse_latency(spec):
+    """
+    解析延遲分佈設定，回傳取樣函式 sample(rng) -> 秒數：
+        "0.5"                    固定 0.5 秒
+        "uniform:2:10"           2～10 秒均勻分佈
+        "normal:8:2"             平均 8 秒、標準差 2 秒（不小於 0）
+        "lognormal:8:0.5"        中位數 8 秒、sigma 0.5 的對數常態（LLM 延遲常見的長尾）
+        "exp:5"                  平均 5 秒的指數分佈
+    """
+    spec = str(spec or "0").strip()
+    kind, _, rest = spec.partition(":")
+    params = [float(p) for p in rest.split(":")] if rest else []
+    if not rest:
+        value = float(kind)
+        return lambda rng: value
+    if kind == "uniform":
+        low, high = params
+        return lambda rng: rng.uniform(low, high)
+    if kind == "normal":
+        mean, std = params
+        return lambda rng: max(0.0, rng.gauss(mean, std))
+    if kind == "lognormal":
+        median, sigma = params
+        mu = math.log(median) if median > 0 else 0.0
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    if kind == "exp":
+        mean, = params
+        return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    raise ValueError(f"無法解析的延遲分佈設定：{spec}")
+
+
+# 注入的格式錯誤回應種類
+MALFORMED_KINDS = ("truncated_json", "html", "no_envelope", "no_json_in_text", "empty")
+
+
+def message_text(result: dict) -> str:
+    """將分析結果包成 LLM 回覆文字（```json code block），與實際 Langflow 流程輸出格式相同"""
+    return "```json\n" + json.dumps(result, ensure_ascii=False, indent=2) + "\n```"
+
+
+def run_response(text: str, session_id: str) -> dict:
+    """Langflow /api/v1/run 的回應結構（outputs[0].outputs[0].results.message.text）"""
+    return {
+        "session_id": session_id,
+        "outputs": [{
+            "inputs": {"input_value": ""},
+            "outputs": [{"results": {"message": {"text": text, "sender": "Machine", "sender_name": "AI"}}}],
+        }],
+    }
+
+
+class MockLangflowHandler(BaseHTTPRequestHandler):
+    """模擬 Langflow run 端點：依 payload 中的 customer_id 回放 Results/ 內的分析結果，?stream=true 時以串流逐段送出"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLangflow/1.0"
+    # 標頭與本文分兩次送出，未關閉 Nagle 時 keep-alive 連線上每個回應會多等約 40ms 的 delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def setup(self):
+        super().setup()
+        # 每條 TCP 連線計一次，用於確認用戶端有重用 keep-alive 連線
+        self.server.count("connections")
+
+    def _customer_id(self, payload):
+        try:
+            return json.loads(payload.get("input_value") or "{}").get("customer_info", {}).get("customer_id")
+        except (ValueError, AttributeError):
+            return None
+
+    def _pick_result(self, customer_id):
+        replay = self.server.replay
+        if customer_id in replay:
+            return replay[customer_id]
+        if replay:
+            return replay[self.server.rng_choice(sorted(replay))]
+        return {"score_table": [], "score_formula": "", "total_score": 0, "grade": "C", "專家綜合說明": "（無回放資料）"}
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._send_bytes(status, body, "application/json", headers)
+
+    def _send_bytes(self, status, body: bytes, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _validate_payload(payload):
+        """檢查 payload 與 call_agent_api 送出的結構一致，回傳錯誤訊息或 None"""
+        for field in ("input_value", "output_type", "input_type", "tweaks"):
+            if field not in payload:
+                return f"missing field: {field}"
+        try:
+            content = json.loads(payload["input_value"])
+        except (TypeError, ValueError):
+            return "input_value is not a JSON string"
+        if not isinstance(content, dict) or "customer_info" not in content or "rules" not in content:
+            return "input_value must contain customer_info and rules"
+        return None
+
+    def _send_malformed(self, kind, text, session_id):
+        if kind == "truncated_json":
+            body = json.dumps(run_response(text, session_id), ensure_ascii=False).encode("utf-8")
+            self._send_bytes(200, body[:len(body) // 2], "application/json")
+        elif kind == "html":
+            self._send_bytes(200, b"<html><body><h1>502 Bad Gateway</h1></body></html>", "text/html")
+        elif kind == "no_envelope":
+            self._send_json(200, {"session_id": session_id, "outputs": []})
+        elif kind == "no_json_in_text":
+            self._send_json(200, run_response("抱歉，我無法完成這次評分。", session_id))
+        else:
+            self._send_bytes(200, b"", "application/json")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_event(self, event, data):
+        line = json.dumps({"event": event, "data": data}, ensure_ascii=False)
+        # Langflow 為每行一個 JSON 事件（以空行分隔）；--sse 時改為標準 SSE「data: ...」
+        text = f"data: {line}\n\n" if self.server.sse else f"{line}\n\n"
+        self._write_chunk(text.encode("utf-8"))
+
+    def _stream(self, text, session_id):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        message_id = str(uuid.uuid4())
+        self._send_event("add_message", {"id": message_id, "sender": "User", "text": ""})
+        size = max(1, self.server.chunk_chars)
+        for start in range(0, len(text), size):
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+            self._send_event("token", {"chunk": text[start:start + size], "id": message_id})
+        self._send_event("end", {"result": run_response(text, session_id)})
+        self._write_chunk(b"")
+
+    def do_GET(self):
+        # GET /stats：目前為止的請求統計
+        if urlsplit(self.path).path.rstrip("/") == "/stats":
+            self._send_json(200, self.server.stats_snapshot())
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if server.token and self.headers.get("Authorization") != f"Bearer {server.token}":
+            server.count("unauthorized")
+            self._send_json(403, {"detail": "Invalid API key"})
+            return
+        try:
+            payload = json.loads(raw or b"{}")
+        except ValueError:
+            payload = None
+        error = "invalid JSON body" if not isinstance(payload, dict) else self._validate_payload(payload)
+        if error:
+            server.count("invalid_payload")
+            self._send_json(422, {"detail": error})
+            return
+
+        retry_after = server.admit(estimate_tokens(str(payload.get("input_value") or "")) + server.quota_overhead_tokens)
+        if retry_after is not None:
+            server.count("status_429_quota")
+            self._send_json(429, {"detail": "Requests to this deployment have exceeded the rate limit"},
+                            {"Retry-After": str(math.ceil(retry_after))})
+            return
+
+        fault, delay = server.draw()
+        if fault == "timeout":
+            # 模擬上游卡住：長時間不回應後直接斷線
+            server.count("timeout")
+            time.sleep(server.hang_seconds)
+            self.close_connection = True
+            return
+        if delay:
+            time.sleep(delay)
+        if fault == "error":
+            status = server.rng_choice(server.error_statuses)
+            server.count(f"status_{status}")
+            headers = {"Retry-After": str(server.retry_after)} if status == 429 else None
+            self._send_json(status, {"detail": f"injected error {status}"}, headers)
+            return
+
+        text = message_text(self._pick_result(self._customer_id(payload)))
+        session_id = payload.get("session_id") or str(uuid.uuid4())
+        if fault == "malformed":
+            kind = server.rng_choice(server.malformed_kinds)
+            server.count(f"malformed_{kind}")
+            self._send_malformed(kind, text, session_id)
+            return
+        server.count("ok")
+        if parse_qs(parts.query).get("stream", ["false"])[0].lower() == "true":
+            self._stream(text, session_id)
+        else:
+            self._send_json(200, run_response(text, session_id))
+
+
+class MockLangflowServer(ThreadingHTTPServer):
+    """模擬 Langflow 伺服器：保存回放資料、延遲分佈、故障注入設定與請求統計"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency="0", error_rate=0.0, error_statuses=(500, 502, 503, 429),
+                 timeout_rate=0.0, hang_seconds=120.0, malformed_rate=0.0, malformed_kinds=MALFORMED_KINDS,
+                 retry_after=5, token_delay=0.02, chunk_chars=8, sse=False, token=None, seed=None,
+                 quota_rpm=None, quota_tpm=None, quota_window=60.0, quota_overhead_tokens=2500,
+                 results_dir=RESULTS_DIR):
+        super().__init__(address, MockLangflowHandler)
+        self.replay = load_replay_results(results_dir)
+        self.latency_spec = str(latency)
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.malformed_rate = malformed_rate
+        self.malformed_kinds = tuple(malformed_kinds)
+        self.retry_after = retry_after
+        self.token_delay = token_delay
+        self.chunk_chars = chunk_chars
+        self.sse = sse
+        self.token = token
+        self.quota_rpm = quota_rpm
+        self.quota_tpm = quota_tpm
+        self.quota_window = quota_window
+        self.quota_overhead_tokens = quota_overhead_tokens
+        self._quota_log = deque()
+        self._quota_tokens = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0}
+
+    def admit(self, tokens):
+        """
+        模擬 Azure OpenAI 的 RPM/TPM 配額（滑動視窗，被拒絕的請求不計入）：
+        受理時回傳 None，超過配額時回傳距離視窗內最早一筆過期的秒數（作為 Retry-After）
+        """
+        if not self.quota_rpm and not self.quota_tpm:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            while self._quota_log and self._quota_log[0][0] <= now - self.quota_window:
+                self._quota_tokens -= self._quota_log.popleft()[1]
+            if (self.quota_rpm and len(self._quota_log) + 1 > self.quota_rpm) or \
+                    (self.quota_tpm and self._quota_tokens + tokens > self.quota_tpm):
+                oldest = self._quota_log[0][0] if self._quota_log else now
+                return max(1.0, oldest + self.quota_window - now)
+            self._quota_log.append((now, tokens))
+            self._quota_tokens += tokens
+            return None
+
+    def draw(self):
+        """依設定的比例抽出本次請求的故障類型（None/timeout/error/malformed）與延遲秒數"""
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            delay = self.sample_latency(self._rng)
+        for fault, rate in (("timeout", self.timeout_rate), ("error", self.error_rate), ("malformed", self.malformed_rate)):
+            if roll < rate:
+                return fault, delay
+            roll -= rate
+        return None, delay
+
+    def rng_choice(self, options):
+        with self._lock:
+            return self._rng.choice(options)
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def stats_snapshot(self):
+        with self._lock:
+            return dict(self.stats, latency=self.latency_spec, error_rate=self.error_rate,
+                        timeout_rate=self.timeout_rate, malformed_rate=self.malformed_rate)
+
+
+def create_server(host="127.0.0.1", port=7860, **options):
+    """
+    建立模擬 Langflow 伺服器（尚未開始服務），port 為 0 時由系統指定
+    Args:
+        latency (str|float): 延遲分佈，見 parse_latency
+        error_rate (float): 回傳錯誤狀態碼的比例，狀態碼由 error_statuses 隨機選出（429 附 Retry-After）
+        timeout_rate (float): 卡住 hang_seconds 秒後斷線的比例
+        malformed_rate (float): 回傳格式錯誤內容的比例（種類見 MALFORMED_KINDS）
+        token_delay (float): 串流模式每段文字之間的延遲秒數
+        chunk_chars (int): 串流模式每段文字的字數
+        sse (bool): 串流事件是否使用 SSE「data: ...」格式
+        token (str): 設定時要求 Authorization: Bearer <token>
+        seed (int): 亂數種子，固定後故障與延遲序列可重現
+        quota_rpm / quota_tpm (int): 模擬部署的每分鐘請求/token 配額，超過時回傳 429 與 Retry-After
+        quota_window (float): 配額的滑動視窗秒數，預設 60
+        quota_overhead_tokens (int): 每筆請求在 input_value 之外計入的 token 數（提示詞與輸出），預設 2500
+    """
+    return MockLangflowServer((host, port), **options)
+
+
+def start_in_thread(**options):
+    """
+    於背景 thread 啟動模擬伺服器（供壓力測試與 benchmark 使用），回傳 (server, run 端點 URL)；
+    結束時呼叫 server.shutdown()
+    """
+    options.setdefault("port", 0)
+    server = create_server(**options)
+    threading.Thread(target=server.serve_forever, name="mock-langflow", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/api/v1/run/mock-flow"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本機模擬 Langflow run 端點（回放 Results/*.json，可注入延遲與故障）")
+    parser.add_argument("--host", default=os.getenv("MOCK_LANGFLOW_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_LANGFLOW_PORT", "7860")))
+    parser.add_argument("--latency", default=os.getenv("MOCK_LATENCY", "0"),
+                        help="延遲分佈：固定秒數或 uniform:a:b、normal:mean:std、lognormal:median:sigma、exp:mean")
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("MOCK_ERROR_RATE", "0")),
+                        help="回傳錯誤狀態碼的比例（0～1）")
+    parser.add_argument("--error-statuses", default=os.getenv("MOCK_ERROR_STATUSES", "500,502,503,429"),
+                        help="注入的錯誤狀態碼，逗號分隔")
+    parser.add_argument("--retry-after", type=int, default=5, help="429 回應的 Retry-After 秒數")
+    parser.add_argument("--timeout-rate", type=float, default=float(os.getenv("MOCK_TIMEOUT_RATE", "0")),
+                        help="卡住不回應的比例（0～1）")
+    parser.add_argument("--hang-seconds", type=float, default=120.0, help="卡住不回應的秒數")
+    parser.add_argument("--malformed-rate", type=float, default=float(os.getenv("MOCK_MALFORMED_RATE", "0")),
+                        help="回傳格式錯誤內容的比例（0～1）")
+    parser.add_argument("--malformed-kinds", default=",".join(MALFORMED_KINDS),
+                        help=f"格式錯誤種類，逗號分隔（{', '.join(MALFORMED_KINDS)}）")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="串流模式每段文字間的延遲秒數")
+    parser.add_argument("--chunk-chars", type=int, default=8, help="串流模式每段文字的字數")
+    parser.add_argument("--sse", action="store_true", help="串流事件改用 SSE「data: ...」格式")
+    parser.add_argument("--token", default=os.getenv("MOCK_API_TOKEN"), help="要求的 Bearer token（預設不檢查）")
+    parser.add_argument("--seed", type=int, help="亂數種子（固定故障與延遲序列）")
+    parser.add_argument("--quota-rpm", type=int, default=int(os.getenv("MOCK_QUOTA_RPM", "0")),
+                        help="模擬每分鐘請求配額，超過時回傳 429（預設不限制）")
+    parser.add_argument("--quota-tpm", type=int, default=int(os.getenv("MOCK_QUOTA_TPM", "0")),
+                        help="模擬每分鐘 token 配額，超過時回傳 429（預設不限制）")
+    parser.add_argument("--quota-window", type=float, default=60.0, help="配額的滑動視窗秒數，預設 60")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(
+        args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(",") if s.strip()],
+        retry_after=args.retry_after, timeout_rate=args.timeout_rate, hang_seconds=args.hang_seconds,
+        malformed_rate=args.malformed_rate, malformed_kinds=[k for k in args.malformed_kinds.split(",") if k.strip()],
+        token_delay=args.token_delay, chunk_chars=args.chunk_chars, sse=args.sse, token=args.token, seed=args.seed,
+        quota_rpm=args.quota_rpm or None, quota_tpm=args.quota_tpm or None, quota_window=args.quota_window,
+    )
+    print(f"模擬 Langflow 伺服器：http://{args.host}:{server.server_address[1]}/api/v1/run/mock-flow"
+          f"（回放 {len(server.replay)} 筆結果，統計：GET /stats）")
+    print(f"延遲 {args.latency}，錯誤 {args.error_rate:.0%}，逾時 {args.timeout_rate:.0%}，格式錯誤 {args.malformed_rate:.0%}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,20 +1,32 @@
 import streamlit as st
-import json
 import os
+import uuid
 import pandas as pd
-from collections import OrderedDict
+from datetime import datetime
 import streamlit.components.v1 as components
 
 # 假設這些模組在同級目錄或PYTHONPATH中
 # For a multi-page app, ensure these can be found relative to the main script or are in PYTHONPATH
 try:
-    from agent_api_client import call_agent_api, extract_final_results, save_results
+    from agent_api_client import extract_streaming_field, load_latest_result
+    from analysis_jobs import DONE, QUEUED, RUNNING, get_job_executor
     import config_rules
     from 中文規則對應 import all_field_zh
+    from rule_compiler import RuleIndex, get_accessor, get_rule_index
+    from report_html import build_score_table_html
+    from tracing import span, get_trace, waterfall
+    from customer_data import get_customer_data
+    from customer_store import merge_customer_data
+    from adaptive_timeout import get_adaptive_timeouts
+    from env_flags import env_flag
+    from metrics import start_exporters
 except ImportError:
-    st.error("無法導入必要的分析模組。請確保 agent_api_client.py, config_rules.py, 和 中文規則對應.py 在正確的路徑。")
+    st.error("無法導入必要的分析模組。請確保 agent_api_client.py, config_rules.py, rule_compiler.py 和 中文規則對應.py 在正確的路徑。")
     st.stop()
 
+# Metrics exporters (METRICS_PORT / METRICS_FILE) start once per process, here rather than on import of agent_api_client
+start_exporters()
+
 # --- Styling ---
 st.markdown("""
 <style>
@@ -145,14 +157,8 @@ st.markdown("""
 # --- Helper Functions for Data Transformation & Display ---
 
 def get_nested_value(data_dict, key_path, default="N/A"):
-    """Safely get a value from a nested dictionary."""
-    keys = key_path.split('.')
-    val = data_dict
-    for key in keys:
-        if isinstance(val, dict) and key in val:
-            val = val[key]
-        else:
-            return default
+    """Safely get a value from a nested dictionary (uses the precompiled accessor from rule_compiler)."""
+    val = get_accessor(key_path)(data_dict)
     return val if val is not None else default # Ensure None is also treated as default
 
 def display_basic_info(customer_data, zh_map):
@@ -313,423 +319,339 @@ def display_records(record_data, zh_map):
     st.markdown("</div>", unsafe_allow_html=True)
 
 
-# --- Utility Functions from config_rules ---
-def get_class_desc_map():
-    class_desc_map = {}
-    if hasattr(config_rules, 'config_rules') and isinstance(config_rules.config_rules, dict):
-        for rule_group in config_rules.config_rules.values():
-            if isinstance(rule_group, list):
-                for rule in rule_group:
-                    if isinstance(rule, dict) and rule.get("class"):
-                        class_desc_map[rule.get("class")] = rule.get("description", "無類別描述")
-    return class_desc_map
-
-def get_rule_class_map():
-    rule_class_map = {}
-    if hasattr(config_rules, 'config_rules') and isinstance(config_rules.config_rules, dict):
-        for rule_group in config_rules.config_rules.values():
-            if isinstance(rule_group, list):
-                for rule in rule_group:
-                    if isinstance(rule, dict) and "keywords" in rule and isinstance(rule["keywords"], list):
-                        for kw in rule["keywords"]:
-                            rule_class_map[kw] = rule.get("class", "未分類規則")
-    return rule_class_map
-
-def get_rule_required_map():
-    rule_required_map = {}
-    if hasattr(config_rules, 'config_rules') and isinstance(config_rules.config_rules, dict):
-        for rule_group in config_rules.config_rules.values():
-            if isinstance(rule_group, list):
-                for rule in rule_group:
-                    if isinstance(rule, dict) and "keywords" in rule and isinstance(rule["keywords"], list):
-                        for kw in rule["keywords"]:
-                            # Using ASCII-friendly symbols for required/optional
-                            rule_required_map[kw] = "✶ 必要" if rule.get("required", False) else "○ 選擇"
-    return rule_required_map
-
-# --- Load Data ---
-@st.cache_data
-def load_data():
-    # Determine base path for data files, works if pages script is in 'pages' subdir
-    base_path = os.path.join(os.path.dirname(__file__), "..")
-    basic_info_path = os.path.join(base_path, "客戶基本資訊/基本資訊.json")
-    records_path = os.path.join(base_path, "客戶過往紀錄/過往紀錄.json")
-
-    try:
-        with open(basic_info_path, "r", encoding="utf-8") as f:
-            customers_list = json.load(f)
-        with open(records_path, "r", encoding="utf-8") as f:
-            records_list = json.load(f)
-    except FileNotFoundError:
-        st.error(f"錯誤：找不到客戶資料檔案。預期路徑: {basic_info_path}, {records_path}。請確認檔案路徑是否正確。")
-        return [], {}, {}
-    except json.JSONDecodeError:
-        st.error("錯誤：客戶資料檔案格式錯誤，無法解析 JSON。")
-        return [], {}, {}
-    customer_map = {c.get("name"): c for c in customers_list if c.get("name")}
-    id_to_record_map = {r.get("customer_id"): r for r in records_list if r.get("customer_id")}
-    return customers_list, customer_map, id_to_record_map
-
-customers, customer_dict, id_to_record = load_data()
-
-# --- Main Application UI ---
-st.markdown("<h1 style='text-align: center; color: #003366;'>智慧承保風險評估</h1>", unsafe_allow_html=True)
-st.markdown("<p style='text-align: center; color: #4B5563; margin-bottom: 2rem;'><i>選擇客戶以載入資料並執行 AI 風險分析</i></p>", unsafe_allow_html=True)
-
-
-if not customers:
-    st.warning("無法載入客戶列表。請檢查資料檔案。")
-    st.stop()
-
-names = [""] + [c["name"] for c in customers if c.get("name")]
-if len(names) == 1: # Only blank option
-    st.warning("客戶名單中沒有有效的客戶名稱可供選擇。")
-    st.stop()
-
-selected_name = st.selectbox(" STEP 1 : 👤 請選擇客戶姓名進行分析", names, index=0, help="從列表中選擇一位客戶以載入其詳細資料和過往紀錄。")
-
-if selected_name and selected_name in customer_dict:
-    customer = customer_dict[selected_name]
-    record = id_to_record.get(customer.get("customer_id"))
-
-    st.markdown(f"<h2 style='color: #005A9C; border-bottom: 2px solid #005A9C; padding-bottom: 0.5rem;'>📈 客戶風險總覽：{selected_name}</h2>", unsafe_allow_html=True)
-    st.markdown("<br>", unsafe_allow_html=True) # Add some space
-
-    # Customer Dashboard Metrics
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.metric(label="🆔 客戶ID", value=customer.get("customer_id", "N/A"))
-    with col2:
-        st.metric(label="🎂 年齡", value=f"{customer.get('age', 'N/A')} 歲")
-    with col3:
-        credit_rating_val = get_nested_value(record, "credit_rating", "N/A")
-        st.metric(label="🌟 信用評等", value=credit_rating_val)
-    with col4:
-        has_credit_alert = False
-        credit_alert_data = get_nested_value(record, "credit_alert", {})
-        if isinstance(credit_alert_data, dict):
-            if any(v for k, v in credit_alert_data.items() if isinstance(v, bool) and k != 'placeholder_for_no_alerts'):
-                has_credit_alert = True
-            elif any(v > 0 for k, v in credit_alert_data.items() if isinstance(v, int) and "count" in k.lower()):
-                has_credit_alert = True
-        st.metric(label="🚨 信用警示", value="⚠️ 有" if has_credit_alert else "✅ 無", help="檢查是否有信用卡逾期、呆帳等警示。")
-
-    st.markdown("<div style='margin-top: 1.5rem;'></div>", unsafe_allow_html=True) # Spacer
-
-    # Expander for Basic Info and Records
-    st.markdown('<div class="expander-styling">', unsafe_allow_html=True)
-    with st.expander("👤 詳細基本資料", expanded=False): # Default to not expanded
-        display_basic_info(customer, all_field_zh)
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    st.markdown('<div class="expander-styling">', unsafe_allow_html=True)
-    with st.expander("🗂️ 詳細過往紀錄", expanded=False): # Default to not expanded
-        if record:
-            display_records(record, all_field_zh)
-        else:
-            st.info("此客戶尚無過往紀錄可供顯示。")
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    st.markdown("<hr style='margin: 2rem 0;'>", unsafe_allow_html=True)
-    st.markdown(f"<h2 style='color: #005A9C; border-bottom: 2px solid #005A9C; padding-bottom: 0.5rem;'>🧠 STEP 2 : AI 智能承保分析</h2>", unsafe_allow_html=True)
-    st.markdown("<br>", unsafe_allow_html=True)
-
-    ai_col1, ai_col2 = st.columns([2,1]) # Ratio for description and button
-    with ai_col1:
-        st.markdown("""
-        <div class='info-card' style='background-color: #E9F5FF; border-left-color: #007BFF;'>
-            <h5 style='color:#0056B3'>🤖 AI 分析引擎</h5>
-            <p>點擊右側「執行 AI 分析」按鈕，系統將整合客戶的全面數據，運用先進的 AI 模型進行深度風險評估。模型將依據預設的承保規則庫（如財產保險、醫療險、壽險等）進行分析，並生成詳細的風險報告。</p>
-            <p style='font-size:0.9em; color:#555;'><i>若該客戶已有分析結果，您也可以直接點選下方按鈕查看歷史報告。</i></p>
-        </div>
-        """, unsafe_allow_html=True)
-
-    with ai_col2:
-        st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True) # Spacer for button alignment
-        if "ai_analysis_triggered_for" not in st.session_state:
-            st.session_state.ai_analysis_triggered_for = None
-        if "show_ai_result_for" not in st.session_state:
-            st.session_state.show_ai_result_for = None
-
-        if st.button("🚀 執行 AI 分析", key=f"exec_ai_{customer.get('customer_id')}", use_container_width=True, help="開始對此客戶進行 AI 承保風險分析。"):
-            st.session_state.ai_analysis_triggered_for = customer.get('customer_id')
-            st.session_state.show_ai_result_for = None
-            with st.spinner(f"對客戶 {selected_name} 的 AI 分析進行中，請稍候..."):
-                customer_data_for_api = customer.copy()
-                if record:
-                    for k, v in record.items():
-                        if k != "customer_id": customer_data_for_api[k] = v
-
-                # Determine base path for results, works if pages script is in 'pages' subdir
-                results_base_path = os.path.join(os.path.dirname(__file__), "..", "Results")
-                if not os.path.exists(results_base_path):
-                    os.makedirs(results_base_path) # Create Results dir if it doesn't exist
-
-                api_result = call_agent_api(customer_data_for_api, config_rules.config_rules)
-                if api_result:
-                    final_result_data = extract_final_results(api_result)
-                    if final_result_data:
-                        # Ensure Results directory exists (relative to the main script, Home.py)
-                        # This save_results call assumes agent_api_client.py handles path correctly,
-                        # or that 'Results' is in the same dir as Home.py or an absolute path is used internally.
-                        # For multi-page apps, file paths can be tricky.
-                        # Assuming save_results in agent_api_client.py writes to a 'Results' dir in the root.
-                        results_dir_in_root = os.path.join(os.path.dirname(__file__), "..", "Results")
-                        if not os.path.exists(results_dir_in_root):
-                            try:
-                                os.makedirs(results_dir_in_root)
-                            except OSError as e:
-                                st.error(f"無法創建 Results 資料夾於 {results_dir_in_root}: {e}")
-                                # Optionally, you might want to stop or handle this error differently
-
-                        # Call save_results WITHOUT base_path_override
-                        save_results(final_result_data, customer["customer_id"])
-                        st.session_state.show_ai_result_for = customer.get('customer_id')
-                        st.success(f"✅ AI 分析已為客戶 {selected_name} 完成並儲存結果！")
-                    else: st.error("⚠️ AI 回傳內容解析失敗。")
-                else: st.error("❌ API 呼叫失敗。")
-        st.markdown("<div style='height: 10px'></div>", unsafe_allow_html=True) # Spacer for button alignment
-
-    # Path to results, assuming 'Results' is in the root directory relative to where Home.py is run
-    # This needs to be relative to the location of THIS script (analysis_page.py) to find the root
-    results_dir_relative_to_root = os.path.join(os.path.dirname(__file__), "..", "Results")
-    result_path = os.path.join(results_dir_relative_to_root, f"result_{customer.get('customer_id')}.json")
-    ai_result_exists = os.path.exists(result_path)
-
-    if ai_result_exists and st.session_state.show_ai_result_for != customer.get('customer_id'):
-        if st.button(f"📜 顯示 {selected_name} 的歷史 AI 分析結果", key=f"show_hist_ai_{customer.get('customer_id')}", use_container_width=True):
-            st.session_state.show_ai_result_for = customer.get('customer_id')
-
-    if st.session_state.show_ai_result_for == customer.get('customer_id'):
-        if ai_result_exists:
-            with open(result_path, "r", encoding="utf-8") as f:
-                ai_result = json.load(f)
-
-            st.markdown("<hr style='margin: 2rem 0;'>", unsafe_allow_html=True)
-            st.markdown(f"<h3 style='color: #005A9C;'>📄 AI 分析結果報告：{selected_name}</h3>", unsafe_allow_html=True)
-            st.markdown("<br>", unsafe_allow_html=True)
-
-            sc_col1, sc_col2 = st.columns(2)
-            with sc_col1:
-                st.markdown(f"<div class='info-card' style='background-color: #E9F5FF; text-align:center;'><h5 style='margin-bottom:0.3rem;'>綜合評估總分</h5><p style='font-size:2.5em; font-weight:bold; color:#005A9C; margin-bottom:0;'>{ai_result.get('total_score', 'N/A')}</p></div>", unsafe_allow_html=True)
-            with sc_col2:
-                grade = ai_result.get('grade', 'N/A')
-                grade_color_map = {"A+": "#28A745", "A": "#28A745", "B": "#FFC107", "C": "#DC3545", "D": "#DC3545"}
-                grade_text_map = {"A+": "優良", "A": "良好", "B": "中等", "C": "警示", "D": "高風險"}
-                st.markdown(f"<div class='info-card' style='background-color: {grade_color_map.get(grade, '#F8F9FA')}20; text-align:center;'><h5 style='margin-bottom:0.3rem;'>風險評級</h5><p style='font-size:2.5em; font-weight:bold; color:{grade_color_map.get(grade, '#6C757D')}; margin-bottom:0;'>{grade} <span style='font-size:0.6em; vertical-align:middle;'>({grade_text_map.get(grade, '未知')})</span></p></div>", unsafe_allow_html=True)
-            st.markdown("<br>", unsafe_allow_html=True)
-
-            st.markdown("<h5>📊 分數評級區間參考</h5>", unsafe_allow_html=True)
-            score_colors_bg = {"A+": "#D4EDDA", "A": "#CFE2FF", "B": "#FFF3CD", "C": "#F8D7DA", "D": "#E9ECEF"}
-            score_colors_text = {"A+": "#155724", "A": "#004085", "B": "#856404", "C": "#721C24", "D": "#383D41"}
-            score_ranges = {"A+": "65～70分", "A": "55～64分", "B": "45～54分", "C": "40～44分", "D":"39分以下"}
-
-            html_score_table = "<table class='score-range-table'><thead><tr>"
-            for grade_key in score_ranges.keys():
-                html_score_table += f"<th style='background-color:{score_colors_bg.get(grade_key, '#F8F9FA')}; color:{score_colors_text.get(grade_key, '#212529')};'>{grade_key}</th>"
-            html_score_table += "</tr></thead><tbody><tr>"
-            for grade_key, range_val in score_ranges.items():
-                html_score_table += f"<td>{range_val}</td>"
-            html_score_table += "</tr></tbody></table>"
-            st.markdown(html_score_table, unsafe_allow_html=True)
-            st.markdown("<br>", unsafe_allow_html=True)
-
-            st.markdown("<h5>📜 規則合規詳細情況</h5>", unsafe_allow_html=True)
-            try:
-                rule_class_map = get_rule_class_map()
-                rule_required_map = get_rule_required_map()
-                class_desc_map = get_class_desc_map()
-            except Exception as e:
-                st.error(f"載入規則對照表時發生錯誤: {e}")
-                rule_class_map, rule_required_map, class_desc_map = {}, {}, {}
-
-            score_table_data = ai_result.get("score_table", [])
-            if score_table_data:
-                # --- Start: دقیقاً از原始代码 بازسازی شده برای جدول قوانین ---
-                table_data_orig = [] # Renamed to avoid conflict if processed_table_data is used later
-                rule_explain_map_orig = {item.get("項目", ""): item.get("規則", "") for item in score_table_data}
-
-                for item in score_table_data:
-                    keyword = item.get("項目", "")
-                    required_orig = rule_required_map.get(keyword, "○ 選擇")
-                    # 直接使用 get_rule_required_map() 的結果（已是"✶ 必要"或"○ 選擇"）
-                    required_str_orig = required_orig
-                    table_data_orig.append({
-                        "分數": item.get("分數", ""),
-                        "規則名稱": keyword, # Keep original keyword for logic
-                        "規則名稱顯示": all_field_zh.get(keyword, keyword), # For display
-                        "必要性": required_str_orig,
-                        "類別": rule_class_map.get(keyword, "未知")
-                    })
-
-                grouped_orig = OrderedDict()
-                for row_orig in table_data_orig:
-                    grouped_orig.setdefault(row_orig["類別"], []).append(row_orig)
-
-                class_colors_orig = ["#e6f2ff", "#f9f9d1", "#e8f6e8", "#ffe6e6", "#f3e6ff", "#fff2cc"]
-                class_color_map_orig = {}
-                for idx, k_orig in enumerate(grouped_orig.keys()):
-                    class_color_map_orig[k_orig] = class_colors_orig[idx % len(class_colors_orig)]
-
-                # Function to beautify rule description, from original logic (slightly modified for clarity)
-                def beautify_rule_desc_html_orig(desc_str):
-                    import re
-                    items = re.split(r'[；;\n]+', desc_str)
-                    items = [i.strip() for i in items if i.strip()]
-                    html_list_items = []
-                    for item_text in items: # Renamed item to item_text
-                        if '：' in item_text:
-                            k_part, v_part = item_text.split('：', 1)
-                            v_part = v_part.strip()
-                            if not v_part.endswith('分'):
-                                v_part = v_part + '分'
-                            html_list_items.append(f'<li>📊 <b>{k_part}</b>：<span style="color:#1a5fb4;font-weight:bold">{v_part}</span></li>')
-                        elif ':' in item_text: # Fallback for colon
-                            k_part, v_part = item_text.split(':', 1)
-                            v_part = v_part.strip()
-                            if not v_part.endswith('分'):
-                                v_part = v_part + '分'
-                            html_list_items.append(f'<li>📊 <b>{k_part}</b>：<span style="color:#1a5fb4;font-weight:bold">{v_part}</span></li>')
-                        else:
-                            html_list_items.append(f'<li>{item_text}</li>')
-                    return '<ul style="margin:0 0 0 1em;padding:0;list-style:none;text-align:left;">' + ''.join(html_list_items) + '</ul>' if html_list_items else desc_str
-
-                html_orig_rules_table = '''<style>
-                .original-score-table th, .original-score-table td {
-                    border:1px solid #bbb;
-                    border-bottom:3.5px solid #2c5c88; /* Original thicker bottom border */
-                    padding:8px 12px;
-                    text-align:center;
-                    font-size:16px;
-                }
-                .original-score-table th { background:#2c5c88; color:#fff; }
-                .original-score-table .class-cell { cursor: help; position:relative; } /* Changed from pointer to help */
-                .original-score-table .class-tooltip {
-                    display:none; position:absolute; left:50%; /* Centered relative to parent */
-                    bottom: 100%; /* Position above the parent */
-                    transform: translateX(-50%) translateY(-5px); /* Center and slight offset up */
-                    background:#fff; color:#222; border:1.5px solid #2c5c88; border-radius:10px;
-                    padding:16px 20px; min-width:280px; max-width:500px; /* Adjusted width */
-                    box-shadow:0 5px 15px rgba(0,0,0,0.15); z-index:999999 !important; /* High z-index */
-                    font-size:15px; /* Adjusted font size */
-                    text-align:left; white-space:pre-line; word-break:break-all;
-                    opacity:0; visibility: hidden; transition: opacity 0.2s ease, visibility 0.2s ease; /* Smooth transition */
-                }
-                .original-score-table .class-cell:hover .class-tooltip { display:block; opacity:1; visibility: visible; }
-
-                .original-score-table .rule-link { color: #222; text-decoration: none; cursor: help; position:relative; }
-                .original-score-table td { background:#fff; }
-                .original-score-table .rule-tooltip {
-                    display:none; position:absolute; left:50%; /* Centered relative to parent */
-                    bottom: 100%; /* Position above the parent */
-                    transform: translateX(-50%) translateY(-5px); /* Center and slight offset up */
-                    background:#fff; color:#222; border:1.5px solid #1a5fb4; border-radius:8px;
-                    padding:10px 16px; min-width:250px; max-width:400px; /* Adjusted width */
-                    box-shadow:0 5px 15px rgba(0,0,0,0.15); z-index:999999 !important; /* High z-index */
-                    font-size:14px; /* Adjusted font size */
-                    text-align:left; white-space:pre-line; word-break:break-all;
-                    opacity:0; visibility: hidden; transition: opacity 0.2s ease, visibility 0.2s ease; /* Smooth transition */
-                }
-                .original-score-table .rule-link:hover .rule-tooltip { display:block; opacity:1; visibility: visible; }
-                /* Ensure table container allows overflow if tooltips are cut by Streamlit's component wrapper */
-                .stHtml iframe { overflow: visible !important; }
-                /* It might be necessary to target the specific div Streamlit wraps around the component,
-                   which can be found using browser developer tools. This is a general attempt. */
-                div[data-testid="stHtml"] > div { overflow: visible !important; }
-                </style>
-                <div><table class="original-score-table" style="border-collapse:collapse;width:100%;min-width:600px;">
-                <thead><tr><th>分數</th><th>規則名稱</th><th>必要性</th><th>類別</th></tr></thead><tbody>
-                ''' # Added thead and tbody for structure
-                for idx_orig, (cls_orig, rows_orig) in enumerate(grouped_orig.items()):
-                    rowspan_orig = len(rows_orig)
-                    color_orig = class_color_map_orig.get(cls_orig, "#FFFFFF")
-                    for i_orig, row_item_orig in enumerate(rows_orig):
-                        html_orig_rules_table += "<tr>"
-                        html_orig_rules_table += f"<td>{row_item_orig['分數']}</td>"
-
-                        rule_key_orig = row_item_orig['規則名稱']
-                        rule_desc_orig = rule_explain_map_orig.get(rule_key_orig, '')
-                        beautified_desc_orig = beautify_rule_desc_html_orig(rule_desc_orig)
-
-                        html_orig_rules_table += f"<td><span class='rule-link'>{row_item_orig['規則名稱顯示']}<span class='rule-tooltip'>{beautified_desc_orig}</span></span></td>"
-                        html_orig_rules_table += f"<td>{row_item_orig['必要性']}</td>"
-
-                        if i_orig == 0:
-                            desc_cls_orig = class_desc_map.get(cls_orig, "")
-                            html_orig_rules_table += f"<td rowspan='{rowspan_orig}' class='class-cell' style='background-color:{color_orig};font-weight:bold;min-width:90px;position:relative;'>{cls_orig}"
-                            if desc_cls_orig:
-                                html_orig_rules_table += f"<span class='class-tooltip'><b>📂 {cls_orig}</b><br>{desc_cls_orig}</span>"
-                            html_orig_rules_table += "</td>"
-                        html_orig_rules_table += "</tr>"
-                html_orig_rules_table += "</tbody></table></div>"
-
-                # Displaying the original-style table
-                components.html(html_orig_rules_table, height=max(450, len(table_data_orig) * 50 + len(grouped_orig) * 25), scrolling=True)
-                # --- End: دقیقاً از原始代码 بازسازی شده برای جدول قوانین ---
+JOB_STATUS_ICONS = {QUEUED: "🕒", RUNNING: "⏳", DONE: "✅", "failed": "❌", "cancelled": "🚫"}
+
+
+def session_jobs():
+    """Background analysis jobs queued from this session (oldest first); jobs pruned by the executor are skipped."""
+    return [job for job in map(job_executor.get, st.session_state.analysis_job_ids) if job]
+
+
+def render_job(job):
+    """One row of the job panel: status, progress and, once finished, the score/grade."""
+    icon = JOB_STATUS_ICONS.get(job.status, "•")
+    line = f"{icon} **{job.label}**（{job.customer_id}）— {job.stage}"
+    if job.status == RUNNING:
+        line += f"，{job.elapsed():.0f} 秒" + (f"，已接收 {job.received_chars} 字" if job.received_chars else "")
+    elif job.status == DONE and job.result:
+        line += f"：總分 {job.result.get('total_score', 'N/A')}，評級 {job.result.get('grade', 'N/A')}（{job.elapsed():.1f} 秒）"
+    elif job.error:
+        line += f"：{job.error}"
+    col_text, col_action = st.columns([5, 1])
+    col_text.markdown(line)
+    if job.status == QUEUED and col_action.button("取消", key=f"cancel_job_{job.id}"):
+        job_executor.cancel(job.id)
+    if job.status == RUNNING and job.partial_text:
+        narrative = extract_streaming_field(job.partial_text, "專家綜合說明")
+        if narrative:
+            st.caption(f"🧐 {narrative[-200:]}▌")
+
+
+def job_panel(selected_customer_id):
+    """Polls this session's jobs; when one finishes, the whole page reruns so its report shows up."""
+    jobs = session_jobs()
+    finished = [job for job in jobs if job.finished and job.id not in st.session_state.seen_finished_jobs]
+    if finished:
+        for job in finished:
+            st.session_state.seen_finished_jobs.add(job.id)
+            st.session_state.last_trace_id = job.trace_id or st.session_state.get("last_trace_id")
+            if job.status == DONE:
+                st.session_state.job_notices.append(f"✅ {job.label} 的 AI 分析已完成" + ("（資料與規則未變動，沿用先前結果）" if job.from_cache else ""))
+                if job.customer_id == selected_customer_id:
+                    st.session_state.show_ai_result_for = job.customer_id
+            elif job.error:
+                st.session_state.job_notices.append(f"❌ {job.label} 的 AI 分析失敗：{job.error}")
+        st.rerun()
+    while st.session_state.job_notices:
+        st.toast(st.session_state.job_notices.pop(0))
+
+    if not jobs:
+        return
+    with st.expander(f"📋 分析工作（{sum(not job.finished for job in jobs)} 件進行中，共 {len(jobs)} 件）", expanded=True):
+        for job in reversed(jobs):
+            render_job(job)
+        if any(job.finished for job in jobs) and st.button("清除已結束的工作", key="clear_finished_jobs"):
+            st.session_state.analysis_job_ids = [job.id for job in jobs if not job.finished]
+            st.rerun()
+
+
+def render_trace_waterfall(spans):
+    """Renders the spans of one trace as a waterfall (bar offset/width proportional to start time/duration)."""
+    rows = waterfall(spans)
+    if not rows:
+        st.info("尚無效能紀錄。")
+        return
+    total_ms = max(row["offset_ms"] + row["duration_ms"] for row in rows) or 1
+    html = "<table style='width:100%; border-collapse:collapse; font-size:0.85em;'>"
+    for row in rows:
+        left = row["offset_ms"] / total_ms * 100
+        width = max(row["duration_ms"] / total_ms * 100, 0.5)
+        color = "#DC3545" if row["status"] == "error" else "#005A9C"
+        attrs = ", ".join(f"{k}={v}" for k, v in row["attrs"].items())
+        html += (f"<tr title='{attrs}'><td style='white-space:nowrap; padding:2px 8px 2px {row['depth'] * 16}px;'>{row['name']}</td>"
+                 f"<td style='width:60%; padding:2px 0;'><div style='position:relative; height:14px; background:#F1F3F5;'>"
+                 f"<div style='position:absolute; left:{left:.2f}%; width:{width:.2f}%; height:100%; background:{color};'></div></div></td>"
+                 f"<td style='text-align:right; padding:2px 8px; white-space:nowrap;'>{row['duration_ms']:,.1f} ms</td></tr>")
+    html += "</table>"
+    st.markdown(html, unsafe_allow_html=True)
+
+
+# --- Rule lookups from config_rules ---
+# Root span for this rerun; the AI analysis spans below are recorded as its children.
+# st.stop()/st.rerun() abort the script with BaseException-based control-flow exceptions, so the span is
+# ended in finally (as a normal end) and only real errors are recorded on it.
+page_render_span = span("page.render", new_trace=True, page="analysis_page")
+try:
+    # --- Load Data ---
+    # Shared across sessions by customer_data; files are re-parsed only when their mtime/size changes
+    customer_data_source = get_customer_data()
+    customers, customer_dict, id_to_record = customer_data_source.snapshot()
+    if customer_data_source.last_error:
+        st.error(f"錯誤：客戶資料載入失敗（{customer_data_source.last_error}）。請確認檔案路徑與 JSON 格式是否正確。")
+
+    # --- Background analysis jobs (executor shared across sessions, job list per session) ---
+    job_executor = get_job_executor()
+    if "job_owner" not in st.session_state:
+        st.session_state.job_owner = uuid.uuid4().hex
+    if "analysis_job_ids" not in st.session_state:
+        st.session_state.analysis_job_ids = []
+    if "seen_finished_jobs" not in st.session_state:
+        st.session_state.seen_finished_jobs = set()
+    if "job_notices" not in st.session_state:
+        st.session_state.job_notices = []
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.5"))
+
+    # --- Main Application UI ---
+    st.markdown("<h1 style='text-align: center; color: #003366;'>智慧承保風險評估</h1>", unsafe_allow_html=True)
+    st.markdown("<p style='text-align: center; color: #4B5563; margin-bottom: 2rem;'><i>選擇客戶以載入資料並執行 AI 風險分析</i></p>", unsafe_allow_html=True)
+
+
+    if not customers:
+        st.warning("無法載入客戶列表。請檢查資料檔案。")
+        st.stop()
+
+    names = [""] + [c["name"] for c in customers if c.get("name")]
+    if len(names) == 1: # Only blank option
+        st.warning("客戶名單中沒有有效的客戶名稱可供選擇。")
+        st.stop()
+
+    selected_name = st.selectbox(" STEP 1 : 👤 請選擇客戶姓名進行分析", names, index=0, help="從列表中選擇一位客戶以載入其詳細資料和過往紀錄。")
+
+    if selected_name and selected_name in customer_dict:
+        customer = customer_dict[selected_name]
+        record = id_to_record.get(customer.get("customer_id"))
+
+        st.markdown(f"<h2 style='color: #005A9C; border-bottom: 2px solid #005A9C; padding-bottom: 0.5rem;'>📈 客戶風險總覽：{selected_name}</h2>", unsafe_allow_html=True)
+        st.markdown("<br>", unsafe_allow_html=True) # Add some space
+
+        # Customer Dashboard Metrics
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric(label="🆔 客戶ID", value=customer.get("customer_id", "N/A"))
+        with col2:
+            st.metric(label="🎂 年齡", value=f"{customer.get('age', 'N/A')} 歲")
+        with col3:
+            credit_rating_val = get_nested_value(record, "credit_rating", "N/A")
+            st.metric(label="🌟 信用評等", value=credit_rating_val)
+        with col4:
+            has_credit_alert = False
+            credit_alert_data = get_nested_value(record, "credit_alert", {})
+            if isinstance(credit_alert_data, dict):
+                if any(v for k, v in credit_alert_data.items() if isinstance(v, bool) and k != 'placeholder_for_no_alerts'):
+                    has_credit_alert = True
+                elif any(v > 0 for k, v in credit_alert_data.items() if isinstance(v, int) and "count" in k.lower()):
+                    has_credit_alert = True
+            st.metric(label="🚨 信用警示", value="⚠️ 有" if has_credit_alert else "✅ 無", help="檢查是否有信用卡逾期、呆帳等警示。")
+
+        st.markdown("<div style='margin-top: 1.5rem;'></div>", unsafe_allow_html=True) # Spacer
+
+        # Expander for Basic Info and Records
+        st.markdown('<div class="expander-styling">', unsafe_allow_html=True)
+        with st.expander("👤 詳細基本資料", expanded=False): # Default to not expanded
+            display_basic_info(customer, all_field_zh)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        st.markdown('<div class="expander-styling">', unsafe_allow_html=True)
+        with st.expander("🗂️ 詳細過往紀錄", expanded=False): # Default to not expanded
+            if record:
+                display_records(record, all_field_zh)
             else:
-                st.info("AI分析結果中未包含詳細的規則分數表。")
-
-            st.markdown("<div style='margin-top: 1.5rem; margin-bottom: 0.5rem;'></div>", unsafe_allow_html=True) # Adjusted spacing
-
-            st.markdown("<h5>🧑‍⚖️ 專家洞察與建議</h5>", unsafe_allow_html=True)
-            # Removed the negative margin div, will control spacing with card margins or specific spacers if needed.
+                st.info("此客戶尚無過往紀錄可供顯示。")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        st.markdown("<hr style='margin: 2rem 0;'>", unsafe_allow_html=True)
+        st.markdown(f"<h2 style='color: #005A9C; border-bottom: 2px solid #005A9C; padding-bottom: 0.5rem;'>🧠 STEP 2 : AI 智能承保分析</h2>", unsafe_allow_html=True)
+        st.markdown("<br>", unsafe_allow_html=True)
+
+        ai_col1, ai_col2 = st.columns([2,1]) # Ratio for description and button
+        with ai_col1:
+            st.markdown("""
+            <div class='info-card' style='background-color: #E9F5FF; border-left-color: #007BFF;'>
+                <h5 style='color:#0056B3'>🤖 AI 分析引擎</h5>
+                <p>點擊右側「執行 AI 分析」按鈕，系統將整合客戶的全面數據，運用先進的 AI 模型進行深度風險評估。模型將依據預設的承保規則庫（如財產保險、醫療險、壽險等）進行分析，並生成詳細的風險報告。</p>
+                <p style='font-size:0.9em; color:#555;'><i>若該客戶已有分析結果，您也可以直接點選下方按鈕查看歷史報告。</i></p>
+            </div>
+            """, unsafe_allow_html=True)
 
+        with ai_col2:
+            st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True) # Spacer for button alignment
+            if "ai_analysis_triggered_for" not in st.session_state:
+                st.session_state.ai_analysis_triggered_for = None
+            if "show_ai_result_for" not in st.session_state:
+                st.session_state.show_ai_result_for = None
+
+            if st.button("🚀 執行 AI 分析", key=f"exec_ai_{customer.get('customer_id')}", use_container_width=True, help="將此客戶加入背景分析佇列；可繼續選擇其他客戶排入佇列。"):
+                st.session_state.ai_analysis_triggered_for = customer.get('customer_id')
+                st.session_state.show_ai_result_for = None
+                # Deep-copied merge: the snapshot records are shared across sessions and must not be mutated
+                customer_data_for_api = merge_customer_data(customer, record)
+
+                # Runs on the shared background executor; the job panel below polls its progress
+                job = job_executor.submit(customer_data_for_api, config_rules.config_rules,
+                                          owner=st.session_state.job_owner, label=selected_name)
+                if job.id not in st.session_state.analysis_job_ids:
+                    st.session_state.analysis_job_ids.append(job.id)
+                st.info(f"📨 已將客戶 {selected_name} 加入分析佇列，完成後將自動顯示結果。")
+            st.markdown("<div style='height: 10px'></div>", unsafe_allow_html=True) # Spacer for button alignment
+
+        # Latest analysis for this customer from the results store (falls back to Results/result_<id>.json)
+        ai_result = load_latest_result(customer.get('customer_id'))
+        ai_result_exists = ai_result is not None
+
+        if ai_result_exists and st.session_state.show_ai_result_for != customer.get('customer_id'):
+            if st.button(f"📜 顯示 {selected_name} 的歷史 AI 分析結果", key=f"show_hist_ai_{customer.get('customer_id')}", use_container_width=True):
+                st.session_state.show_ai_result_for = customer.get('customer_id')
+
+        if st.session_state.show_ai_result_for == customer.get('customer_id'):
+            if ai_result_exists:
+                st.markdown("<hr style='margin: 2rem 0;'>", unsafe_allow_html=True)
+                st.markdown(f"<h3 style='color: #005A9C;'>📄 AI 分析結果報告：{selected_name}</h3>", unsafe_allow_html=True)
+                st.markdown("<br>", unsafe_allow_html=True)
+
+                sc_col1, sc_col2 = st.columns(2)
+                with sc_col1:
+                    st.markdown(f"<div class='info-card' style='background-color: #E9F5FF; text-align:center;'><h5 style='margin-bottom:0.3rem;'>綜合評估總分</h5><p style='font-size:2.5em; font-weight:bold; color:#005A9C; margin-bottom:0;'>{ai_result.get('total_score', 'N/A')}</p></div>", unsafe_allow_html=True)
+                with sc_col2:
+                    grade = ai_result.get('grade', 'N/A')
+                    grade_color_map = {"A+": "#28A745", "A": "#28A745", "B": "#FFC107", "C": "#DC3545", "D": "#DC3545"}
+                    grade_text_map = {"A+": "優良", "A": "良好", "B": "中等", "C": "警示", "D": "高風險"}
+                    st.markdown(f"<div class='info-card' style='background-color: {grade_color_map.get(grade, '#F8F9FA')}20; text-align:center;'><h5 style='margin-bottom:0.3rem;'>風險評級</h5><p style='font-size:2.5em; font-weight:bold; color:{grade_color_map.get(grade, '#6C757D')}; margin-bottom:0;'>{grade} <span style='font-size:0.6em; vertical-align:middle;'>({grade_text_map.get(grade, '未知')})</span></p></div>", unsafe_allow_html=True)
+                st.markdown("<br>", unsafe_allow_html=True)
+
+                st.markdown("<h5>📊 分數評級區間參考</h5>", unsafe_allow_html=True)
+                score_colors_bg = {"A+": "#D4EDDA", "A": "#CFE2FF", "B": "#FFF3CD", "C": "#F8D7DA", "D": "#E9ECEF"}
+                score_colors_text = {"A+": "#155724", "A": "#004085", "B": "#856404", "C": "#721C24", "D": "#383D41"}
+                score_ranges = {"A+": "65～70分", "A": "55～64分", "B": "45～54分", "C": "40～44分", "D":"39分以下"}
+
+                html_score_table = "<table class='score-range-table'><thead><tr>"
+                for grade_key in score_ranges.keys():
+                    html_score_table += f"<th style='background-color:{score_colors_bg.get(grade_key, '#F8F9FA')}; color:{score_colors_text.get(grade_key, '#212529')};'>{grade_key}</th>"
+                html_score_table += "</tr></thead><tbody><tr>"
+                for grade_key, range_val in score_ranges.items():
+                    html_score_table += f"<td>{range_val}</td>"
+                html_score_table += "</tr></tbody></table>"
+                st.markdown(html_score_table, unsafe_allow_html=True)
+                st.markdown("<br>", unsafe_allow_html=True)
+
+                st.markdown("<h5>📜 規則合規詳細情況</h5>", unsafe_allow_html=True)
+                score_table_data = ai_result.get("score_table", [])
+                if score_table_data:
+                    # Same table as 客戶資料查詢.py: rows grouped by class, hover tooltips for rule and class descriptions
+                    try:
+                        rule_index = get_rule_index(config_rules.config_rules)
+                    except Exception as e:
+                        st.error(f"載入規則對照表時發生錯誤: {e}")
+                        rule_index = RuleIndex({})
+                    class_count = len({rule_index.keyword_class.get(item.get("項目", ""), "未知") for item in score_table_data})
+                    components.html(build_score_table_html(ai_result, rule_index),
+                                    height=max(450, len(score_table_data) * 50 + class_count * 25), scrolling=True)
+                else:
+                    st.info("AI分析結果中未包含詳細的規則分數表。")
+
+                st.markdown("<div style='margin-top: 1.5rem; margin-bottom: 0.5rem;'></div>", unsafe_allow_html=True) # Adjusted spacing
+
+                st.markdown("<h5>🧑‍⚖️ 專家洞察與建議</h5>", unsafe_allow_html=True)
+
+                summary_cols = st.columns(2, gap="large")
+                with summary_cols[0]:
+                    st.markdown(f"""
+                    <div class='info-card' style='height:100%; border-left-color:#28A745; margin-top:0.5rem;'>
+                        <h6 style='color:#28A745; display:flex; align-items:center; margin-bottom: 0.6rem; font-size:1.35em;'>
+                            <span style='font-size:1.7em; margin-right:0.5em;'>👍</span> 優點
+                        </h6>
+                    """, unsafe_allow_html=True)
+                    advantages = ai_result.get('優點', [])
+                    if advantages:
+                        for adv in advantages: st.markdown(f"<p style='font-size:0.9em; margin-bottom:0.2rem;'>• {adv}</p>", unsafe_allow_html=True)
+                    else: st.markdown("<p style='font-size:0.9em;'><i>暫無記錄</i></p>", unsafe_allow_html=True)
+                    st.markdown("</div>", unsafe_allow_html=True)
+
+                with summary_cols[1]:
+                    st.markdown(f"""
+                    <div class='info-card' style='height:100%; border-left-color:#DC3545; margin-top:0.5rem;'>
+                        <h6 style='color:#DC3545; display:flex; align-items:center; margin-bottom: 0.6rem; font-size:1.35em;'>
+                            <span style='font-size:1.7em; margin-right:0.5em;'>👎</span> 風險
+                        </h6>
+                    """, unsafe_allow_html=True)
+                    risks = ai_result.get('風險', [])
+                    if risks:
+                        for risk_item in risks: st.markdown(f"<p style='font-size:0.9em; margin-bottom:0.2rem;'>• {risk_item}</p>", unsafe_allow_html=True)
+                    else: st.markdown("<p style='font-size:0.9em;'><i>暫無記錄</i></p>", unsafe_allow_html=True)
+                    st.markdown("</div>", unsafe_allow_html=True)
+
+                # st.markdown("<br>", unsafe_allow_html=True)
 
-            summary_cols = st.columns(2, gap="large")
-            with summary_cols[0]:
                 st.markdown(f"""
-                <div class='info-card' style='height:100%; border-left-color:#28A745; margin-top:0.5rem;'>
-                    <h6 style='color:#28A745; display:flex; align-items:center; margin-bottom: 0.6rem; font-size:1.35em;'>
-                        <span style='font-size:1.7em; margin-right:0.5em;'>👍</span> 優點
+                <div class='info-card' style='border-left-color:#007BFF; margin-top:1rem;'>
+                    <h6 style='color:#007BFF; display:flex; align-items:center; margin-bottom: 0.6rem; font-size:1.35em;'>
+                        <span style='font-size:1.7em; margin-right:0.5em;'>📝</span> 建議
                     </h6>
                 """, unsafe_allow_html=True)
-                advantages = ai_result.get('優點', [])
-                if advantages:
-                    for adv in advantages: st.markdown(f"<p style='font-size:0.9em; margin-bottom:0.2rem;'>• {adv}</p>", unsafe_allow_html=True)
+                suggestions = ai_result.get('建議', [])
+                if suggestions:
+                    for sug in suggestions: st.markdown(f"<p style='font-size:0.9em; margin-bottom:0.2rem;'>• {sug}</p>", unsafe_allow_html=True)
                 else: st.markdown("<p style='font-size:0.9em;'><i>暫無記錄</i></p>", unsafe_allow_html=True)
                 st.markdown("</div>", unsafe_allow_html=True)
 
-            with summary_cols[1]:
                 st.markdown(f"""
-                <div class='info-card' style='height:100%; border-left-color:#DC3545; margin-top:0.5rem;'>
-                    <h6 style='color:#DC3545; display:flex; align-items:center; margin-bottom: 0.6rem; font-size:1.35em;'>
-                        <span style='font-size:1.7em; margin-right:0.5em;'>👎</span> 風險
+                <div class='info-card' style='background-color:#F8F9FA; border-left-color:#6F42C1; margin-top:1rem;'>
+                    <h6 style='color:#6F42C1; display:flex; align-items:center; margin-bottom: 0.6rem; font-size:1.35em;'>
+                        <span style='font-size:1.7em; margin-right:0.5em;'>🧐</span> 專家綜合說明
                     </h6>
                 """, unsafe_allow_html=True)
-                risks = ai_result.get('風險', [])
-                if risks:
-                    for risk_item in risks: st.markdown(f"<p style='font-size:0.9em; margin-bottom:0.2rem;'>• {risk_item}</p>", unsafe_allow_html=True)
-                else: st.markdown("<p style='font-size:0.9em;'><i>暫無記錄</i></p>", unsafe_allow_html=True)
+                expert_summary = ai_result.get('專家綜合說明', '無相關綜合說明。')
+                st.markdown(f"<p style='font-size:0.95em; line-height:1.6;'>{expert_summary}</p>", unsafe_allow_html=True)
                 st.markdown("</div>", unsafe_allow_html=True)
 
-            # st.markdown("<br>", unsafe_allow_html=True)
-
-            st.markdown(f"""
-            <div class='info-card' style='border-left-color:#007BFF; margin-top:1rem;'>
-                <h6 style='color:#007BFF; display:flex; align-items:center; margin-bottom: 0.6rem; font-size:1.35em;'>
-                    <span style='font-size:1.7em; margin-right:0.5em;'>📝</span> 建議
-                </h6>
-            """, unsafe_allow_html=True)
-            suggestions = ai_result.get('建議', [])
-            if suggestions:
-                for sug in suggestions: st.markdown(f"<p style='font-size:0.9em; margin-bottom:0.2rem;'>• {sug}</p>", unsafe_allow_html=True)
-            else: st.markdown("<p style='font-size:0.9em;'><i>暫無記錄</i></p>", unsafe_allow_html=True)
-            st.markdown("</div>", unsafe_allow_html=True)
-
-            st.markdown(f"""
-            <div class='info-card' style='background-color:#F8F9FA; border-left-color:#6F42C1; margin-top:1rem;'>
-                <h6 style='color:#6F42C1; display:flex; align-items:center; margin-bottom: 0.6rem; font-size:1.35em;'>
-                    <span style='font-size:1.7em; margin-right:0.5em;'>🧐</span> 專家綜合說明
-                </h6>
-            """, unsafe_allow_html=True)
-            expert_summary = ai_result.get('專家綜合說明', '無相關綜合說明。')
-            st.markdown(f"<p style='font-size:0.95em; line-height:1.6;'>{expert_summary}</p>", unsafe_allow_html=True)
-            st.markdown("</div>", unsafe_allow_html=True)
-
-        elif st.session_state.ai_analysis_triggered_for == customer.get('customer_id'):
-             st.warning(f"AI 分析結果檔案 ({result_path}) 未找到，但分析流程已執行。請確認檔案儲存路徑或稍後再試。")
-elif names and "" in names and len(names) > 1 and not selected_name :
-    st.info("👈 請從上方下拉選單中選擇一位客戶以開始分析。")
-
-st.markdown("<hr style='margin: 3rem 0 1rem 0;'>", unsafe_allow_html=True)
-st.markdown("<p style='text-align:center; color: #6C757D; font-size:0.9em;'>© 2024 智慧承保風險評估平台</p>", unsafe_allow_html=True)
+            elif st.session_state.ai_analysis_triggered_for == customer.get('customer_id'):
+                 st.warning(f"客戶 {customer.get('customer_id')} 的 AI 分析結果未找到，但分析流程已執行。請確認結果庫路徑或稍後再試。")
+    elif names and "" in names and len(names) > 1 and not selected_name :
+        st.info("👈 請從上方下拉選單中選擇一位客戶以開始分析。")
+
+    # Job panel: polls only while this session has unfinished jobs
+    st.fragment(run_every=JOB_POLL_SECONDS if any(not job.finished for job in session_jobs()) else None)(job_panel)(
+        customer.get("customer_id") if selected_name and selected_name in customer_dict else None)
+
+    # Optional performance panel (PERF_PANEL=0 hides it): waterfall of this session's last AI analysis run
+    if env_flag("PERF_PANEL", True):
+        with st.expander("⏱️ 效能分析（最近一次 AI 分析）", expanded=False):
+            for stats in customer_data_source.stats():
+                if stats["load_ms"] is not None:
+                    st.caption(f"📂 {stats['file']}：{stats['records']} 筆，第 {stats['version']} 版，"
+                               f"解析 {stats['load_ms']:.1f} ms（{datetime.fromtimestamp(stats['loaded_at']):%H:%M:%S} 載入）")
+            # Current per-endpoint / per-product timeouts derived from the rolling latency histograms
+            for row in get_adaptive_timeouts().snapshot():
+                if row["quantile_seconds"] is not None:
+                    st.caption(f"⏳ {row['endpoint']}／{row['product']}：p{row['quantile'] * 100:g} {row['quantile_seconds']:.1f} 秒"
+                               f"（{row['samples']} 筆）→ 逾時 {row['timeout']:.1f} 秒"
+                               f"{'' if row['source'] == 'observed' else '（樣本不足，使用預設值）'}")
+            if st.session_state.get("last_trace_id"):
+                render_trace_waterfall(get_trace(st.session_state.last_trace_id))
+
+    st.markdown("<hr style='margin: 3rem 0 1rem 0;'>", unsafe_allow_html=True)
+    st.markdown("<p style='text-align:center; color: #6C757D; font-size:0.9em;'>© 2024 智慧承保風險評估平台</p>", unsafe_allow_html=True)
+except Exception as e:
+    page_render_span.end(error=e)
+    raise
+finally:
+    page_render_span.end()
@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import logging
+
+from env_flags import env_flag
+from rule_compiler import get_projector
+
+logger = logging.getLogger(__name__)
+
+# 精簡 payload 時一律保留的識別欄位
+IDENTITY_FIELDS = ("customer_id", "name", "希望購買保單")
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def build_payload(customer_data: dict, rules: dict) -> dict:
+    """
+    封裝送往 Langflow 的 payload（input_value 為客戶資訊與規則的 JSON 字串）
+    """
+    input_content = {
+        "customer_info": customer_data,
+        "rules": rules
+    }
+    return {
+        "input_value": json.dumps(input_content, ensure_ascii=False),
+        "output_type": "chat",
+        "input_type": "chat",
+        "tweaks": {}
+    }
+
+
+def select_rule_group(customer_data: dict, rules: dict):
+    """
+    依 customer_data["希望購買保單"] 選出對應的規則組，回傳 (規則組名稱, 規則 list)；找不到回傳 (None, None)
+    """
+    product = (customer_data or {}).get("希望購買保單")
+    group_name = f"{product}規則"
+    if product and group_name in rules:
+        return group_name, rules[group_name]
+    return None, None
+
+
+def project_customer(customer_data: dict, keywords, identity_fields=IDENTITY_FIELDS) -> dict:
+    """
+    只保留規則 keywords 引用到的欄位（dotted path，清單欄位會逐筆投影）與識別欄位
+    """
+    projector = get_projector(tuple(identity_fields) + tuple(keywords))
+    return projector(customer_data or {})
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗估 LLM token 數：中日韓字元約 1 字 1 token，其餘字元約 4 字 1 token
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def payload_saving(full_payload: dict, slim_payload: dict) -> dict:
+    """
+    比較完整與精簡 payload 的 input_value 大小，回傳位元組與估計 token 節省量
+    """
+    full_text = full_payload["input_value"]
+    slim_text = slim_payload["input_value"]
+    full_bytes = len(full_text.encode("utf-8"))
+    slim_bytes = len(slim_text.encode("utf-8"))
+    full_tokens = estimate_tokens(full_text)
+    slim_tokens = estimate_tokens(slim_text)
+    return {
+        "full_bytes": full_bytes,
+        "slim_bytes": slim_bytes,
+        "saved_bytes": full_bytes - slim_bytes,
+        "full_tokens": full_tokens,
+        "slim_tokens": slim_tokens,
+        "saved_tokens": full_tokens - slim_tokens,
+        "saved_ratio": (1 - slim_bytes / full_bytes) if full_bytes else 0.0,
+    }
+
+
+def build_slim_payload(customer_data: dict, rules: dict):
+    """
+    依希望購買保單只帶入對應的一組規則，並將客戶資料投影到該規則組引用的欄位
+    Returns:
+        tuple: (payload, 節省量報告 dict)；找不到對應規則組時回傳完整 payload 與 None
+    """
+    group_name, rule_group = select_rule_group(customer_data, rules)
+    full_payload = build_payload(customer_data, rules)
+    if rule_group is None:
+        logger.warning(f"找不到「{(customer_data or {}).get('希望購買保單')}」對應的規則組，改送完整 payload")
+        return full_payload, None
+    keywords = [kw for rule in rule_group for kw in rule.get("keywords", [])]
+    slim_payload = build_payload(project_customer(customer_data, keywords), {group_name: rule_group})
+    return slim_payload, payload_saving(full_payload, slim_payload)
+
+
+def slim_payload_enabled():
+    """
+    是否送出精簡 payload（只含對應保單的規則組與其引用的欄位），預設關閉，可由環境變數 AGENT_SLIM_PAYLOAD=1 開啟。
+    精簡後 LLM 看不到其他欄位，專家綜合說明等內容可能與完整 payload 不同，需確認可接受後再開啟
+    """
+    return env_flag("AGENT_SLIM_PAYLOAD")
+
+
+def build_agent_payload(customer_data: dict, rules: dict, slim=None) -> dict:
+    """
+    建立實際送出的 payload；slim 預設依 slim_payload_enabled()（AGENT_SLIM_PAYLOAD，預設關閉，送出完整 payload）
+    """
+    if slim is None:
+        slim = slim_payload_enabled()
+    if not slim:
+        return build_payload(customer_data, rules)
+    payload, report = build_slim_payload(customer_data, rules)
+    if report:
+        logger.info(
+            f"精簡 payload：{report['full_bytes']} → {report['slim_bytes']} bytes，"
+            f"估計節省 {report['saved_tokens']} tokens（{report['saved_ratio']:.0%}）"
+        )
+    return payload
+
+
+if __name__ == "__main__":
+    # 統計每位客戶精簡 payload 的節省量
+    import config_rules
+    from customer_store import merge_customer_data
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(base_dir, "客戶基本資訊/基本資訊.json"), "r", encoding="utf-8") as f:
+        basic_info = json.load(f)
+    with open(os.path.join(base_dir, "客戶過往紀錄/過往紀錄.json"), "r", encoding="utf-8") as f:
+        history_by_id = {h.get("customer_id"): h for h in json.load(f)}
+
+    for customer_base in basic_info:
+        customer_id = customer_base.get("customer_id")
+        customer_data = merge_customer_data(customer_base, history_by_id.get(customer_id))
+        _, report = build_slim_payload(customer_data, config_rules.config_rules)
+        if report:
+            print(f"{customer_id}（{customer_data.get('希望購買保單')}）："
+                  f"{report['full_bytes']} → {report['slim_bytes']} bytes，"
+                  f"tokens {report['full_tokens']} → {report['slim_tokens']}（節省 {report['saved_ratio']:.0%}）")
+    print(f"精簡 payload 目前{'已開啟' if slim_payload_enabled() else '未開啟（設定 AGENT_SLIM_PAYLOAD=1 開啟）'}")
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+import scoring_engine
+from scoring_engine import GRADE_THRESHOLDS, LOWEST_GRADE
+from rule_compiler import LIST_AGGREGATIONS
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASIC_INFO_PATH = os.path.join(BASE_DIR, "客戶基本資訊/基本資訊.json")
+HISTORY_PATH = os.path.join(BASE_DIR, "客戶過往紀錄/過往紀錄.json")
+
+
+def _list_field_aggregations():
+    """將 rule_compiler.LIST_AGGREGATIONS 轉為 {"claim_records": {"claim_count": "sum", ...}}"""
+    field_aggs = {}
+    for keyword, how in LIST_AGGREGATIONS.items():
+        column, field = keyword.split(".", 1)
+        field_aggs.setdefault(column, {})[field] = how
+    return field_aggs
+
+
+# 清單欄位展開後的彙總方式（與 rule_compiler 的取值函式一致）
+LIST_FIELD_AGG = _list_field_aggregations()
+
+
+def _normalize(records, prefix=""):
+    """
+    與 pd.json_normalize 相同的攤平結果（巢狀 dict 展開為 a.b 欄位，清單保留原值），
+    但先以 DataFrame 建構整欄資料、每層巢狀 dict 只轉換一次，不逐筆遞迴
+    """
+    frame = pd.DataFrame(records)
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+        present = values.dropna()
+        if len(present) and all(type(value) is dict for value in present):
+            nested = _normalize(values.tolist() if len(present) == len(values) else
+                                [value if type(value) is dict else {} for value in values], f"{prefix}{column}.")
+            nested.index = frame.index
+            columns.update(nested.items())
+        else:
+            columns[f"{prefix}{column}"] = values
+    return pd.DataFrame(columns, index=frame.index)
+
+
+def _list_items(frame, column):
+    """
+    將清單欄位（如 claim_records）的所有項目一次轉為 DataFrame，index 為所屬客戶在 frame 中的列位置
+    （以整數分組，不需每個欄位重新雜湊 customer_id 字串）
+    """
+    owners, items = [], []
+    for row, values in enumerate(frame[column].to_numpy()):
+        if type(values) is list:
+            for item in values:
+                if type(item) is dict:
+                    owners.append(row)
+                    items.append(item)
+    return pd.DataFrame(items, index=np.array(owners, dtype=np.int64))
+
+
+def _flatten_list_field(frame, column, field_aggs):
+    """
+    將清單欄位（如 claim_records）的項目依所屬客戶彙總成 column.field 欄位
+    """
+    items = _list_items(frame, column)
+    grouped = {}
+    for field, how in field_aggs.items():
+        values = items[field] if field in items else pd.Series(np.nan, index=items.index, dtype=object)
+        by_id = values.groupby(level=0)
+        if how == "sum":
+            grouped[f"{column}.{field}"] = pd.to_numeric(values, errors="coerce").groupby(level=0).sum(min_count=1)
+        elif how == "any":
+            grouped[f"{column}.{field}"] = values.fillna(False).astype(bool).groupby(level=0).any()
+        elif how == "max":
+            grouped[f"{column}.{field}"] = by_id.max()
+        elif how == "prefer_cancelled":
+            cancelled = (values == "退保").groupby(level=0).any()
+            grouped[f"{column}.{field}"] = by_id.first().where(~cancelled, "退保")
+        else:
+            grouped[f"{column}.{field}"] = values.replace("", np.nan).groupby(level=0).first()
+    flat = pd.DataFrame(grouped).reindex(np.arange(len(frame)))
+    flat.index = frame.index
+    return pd.concat([frame.drop(columns=[column]), flat], axis=1)
+
+
+def flatten_portfolio(basic_info, history_info):
+    """
+    將兩份客戶 JSON（list of dict）轉為欄位式 DataFrame：巢狀 dict 攤平為
+    credit_alert.bad_debt 等欄位，清單欄位依 LIST_FIELD_AGG 彙總
+    """
+    basic = _normalize(basic_info)
+    history = _normalize(history_info)
+    for column, field_aggs in LIST_FIELD_AGG.items():
+        if column in history:
+            history = _flatten_list_field(history, column, field_aggs)
+    return basic.merge(history, on="customer_id", how="left")
+
+
+def load_portfolio(basic_info_path=BASIC_INFO_PATH, history_path=HISTORY_PATH):
+    """
+    讀取 基本資訊.json 與 過往紀錄.json 並轉為欄位式 DataFrame
+    """
+    with open(basic_info_path, "r", encoding="utf-8") as f:
+        basic_info = json.load(f)
+    with open(history_path, "r", encoding="utf-8") as f:
+        history_info = json.load(f)
+    return flatten_portfolio(basic_info, history_info)
+
+
+# --- 向量化計分函式（門檻與 scoring_engine 相同）---
+
+def _column(frame, name, default=np.nan):
+    return frame[name] if name in frame else pd.Series(default, index=frame.index)
+
+
+def _numeric(series):
+    return pd.to_numeric(series, errors="coerce").fillna(0).to_numpy(dtype=float)
+
+
+def _by_unique(scorer):
+    """
+    類別型欄位（字串、布林）先 factorize，只對相異值呼叫 scoring_engine 的計分函式，
+    再以代碼一次取回整欄分數；百萬筆資料通常只有少數相異值
+    """
+    def score(series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        table = np.array([scorer(value) for value in uniques] + [scorer(None)], dtype=np.int64)
+        return table[codes]
+    return score
+
+
+def _count(series):
+    values = _numeric(series)
+    return np.select([values == 0, values <= 2], [5, 3], 1)
+
+
+def _claim_amount(series):
+    amount = _numeric(series)
+    return np.select([amount <= 0, amount <= 100000], [5, 3], 1)
+
+
+def _age(series):
+    age = _numeric(series)
+    return np.select([age <= 30, age <= 50], [5, 3], 1)
+
+
+_flag = _by_unique(scoring_engine._score_flag)
+
+VECTOR_SCORERS = {
+    "property_proof": _by_unique(scoring_engine._score_property_proof),
+    "age": _age,
+    "health_status": _by_unique(scoring_engine._score_health_status),
+    "smoking": _flag,
+    "credit_rating": _by_unique(scoring_engine._score_credit_rating),
+    "credit_alert.credit_card_overdue_count": _count,
+    "credit_alert.bad_debt": _flag,
+    "credit_alert.joint_credit_warning": _flag,
+    "credit_alert.over_insurance": _flag,
+    "credit_alert.duplicate_insurance": _flag,
+    "credit_alert.abnormal_insurance": _flag,
+    "claim_records.claim_count": _count,
+    "claim_records.total_claim_amount": _claim_amount,
+    "claim_records.disputed": _flag,
+    "insurance_history.status": _by_unique(scoring_engine._score_policy_status),
+    "insurance_history.cancel_reason": _by_unique(scoring_engine._score_cancel_reason),
+    "review_records.manual_reviewed": _flag,
+    "review_records.rejected": _flag,
+    "review_records.pending": _flag,
+    "criminal_record.has_record": _flag,
+    "criminal_record.blacklist": _flag,
+    "suspicious_transaction.money_laundering": _flag,
+    "suspicious_transaction.terrorist_financing": _flag,
+}
+
+
+def score_portfolio(frame, rules):
+    """
+    以向量化運算一次為所有客戶計分
+    Args:
+        frame (DataFrame): flatten_portfolio / load_portfolio 的結果
+        rules (dict): config_rules 規則
+    Returns:
+        DataFrame: customer_id、希望購買保單、各項目分數欄位（score.<keyword>）、total_score、grade
+    """
+    product = _column(frame, "希望購買保單", "").fillna("")
+    keywords = []
+    for rule_group in rules.values():
+        for rule in rule_group:
+            for keyword in rule.get("keywords", []):
+                if keyword in VECTOR_SCORERS and keyword not in keywords:
+                    keywords.append(keyword)
+
+    scores = {kw: VECTOR_SCORERS[kw](_column(frame, kw)) for kw in keywords}
+    products = {name[:-len("規則")]: group for name, group in rules.items() if name.endswith("規則")}
+    total = np.zeros(len(frame), dtype=np.int64)
+    for product_name, rule_group in products.items():
+        mask = (product == product_name).to_numpy()
+        if not mask.any():
+            continue
+        for rule in rule_group:
+            for keyword in rule.get("keywords", []):
+                if keyword in scores:
+                    total += np.where(mask, scores[keyword], 0)
+
+    out = pd.DataFrame({"customer_id": frame["customer_id"].to_numpy(), "希望購買保單": product.to_numpy()})
+    for keyword in keywords:
+        out[f"score.{keyword}"] = scores[keyword]
+    # 找不到對應規則的保單類別不計總分與等級
+    known = product.isin(list(products)).to_numpy()
+    out["total_score"] = pd.array(np.where(known, total, 0), dtype="Int64")
+    out.loc[~known, "total_score"] = pd.NA
+    thresholds = [total >= threshold for threshold, _ in GRADE_THRESHOLDS]
+    grades = np.select(thresholds, [grade for _, grade in GRADE_THRESHOLDS], LOWEST_GRADE)
+    out["grade"] = np.where(known, grades, None)
+    return out
+
+
+def write_synthetic_json(basic_info, history_info, size, directory):
+    """
+    將既有客戶的兩份原始 JSON 重複填充為 size 筆（customer_id 重新編號）並逐筆寫出，
+    回傳 (基本資訊路徑, 過往紀錄路徑)；供 load → flatten → score 的端到端效能量測
+    """
+    history_by_id = {h.get("customer_id"): h for h in history_info}
+    paths = (os.path.join(directory, "基本資訊.json"), os.path.join(directory, "過往紀錄.json"))
+    with open(paths[0], "w", encoding="utf-8") as basic_file, open(paths[1], "w", encoding="utf-8") as history_file:
+        basic_file.write("[")
+        history_file.write("[")
+        for i in range(size):
+            customer_base = basic_info[i % len(basic_info)]
+            customer_id = f"S{i:08d}"
+            separator = "," if i else ""
+            basic_file.write(separator + json.dumps(dict(customer_base, customer_id=customer_id), ensure_ascii=False))
+            customer_hist = history_by_id.get(customer_base.get("customer_id"))
+            if customer_hist is not None:
+                history_file.write(("," if history_file.tell() > 1 else "")
+                                   + json.dumps(dict(customer_hist, customer_id=customer_id), ensure_ascii=False))
+        basic_file.write("]")
+        history_file.write("]")
+    return paths
+
+
+if __name__ == "__main__":
+    # 與逐筆 scoring_engine 比對結果，並量測讀取、攤平、計分的端到端吞吐量（rows/sec）
+    import argparse
+    import config_rules
+    from customer_store import merge_customer_data
+    from scoring_engine import score_customer
+
+    parser = argparse.ArgumentParser(description="整批向量化計分與效能量測")
+    parser.add_argument("--rows", type=int, nargs="*", default=[1000, 100000, 1000000],
+                        help="合成資料筆數，預設 1000 100000 1000000（百萬筆的原始 JSON 讀入記憶體約需數 GB）")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    frame = load_portfolio()
+    print(f"讀取並攤平 {len(frame)} 位客戶：{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    scored = score_portfolio(frame, config_rules.config_rules)
+    with open(BASIC_INFO_PATH, "r", encoding="utf-8") as f:
+        basic_info = json.load(f)
+    with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+        history_by_id = {h.get("customer_id"): h for h in json.load(f)}
+    mismatches = 0
+    for customer_base, row in zip(basic_info, scored.itertuples(index=False)):
+        expected = score_customer(merge_customer_data(customer_base, history_by_id.get(customer_base["customer_id"])),
+                                  config_rules.config_rules)
+        if expected and (expected["total_score"], expected["grade"]) != (row.total_score, row.grade):
+            mismatches += 1
+            print(f"  {row.customer_id} 不一致：向量化 {row.total_score}/{row.grade}，逐筆 {expected['total_score']}/{expected['grade']}")
+    print(f"與 scoring_engine 逐筆計分比對：{len(scored) - mismatches}/{len(scored)} 一致")
+
+    # 端到端：讀取 JSON → 攤平 → 計分，各階段分別計時
+    import tempfile
+    print(f"{'筆數':>11}{'讀取 JSON':>11}{'攤平':>9}{'計分':>9}{'合計':>9}{'rows/sec':>13}")
+    for size in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            basic_path, history_path = write_synthetic_json(basic_info, list(history_by_id.values()), size, directory)
+            started = time.perf_counter()
+            with open(basic_path, "r", encoding="utf-8") as f:
+                synthetic_basic = json.load(f)
+            with open(history_path, "r", encoding="utf-8") as f:
+                synthetic_history = json.load(f)
+            loaded = time.perf_counter()
+            synthetic = flatten_portfolio(synthetic_basic, synthetic_history)
+            flattened = time.perf_counter()
+            score_portfolio(synthetic, config_rules.config_rules)
+            scored = time.perf_counter()
+            del synthetic_basic, synthetic_history, synthetic
+        print(f"{size:>11,}{loaded - started:>10.3f}s{flattened - loaded:>8.3f}s{scored - flattened:>8.3f}s"
+              f"{scored - started:>8.3f}s{size / (scored - started):>13,.0f}")
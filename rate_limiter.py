@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+from metrics import AGENT_ESTIMATED_TOKENS, AGENT_RATE_LIMIT_WAIT_SECONDS, AGENT_THROTTLED
+from payload_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_request_tokens(payload):
+    """
+    估計一次請求計入 TPM 配額的 token 數：input_value 的 token 數，
+    加上 flow 內固定提示詞（AGENT_PROMPT_TOKENS，預設 1000）與預期輸出（AGENT_OUTPUT_TOKENS，預設 1500）
+    """
+    prompt_tokens = int(os.getenv("AGENT_PROMPT_TOKENS", "1000"))
+    output_tokens = int(os.getenv("AGENT_OUTPUT_TOKENS", "1500"))
+    return estimate_tokens(payload.get("input_value") or "") + prompt_tokens + output_tokens
+
+
+def parse_retry_after(value, default=None):
+    """解析 Retry-After（秒數或 HTTP 日期），回傳需等待的秒數；無法解析時回傳 default"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """
+    預約式 token bucket：每秒補充 rate、最多累積 capacity；
+    reserve() 直接扣除額度（可扣到負值）並回傳需等待的秒數，等待者依預約順序放行
+    """
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+        return -self.level / self.rate if self.level < 0 else 0.0
+
+    def drain(self, now):
+        """遭上游限流時清空累積額度，之後只依補充速度放行"""
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+
+
+class RateLimiter:
+    """
+    AGENT API 的用戶端限流：同時以 TPM（每分鐘 token）與 RPM（每分鐘請求）兩個 token bucket 排程，
+    並在收到 429 時依 Retry-After 暫停所有請求。
+    headroom 為平均速率佔配額的比例，其餘作為突發額度，使任一 60 秒內的用量不超過配額
+    """
+
+    def __init__(self, tpm=None, rpm=None, headroom=0.9):
+        self.tpm = tpm
+        self.rpm = rpm
+        self.headroom = headroom
+        self._buckets = []
+        if tpm:
+            self._buckets.append(("tokens", TokenBucket(tpm * headroom, tpm * (1 - headroom))))
+        if rpm:
+            self._buckets.append(("requests", TokenBucket(rpm * headroom, max(1.0, rpm * (1 - headroom)))))
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self._buckets)
+
+    def reserve(self, tokens):
+        """預約一次請求的額度，回傳需等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._paused_until - now)
+            for kind, bucket in self._buckets:
+                delay = max(delay, bucket.reserve(tokens if kind == "tokens" else 1, now))
+            return delay
+
+    async def acquire(self, tokens, mode="sync"):
+        """等待到可送出一次估計用量為 tokens 的請求，回傳等待秒數"""
+        AGENT_ESTIMATED_TOKENS.inc(tokens, mode=mode)
+        delay = self.reserve(tokens) if self.enabled or self._paused_until else 0.0
+        AGENT_RATE_LIMIT_WAIT_SECONDS.observe(delay, mode=mode)
+        if delay > 0:
+            if delay >= 1:
+                logger.info(f"限流：等待 {delay:.1f} 秒後送出（估計 {tokens} tokens）")
+            await asyncio.sleep(delay)
+        return delay
+
+    def throttled(self, retry_after, mode="sync"):
+        """上游回傳 429：在 retry_after 秒內暫停所有請求，並清空突發額度"""
+        AGENT_THROTTLED.inc(mode=mode)
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + retry_after)
+            for _, bucket in self._buckets:
+                bucket.drain(now)
+        logger.warning(f"上游限流（429），暫停送出 {retry_after:.1f} 秒")
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    取得程序內共用的 RateLimiter，配額由環境變數設定（未設定的項目不限制）：
+        AGENT_TPM：每分鐘 token 配額
+        AGENT_RPM：每分鐘請求配額
+        AGENT_RATE_HEADROOM：平均速率佔配額的比例，預設 0.9
+    """
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            tpm = float(os.getenv("AGENT_TPM", "0")) or None
+            rpm = float(os.getenv("AGENT_RPM", "0")) or None
+            _default_limiter = RateLimiter(tpm, rpm, float(os.getenv("AGENT_RATE_HEADROOM", "0.9")))
+        return _default_limiter
@@ -0,0 +1,95 @@
+import re
+from collections import OrderedDict
+
+from 中文規則對應 import all_field_zh
+
+# 類別底色（依出現順序循環使用）
+CLASS_COLORS = ["#e6f2ff", "#f9f9d1", "#e8f6e8", "#ffe6e6", "#f3e6ff", "#fff2cc"]
+
+_SCORE_TABLE_STYLE = '''<style>
+.score-table th, .score-table td {{ border:1px solid #bbb; {row_border}padding:8px 12px; text-align:center; font-size:16px; }}
+.score-table th {{ background:#2c5c88; color:#fff; }}
+.score-table .class-cell {{ cursor: pointer; position:relative; }}
+.class-tooltip {{ display:none; position:absolute; left:100%; top:50%; transform:translateY(-50%); background:#fff; color:#222; border:1.5px solid #2c5c88; border-radius:10px; padding:16px 28px; min-width:260px; max-width:480px; box-shadow:0 4px 16px #888; z-index:99999; font-size:16px; text-align:left; white-space:pre-line; word-break:break-all; }}
+.class-cell:hover .class-tooltip {{ display:block; }}
+.score-table .rule-link {{ color: #222; text-decoration: none; cursor: default; position:relative; }}
+.score-table td {{ background:#fff; }}
+.rule-tooltip {{ display:none; position:absolute; left:100%; top:50%; transform:translateY(-50%); background:#fff; color:#222; border:1.5px solid #1a5fb4; border-radius:8px; padding:10px 16px; min-width:180px; max-width:320px; box-shadow:0 2px 8px #888; z-index:9999; font-size:15px; white-space:pre-line; }}
+.rule-link:hover .rule-tooltip {{ display:block; }}
+</style>
+<div><table class="score-table" style="border-collapse:collapse;width:100%;min-width:600px;">
+<tr><th>分數</th><th>規則名稱</th><th>必要性</th><th>類別</th></tr>
+'''
+
+
+def beautify_rule_desc(desc):
+    """
+    條列式美化規則說明：依「；」「;」或換行分割，「項目：分數」格式的條目加上分數標示
+    """
+    # 將 "；" 或 ";" 或 "\n" 分割
+    items = re.split(r'[；;\n]+', desc)
+    items = [i.strip() for i in items if i.strip()]
+    # 將 "：" 或 ":" 分割分數
+    html_list = []
+    for item in items:
+        if '：' in item or ':' in item:
+            k, v = item.split('：' if '：' in item else ':', 1)
+            v = v.strip()
+            if not v.endswith('分'):
+                v = v + '分'
+            html_list.append(f'<li>📊 <b>{k}</b>：<span style="color:#1a5fb4;font-weight:bold">{v}</span></li>')
+        else:
+            html_list.append(f'<li>{item}</li>')
+    return '<ul style="margin:0 0 0 1em;padding:0;list-style:none;text-align:left;">' + ''.join(html_list) + '</ul>' if html_list else desc
+
+
+def build_score_table_rows(ai_result, rule_index):
+    """
+    將分析結果的 score_table 整理為表格資料，並依類別分組（保留出現順序）
+    Returns:
+        OrderedDict: 類別 -> [{"分數", "規則名稱", "規則名稱顯示", "必要性", "類別"}, ...]
+    """
+    grouped = OrderedDict()
+    for item in ai_result.get("score_table", []):
+        keyword = item.get("項目", "")
+        row = {
+            "分數": item.get("分數", ""),
+            "規則名稱": keyword,
+            "規則名稱顯示": all_field_zh.get(keyword, keyword),
+            "必要性": "✦ 必要" if rule_index.keyword_required.get(keyword, False) else "○ 選擇",
+            "類別": rule_index.keyword_class.get(keyword, "未知")
+        }
+        grouped.setdefault(row["類別"], []).append(row)
+    return grouped
+
+
+def build_score_table_html(ai_result, rule_index, class_separator=True):
+    """
+    產生規則合規情況 HTML 表格：依類別合併儲存格，規則名稱 hover 顯示條列化的規則說明，類別 hover 顯示類別描述
+    Args:
+        ai_result (dict): 分析結果（含 score_table）
+        rule_index (rule_compiler.RuleIndex): 項目 -> 類別/必要性、類別 -> 描述 的查詢索引
+        class_separator (bool): 每列下方加粗分隔線
+    """
+    grouped = build_score_table_rows(ai_result, rule_index)
+    rule_explain_map = {item.get("項目", ""): item.get("規則", "") for item in ai_result.get("score_table", [])}
+    parts = [_SCORE_TABLE_STYLE.format(row_border="border-bottom:3.5px solid #2c5c88; " if class_separator else "")]
+    for idx, (cls, rows) in enumerate(grouped.items()):
+        color = CLASS_COLORS[idx % len(CLASS_COLORS)]
+        for i, row in enumerate(rows):
+            parts.append("<tr>")
+            parts.append(f"<td>{row['分數']}</td>")
+            beautified = beautify_rule_desc(rule_explain_map.get(row['規則名稱'], ''))
+            # 規則名稱加上 hover 條列美化說明
+            parts.append(f"<td><span class='rule-link'>{row['規則名稱顯示']}<span class='rule-tooltip'>{beautified}</span></span></td>")
+            parts.append(f"<td>{row['必要性']}</td>")
+            if i == 0:
+                desc = rule_index.class_description.get(cls, "")
+                # 美化類別 hover 浮窗
+                parts.append(f"<td rowspan='{len(rows)}' class='class-cell' style='background:{color};font-weight:bold;min-width:90px;position:relative;'>{cls}")
+                if desc:
+                    parts.append(f"<span class='class-tooltip'><b>📂 {cls}</b><br>{desc}</span>")
+                parts.append("</td>")
+            parts.append("</tr>")
+    parts.append("</table></div>")
+    return "".join(parts)
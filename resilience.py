@@ -0,0 +1,292 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from env_flags import env_flag
+from metrics import AGENT_CIRCUIT_REJECTIONS, AGENT_CIRCUIT_STATE, AGENT_HEDGED_REQUESTS, AGENT_RETRIES
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中：上游近期連續失敗，暫不送出請求"""
+
+
+def _status_of(error):
+    return getattr(error, "status", None)
+
+
+class CircuitBreaker:
+    """
+    連續失敗 failure_threshold 次後開啟，reset_timeout 秒內直接拒絕請求（fail fast）；
+    之後進入半開狀態只放行一個試探請求，成功即關閉、失敗則再次開啟
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        AGENT_CIRCUIT_STATE.set(_STATE_VALUES[CLOSED])
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning(f"AGENT API 斷路器：{self.state} → {state}")
+            self.state = state
+            AGENT_CIRCUIT_STATE.set(_STATE_VALUES[state])
+
+    def before_call(self):
+        """送出前檢查，斷路器開啟時拋出 CircuitOpenError"""
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+                self._probing = False
+            if self.state == OPEN or (self.state == HALF_OPEN and self._probing):
+                AGENT_CIRCUIT_REJECTIONS.inc()
+                remaining = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+                raise CircuitOpenError(f"上游連續失敗 {self.failures} 次，斷路器開啟中（約 {remaining:.0f} 秒後試探）")
+            if self.state == HALF_OPEN:
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_neutral(self):
+        """結果無法判斷上游是否正常（如回應格式錯誤）：不影響失敗計數，只釋放半開狀態的試探名額"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    @property
+    def is_open(self):
+        return self.state == OPEN
+
+
+class LatencyWindow:
+    """最近 size 次成功呼叫的耗時，用於計算 hedge 的觸發時間"""
+
+    def __init__(self, size=200):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+
+    def __len__(self):
+        return len(self._values)
+
+    def percentile(self, pct):
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(pct / 100 * len(values)))]
+
+
+class Resilience:
+    """
+    AGENT API 呼叫的韌性層：可重試的失敗以 full jitter 指數退避重試、連續失敗時由斷路器快速失敗、
+    （選用）請求超過觀測到的 p95 耗時仍未回應時送出第二份相同請求，取先完成者。
+    逾時預設不重試：每次嘗試都是完整的逾時秒數，重試逾時會使一次呼叫最多阻塞 (1 + retries) 倍逾時
+    """
+
+    def __init__(self, retries=2, backoff_base=0.5, backoff_max=8.0, retry_statuses=(500, 502, 503, 504),
+                 retry_on_timeout=False, breaker=None, hedge=False, hedge_percentile=95, hedge_min_samples=20):
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_on_timeout = retry_on_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyWindow()
+
+    def classify(self, error):
+        """回傳失敗原因（timeout/connection/status_<碼>），不可重試的失敗回傳 None"""
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+            return "timeout" if self.retry_on_timeout else None
+        if isinstance(error, (ConnectionError, asyncio.IncompleteReadError, OSError)):
+            return "connection"
+        status = _status_of(error)
+        if status in self.retry_statuses:
+            return f"status_{status}"
+        return None
+
+    @staticmethod
+    def _breaker_outcome(error):
+        """
+        失敗對斷路器的意義：上游故障（逾時、連線、5xx）為 "failure"；4xx 表示上游有正常處理請求，為 "success"；
+        回應格式錯誤等無法判斷上游狀態的失敗為 "neutral"
+        """
+        status = _status_of(error)
+        if status is not None:
+            return "failure" if status >= 500 else "success"
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, asyncio.IncompleteReadError, OSError)):
+            return "failure"
+        return "neutral"
+
+    def backoff(self, attempt):
+        """full jitter：在 0～min(上限, base * 2^attempt) 之間隨機等待"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def hedge_delay(self):
+        """送出第二份請求前的等待秒數；未啟用或樣本不足時回傳 None"""
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def _failed(self, error, attempt, mode, retryable_now=True):
+        """
+        記錄一次失敗；可重試時等待退避時間後回傳 True，否則回傳 False（呼叫端應拋出原例外）
+        """
+        outcome = self._breaker_outcome(error)
+        if outcome == "failure":
+            self.breaker.record_failure()
+        elif outcome == "success":
+            self.breaker.record_success()
+        else:
+            self.breaker.record_neutral()
+        reason = self.classify(error)
+        if reason is None or not retryable_now or attempt >= self.retries or self.breaker.is_open:
+            return False
+        delay = self.backoff(attempt)
+        AGENT_RETRIES.inc(mode=mode, reason=reason)
+        logger.warning(f"API 呼叫失敗（{reason}），{delay:.2f} 秒後重試（第 {attempt + 1}/{self.retries} 次）")
+        await asyncio.sleep(delay)
+        return True
+
+    async def _timed(self, fn):
+        started = time.perf_counter()
+        result = await fn()
+        self.latency.observe(time.perf_counter() - started)
+        return result
+
+    async def _hedged(self, fn, mode):
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(self._timed(fn))
+        if delay is None:
+            return await primary
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                AGENT_HEDGED_REQUESTS.inc(mode=mode, outcome="sent")
+                logger.info(f"請求超過 p{self.hedge_percentile}（{delay:.2f} 秒）仍未回應，送出 hedge 請求")
+                tasks.append(asyncio.ensure_future(self._timed(fn)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            AGENT_HEDGED_REQUESTS.inc(mode=mode, outcome="primary_won" if task is primary else "hedge_won")
+                        return task.result()
+            # 兩份請求都失敗：以原請求的例外為準
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, fn, mode="sync"):
+        """
+        以韌性策略執行 fn（回傳 awaitable 的無參數函式，每次重試重新呼叫）
+        Raises:
+            CircuitOpenError: 斷路器開啟中
+            其他：最後一次嘗試的例外
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await self._hedged(fn, mode)
+            except Exception as e:
+                if await self._failed(e, attempt, mode):
+                    attempt += 1
+                    continue
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def stream(self, factory, mode="stream"):
+        """
+        串流版本：factory() 回傳 async iterator；尚未產出任何項目前失敗時才重試（已送出的內容無法收回）
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            yielded = False
+            started = time.perf_counter()
+            try:
+                async for item in factory():
+                    if not yielded:
+                        # 以首個事件的到達時間作為串流的延遲樣本
+                        self.latency.observe(time.perf_counter() - started)
+                        yielded = True
+                    yield item
+            except Exception as e:
+                if await self._failed(e, attempt, mode, retryable_now=not yielded):
+                    attempt += 1
+                    continue
+                raise
+            self.breaker.record_success()
+            return
+
+
+_default_resilience = None
+_default_resilience_lock = threading.Lock()
+
+
+def get_resilience():
+    """
+    取得程序內共用的 Resilience，設定由環境變數讀取：
+        AGENT_RETRIES（預設 2）、AGENT_RETRY_BASE（秒，預設 0.5）、AGENT_RETRY_MAX（秒，預設 8）、
+        AGENT_RETRY_STATUSES（預設 500,502,503,504）、AGENT_RETRY_ON_TIMEOUT（逾時是否重試，預設 0）、
+        AGENT_BREAKER_FAILURES（連續失敗幾次開啟，0 為停用，預設 5）、AGENT_BREAKER_RESET（秒，預設 30）、
+        AGENT_HEDGE（預設 0）、AGENT_HEDGE_PERCENTILE（預設 95）、AGENT_HEDGE_MIN_SAMPLES（預設 20）
+    """
+    global _default_resilience
+    with _default_resilience_lock:
+        if _default_resilience is None:
+            _default_resilience = Resilience(
+                retries=int(os.getenv("AGENT_RETRIES", "2")),
+                backoff_base=float(os.getenv("AGENT_RETRY_BASE", "0.5")),
+                backoff_max=float(os.getenv("AGENT_RETRY_MAX", "8")),
+                retry_statuses=[int(s) for s in os.getenv("AGENT_RETRY_STATUSES", "500,502,503,504").split(",") if s.strip()],
+                retry_on_timeout=env_flag("AGENT_RETRY_ON_TIMEOUT"),
+                breaker=CircuitBreaker(int(os.getenv("AGENT_BREAKER_FAILURES", "5")),
+                                       float(os.getenv("AGENT_BREAKER_RESET", "30"))),
+                hedge=env_flag("AGENT_HEDGE"),
+                hedge_percentile=float(os.getenv("AGENT_HEDGE_PERCENTILE", "95")),
+                hedge_min_samples=int(os.getenv("AGENT_HEDGE_MIN_SAMPLES", "20")),
+            )
+        return _default_resilience
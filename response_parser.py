@@ -0,0 +1,253 @@
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 評分結果必備的欄位；完整解析或截斷修復的物件都需包含這些欄位才採用
+REQUIRED_FIELDS = ("score_table", "total_score", "grade")
+# 截斷在這些文字欄位中間時保留已收到的部分（其他欄位的不完整值一律捨棄，不做猜測）
+TRUNCATABLE_TEXT_FIELDS = ("專家綜合說明",)
+TRUNCATION_MARK = "…"
+
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+
+# strict=False：LLM 常在字串中直接輸出換行等控制字元
+_decoder = json.JSONDecoder(strict=False)
+
+
+def find_message_text(api_response):
+    """
+    取出 Langflow 回應中的 LLM 文字：先走 outputs[0].outputs[0].results.message.text，
+    找不到時依序嘗試其他常見位置（message.data.text、messages[].message、artifacts.message），
+    最後深度優先尋找第一個含「{」的 text/message 字串。api_response 本身為字串時直接回傳
+    """
+    if isinstance(api_response, str):
+        return api_response
+    try:
+        text = api_response["outputs"][0]["outputs"][0]["results"]["message"]["text"]
+        if isinstance(text, str):
+            return text
+    except (KeyError, IndexError, TypeError):
+        pass
+
+    for output in (api_response or {}).get("outputs") or []:
+        for inner in (output or {}).get("outputs") or []:
+            if not isinstance(inner, dict):
+                continue
+            message = (inner.get("results") or {}).get("message") or {}
+            candidates = [
+                (message.get("data") or {}).get("text") if isinstance(message, dict) else None,
+                message if isinstance(message, str) else None,
+                ((inner.get("messages") or [{}])[0] or {}).get("message"),
+                (inner.get("artifacts") or {}).get("message"),
+            ]
+            for text in candidates:
+                if isinstance(text, str) and text:
+                    return text
+
+    stack = [api_response]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in ("text", "message") and isinstance(value, str) and "{" in value:
+                    return value
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return None
+
+
+def _is_result(value):
+    """含 REQUIRED_FIELDS 且 score_table 為清單的物件才視為評分結果"""
+    return (isinstance(value, dict) and all(field in value for field in REQUIRED_FIELDS)
+            and isinstance(value.get("score_table"), list))
+
+
+class _Truncated(Exception):
+    """_parse_partial 讀到文字結尾仍未完成"""
+
+
+def _parse_partial(text, pos):
+    """
+    容錯解析可能被截斷的 JSON：回傳 (值, 結束位置, 是否完整)。
+    物件/陣列被截斷時保留已完整的成員；截斷的字串、數值等純量整個捨棄
+    （TRUNCATABLE_TEXT_FIELDS 的字串值除外）。語法錯誤（非截斷）拋出 ValueError
+    """
+    length = len(text)
+
+    def skip_ws(i):
+        return _WHITESPACE.match(text, i).end()
+
+    def parse_value(i, key=None):
+        i = skip_ws(i)
+        if i >= length:
+            raise _Truncated()
+        char = text[i]
+        if char in "{[":
+            # 完整的物件/陣列交給 C 實作一次解析，只有截斷所在的那一層才逐一成員解析
+            try:
+                value, end = _decoder.raw_decode(text, i)
+                return value, end, True
+            except json.JSONDecodeError:
+                return parse_object(i + 1) if char == "{" else parse_array(i + 1)
+        if char == '"':
+            try:
+                value, end = _decoder.raw_decode(text, i)
+                return value, end, True
+            except json.JSONDecodeError:
+                if key in TRUNCATABLE_TEXT_FIELDS:
+                    partial = _partial_string(text, i + 1)
+                    if partial:
+                        return partial + TRUNCATION_MARK, length, False
+                raise _Truncated()
+        try:
+            value, end = _decoder.raw_decode(text, i)
+        except json.JSONDecodeError:
+            raise _Truncated() if _is_prefix_of_scalar(text[i:]) else ValueError(f"位置 {i} 無法解析")
+        if end >= length and isinstance(value, (int, float)) and not isinstance(value, bool):
+            # 數值位於文字結尾，可能被截斷（如 65 被截成 6）
+            raise _Truncated()
+        return value, end, True
+
+    def parse_object(i):
+        result = {}
+        while True:
+            i = skip_ws(i)
+            if i >= length:
+                return result, length, False
+            if text[i] == "}":
+                return result, i + 1, True
+            if text[i] == ",":
+                i += 1
+                continue
+            if text[i] != '"':
+                raise ValueError(f"位置 {i} 應為物件 key")
+            try:
+                key, i = _decoder.raw_decode(text, i)
+            except json.JSONDecodeError:
+                return result, length, False
+            i = skip_ws(i)
+            if i >= length:
+                return result, length, False
+            if text[i] != ":":
+                raise ValueError(f"位置 {i} 應為「:」")
+            try:
+                value, i, complete = parse_value(i + 1, key)
+            except _Truncated:
+                return result, length, False
+            result[key] = value
+            if not complete:
+                return result, length, False
+
+    def parse_array(i):
+        result = []
+        while True:
+            i = skip_ws(i)
+            if i >= length:
+                return result, length, False
+            if text[i] == "]":
+                return result, i + 1, True
+            if text[i] == ",":
+                i += 1
+                continue
+            try:
+                value, i, complete = parse_value(i)
+            except _Truncated:
+                return result, length, False
+            if not complete:
+                # 截斷在陣列元素中間：不完整的元素不採用
+                return result, length, False
+            result.append(value)
+
+    return parse_value(pos)
+
+
+def _partial_string(text, start):
+    """解碼截斷字串目前已收到的內容（略過結尾不完整的跳脫字元）"""
+    chars = []
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            if i + 1 >= len(text) or (text[i + 1] == "u" and i + 6 > len(text)):
+                break
+            try:
+                decoded, _ = _decoder.raw_decode('"' + text[i:i + (6 if text[i + 1] == "u" else 2)] + '"')
+            except json.JSONDecodeError:
+                break
+            chars.append(decoded)
+            i += 6 if text[i + 1] == "u" else 2
+            continue
+        chars.append(char)
+        i += 1
+    return "".join(chars)
+
+
+def _is_prefix_of_scalar(rest):
+    rest = rest.strip()
+    return any(literal.startswith(rest) for literal in ("true", "false", "null")) or rest[:1] in "-0123456789"
+
+
+def parse_agent_text(text):
+    """
+    以線性時間掃描 LLM 回覆文字取出評分結果 JSON：
+    依序對每個「{」嘗試解析（可處理有/無 ```json code block、多個 code block、前後說明文字），
+    成功解析的物件會整段跳過，不會重複掃描；只採用含 REQUIRED_FIELDS 的物件，
+    格式範例、錯誤訊息等其他 JSON 一律不採用。
+    某個物件讀到文字結尾仍未結束（被截斷）時，其後的「{」都在它內部，不再逐一重試，
+    改對它做一次本機修復（只保留完整的成員），修復後需含 REQUIRED_FIELDS 才採用。
+    Returns:
+        tuple: (結果 dict 或 None, 狀態)；狀態為 "ok"、"repaired"（截斷後修復，內容不完整）或 "failed"
+    """
+    if not isinstance(text, str):
+        return None, "failed"
+    # 整段文字是 JSON 字串（被多包一層引號）時先解開
+    stripped = text.strip()
+    if stripped.startswith('"'):
+        try:
+            inner = _decoder.decode(stripped)
+        except ValueError:
+            inner = None
+        if isinstance(inner, str) and inner != text:
+            return parse_agent_text(inner)
+
+    try:
+        return _scan(text)
+    except RecursionError:
+        # 巢狀層數超過直譯器上限（異常輸出），視為解析失敗
+        return None, "failed"
+
+
+def _scan(text):
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            value, end = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            try:
+                value, end, complete = _parse_partial(text, pos)
+            except ValueError:
+                # 語法錯誤（如說明文字中的「{分數}」）：從下一個「{」繼續
+                pos = text.find("{", pos + 1)
+                continue
+            except _Truncated:
+                return None, "failed"
+            if not complete:
+                return (value, "repaired") if _is_result(value) else (None, "failed")
+        if _is_result(value):
+            return value, "ok"
+        pos = text.find("{", end)
+    return None, "failed"
+
+
+def parse_agent_response(api_response):
+    """
+    從 Langflow API 回應取出並解析評分結果，回傳 (結果 dict 或 None, 狀態, 原始文字)
+    """
+    text = find_message_text(api_response)
+    if text is None:
+        return None, "no_text", None
+    result, status = parse_agent_text(text)
+    return result, status, text
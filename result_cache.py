@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "Results", "result_cache.sqlite3")
+
+
+def canonical_json(data) -> str:
+    """
+    將資料轉為標準化 JSON 字串（key 排序、無多餘空白），相同內容必得相同字串
+    """
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def rules_fingerprint(rules: dict) -> str:
+    """
+    計算規則設定的指紋（sha256），config_rules 有任何變動指紋即不同
+    """
+    return hashlib.sha256(canonical_json(rules).encode("utf-8")).hexdigest()
+
+
+def cache_key(customer_data: dict, rules: dict) -> str:
+    """
+    以合併後客戶資料與規則指紋計算快取 key
+    """
+    digest = hashlib.sha256()
+    digest.update(canonical_json(customer_data).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(rules_fingerprint(rules).encode("ascii"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    AI 分析結果快取：以客戶資料＋規則指紋為 key，儲存已解析的分析結果。
+
+    以 SQLite（WAL 模式）持久化，多個 Streamlit 程序可共用同一個檔案；
+    支援依筆數（LRU）與存活時間淘汰，命中/未命中次數亦記錄於資料庫中跨程序累計。
+    """
+
+    def __init__(self, path=None, max_entries=None, max_age_seconds=None):
+        self.path = path or os.getenv("RESULT_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else float(os.getenv("RESULT_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " customer_id TEXT,"
+                " rules_fingerprint TEXT,"
+                " result TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)")
+
+    @contextmanager
+    def _connect(self):
+        # 每次操作使用短連線，避免跨 thread 共用 sqlite3 連線；busy timeout 處理多程序寫入競爭
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn, name):
+        conn.execute("UPDATE stats SET value = value + 1 WHERE name = ?", (name,))
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, customer_data: dict, rules: dict):
+        """
+        查詢快取，命中回傳已解析的結果 dict，否則回傳 None
+        """
+        key = cache_key(customer_data, rules)
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT result, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is None or (self.max_age_seconds > 0 and now - row[1] > self.max_age_seconds):
+                    self._count(conn, "misses")
+                    return None
+                conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+                self._count(conn, "hits")
+                return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.error(f"讀取結果快取失敗：{e}")
+            return None
+
+    def put(self, customer_data: dict, rules: dict, result: dict):
+        """
+        寫入快取並執行淘汰（過期項目與超過上限的最久未使用項目）
+        """
+        key = cache_key(customer_data, rules)
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, (customer_data or {}).get("customer_id"), rules_fingerprint(rules),
+                     json.dumps(result, ensure_ascii=False), now, now)
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"寫入結果快取失敗：{e}")
+
+    def _evict(self, conn, now):
+        if self.max_age_seconds > 0:
+            conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.max_age_seconds,))
+        if self.max_entries > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def invalidate(self, customer_id=None):
+        """
+        清除快取；指定 customer_id 時只清除該客戶的項目
+        """
+        with self._connect() as conn:
+            if customer_id is None:
+                conn.execute("DELETE FROM cache")
+            else:
+                conn.execute("DELETE FROM cache WHERE customer_id = ?", (customer_id,))
+
+    def stats(self):
+        """
+        回傳快取統計：本程序與所有程序累計的命中/未命中次數、目前筆數
+        """
+        with self._connect() as conn:
+            totals = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "entries": entries,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    取得程序內共用的 ResultCache（路徑與上限由環境變數設定）
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
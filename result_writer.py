@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    對 path 取得跨程序的獨佔 advisory lock（使用旁邊的 <path>.lock 檔；POSIX 用 fcntl.flock，Windows 用 msvcrt.locking）
+    """
+    lock_path = f"{path}.lock"
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重試約 10 秒後仍拿不到鎖會丟出 OSError，繼續等待
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_json(path, data, indent=2):
+    """
+    以「寫入暫存檔 → fsync → os.replace」的方式寫入 JSON，讀取端只會看到舊檔或完整的新檔
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        for attempt in range(10):
+            try:
+                os.replace(tmp_path, path)
+                break
+            except PermissionError:
+                # Windows 上目標檔正被讀取時無法取代，稍後重試
+                if attempt == 9:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehindWriter:
+    """
+    背景寫入佇列：submit() 立即返回，由單一背景 thread 依序執行寫入函式；
+    尚未寫入的資料可由 pending() 讀回，呼叫端寫入後立即讀取仍能拿到最新結果
+    """
+
+    def __init__(self, write_fn, max_queue=1000):
+        self._write_fn = write_fn
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        # 序號分配與排入佇列在同一把鎖內完成，確保佇列順序與序號一致（同一 key 的舊資料不會晚於新資料寫入）；
+        # 與 _lock 分開，佇列已滿而等待時背景 thread 仍能取得 _lock 完成寫入
+        self._submit_lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="result-write-behind", daemon=True)
+            self._thread.start()
+
+    def submit(self, key, data, *args, **kwargs):
+        """
+        排入一筆寫入工作（佇列已滿時會等待，避免記憶體無限成長）
+        Args:
+            key: 用於 pending() 查詢的 key（如 customer_id）
+            data: 要寫入的資料，會作為 write_fn 的第一個參數
+        """
+        with self._submit_lock:
+            with self._lock:
+                self._seq += 1
+                seq = self._seq
+                self._pending[key] = (seq, data)
+                self._ensure_thread()
+            self._queue.put((key, seq, data, args, kwargs))
+
+    def pending(self, key):
+        """回傳 key 尚未寫入完成的最新資料，沒有則回傳 None"""
+        with self._lock:
+            item = self._pending.get(key)
+        return item[1] if item else None
+
+    def flush(self, timeout=None):
+        """
+        等待佇列中的寫入全部完成，回傳是否在 timeout 內完成
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: self._queue.unfinished_tasks == 0, timeout)
+
+    def _run(self):
+        while True:
+            key, seq, data, args, kwargs = self._queue.get()
+            try:
+                self._write_fn(data, *args, **kwargs)
+            except Exception as e:
+                logger.error(f"背景寫入失敗（{key}）：{e}")
+            finally:
+                with self._lock:
+                    if self._pending.get(key, (None,))[0] == seq:
+                        del self._pending[key]
+                self._queue.task_done()
+
+
+def _stress_writer(path, store_path, writer_id, writes, naive):
+    from results_store import ResultStore
+
+    store = ResultStore(store_path)
+    for i in range(writes):
+        data = {"writer": writer_id, "seq": i, "score_table": [{"項目": f"item_{n}", "分數": n % 5} for n in range(200)]}
+        if naive:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        else:
+            # 與 save_results 相同：鎖內依序寫入結果庫與最新結果檔
+            with file_lock(path):
+                store.append("STRESS", data)
+                atomic_write_json(path, data)
+
+
+def _stress_reader(path, stop_event, result_queue):
+    reads = errors = 0
+    while not stop_event.is_set():
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                json.load(f)
+            reads += 1
+        except FileNotFoundError:
+            continue
+        except ValueError:
+            errors += 1
+    result_queue.put((reads, errors))
+
+
+if __name__ == "__main__":
+    # 壓力測試：多個程序同時寫入同一結果檔，同時多個程序持續讀取並檢查是否讀到不完整的 JSON
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="結果檔併發寫入/讀取壓力測試")
+    parser.add_argument("--writers", type=int, default=8, help="寫入程序數，預設 8")
+    parser.add_argument("--readers", type=int, default=4, help="讀取程序數，預設 4")
+    parser.add_argument("--writes", type=int, default=200, help="每個寫入程序的寫入次數，預設 200")
+    parser.add_argument("--naive", action="store_true", help="改用原本直接覆寫的方式（對照組）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "result_STRESS.json")
+        store_path = os.path.join(tmp_dir, "results.sqlite3")
+        result_queue = multiprocessing.Queue()
+        stop_event = multiprocessing.Event()
+        started = time.perf_counter()
+        writers = [multiprocessing.Process(target=_stress_writer, args=(path, store_path, n, args.writes, args.naive))
+                   for n in range(args.writers)]
+        # 讀取端持續讀取到所有寫入端結束為止
+        readers = [multiprocessing.Process(target=_stress_reader, args=(path, stop_event, result_queue))
+                   for _ in range(args.readers)]
+        for process in writers + readers:
+            process.start()
+        for process in writers:
+            process.join()
+        elapsed = time.perf_counter() - started
+        stop_event.set()
+
+        reads = errors = 0
+        for _ in readers:
+            r, e = result_queue.get()
+            reads += r
+            errors += e
+        for process in readers:
+            process.join()
+        with open(path, "r", encoding="utf-8") as f:
+            final = json.load(f)
+        leftovers = [name for name in os.listdir(tmp_dir) if name.endswith(".tmp")]
+        mode = "直接覆寫" if args.naive else "原子寫入＋檔案鎖"
+        print(f"[{mode}] {args.writers} 個寫入程序 × {args.writes} 次，{args.readers} 個讀取程序，耗時 {elapsed:.2f} 秒")
+        print(f"讀取 {reads} 次，讀到不完整 JSON {errors} 次，殘留暫存檔 {len(leftovers)} 個")
+        if not args.naive:
+            from results_store import ResultStore
+
+            store = ResultStore(store_path)
+            latest = store.latest_result("STRESS")
+            print(f"結果庫 {store.count()}/{args.writers * args.writes} 筆，"
+                  f"最新結果檔與結果庫最新一筆{'一致' if latest == final else '不一致'}")
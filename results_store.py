@@ -0,0 +1,207 @@
+import os
+import glob
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from result_cache import canonical_json, rules_fingerprint
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Results")
+DEFAULT_STORE_PATH = os.path.join(RESULTS_DIR, "results.sqlite3")
+
+
+class ResultStore:
+    """
+    AI 分析結果庫：每次分析新增一筆（append-only），保留所有歷史版本與時間、規則指紋。
+
+    以 SQLite（WAL 模式）持久化，依 (customer_id, created_at) 與 created_at 建索引，
+    「某客戶最新一筆」與「某時間點之後的所有分析」皆為索引查詢。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("RESULTS_DB_PATH", DEFAULT_STORE_PATH)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " customer_id TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " rules_fingerprint TEXT,"
+                " source TEXT,"
+                " result_hash TEXT NOT NULL,"
+                " result TEXT NOT NULL)"
+            )
+            # 同一客戶、同一時間、同一內容只保留一筆，重複匯入既有 JSON 不會產生新版本
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_analyses_customer"
+                " ON analyses(customer_id, created_at, result_hash)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses(created_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    _COLUMNS = "id, customer_id, created_at, rules_fingerprint, source, result"
+
+    @staticmethod
+    def _row(row):
+        analysis_id, customer_id, created_at, fingerprint, source, result = row
+        return {
+            "id": analysis_id,
+            "customer_id": customer_id,
+            "created_at": created_at,
+            "rules_fingerprint": fingerprint,
+            "source": source,
+            "result": json.loads(result),
+        }
+
+    def append(self, customer_id, result, rules=None, created_at=None, source="agent"):
+        """
+        新增一筆分析結果，回傳新紀錄的 id（內容與時間皆相同的重複紀錄回傳 None）
+        Args:
+            customer_id (str): 客戶 ID
+            result (dict): 解析後的分析結果
+            rules (dict): 本次分析使用的規則（記錄其指紋，可為 None）
+            created_at (float): 分析時間（epoch 秒），預設為現在
+            source (str): 來源，如 agent、cache、import
+        """
+        text = canonical_json(result)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO analyses"
+                " (customer_id, created_at, rules_fingerprint, source, result_hash, result)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (customer_id, created_at if created_at is not None else time.time(),
+                 rules_fingerprint(rules) if rules is not None else None, source,
+                 hashlib.sha256(text.encode("utf-8")).hexdigest(), text)
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def latest(self, customer_id):
+        """
+        取得某客戶最新一筆分析紀錄（含 result 與中繼資料），沒有則回傳 None
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {self._COLUMNS} FROM analyses WHERE customer_id = ?"
+                " ORDER BY created_at DESC, id DESC LIMIT 1",
+                (customer_id,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def latest_result(self, customer_id):
+        """取得某客戶最新一筆分析結果 dict，沒有則回傳 None"""
+        record = self.latest(customer_id)
+        return record["result"] if record else None
+
+    def history(self, customer_id, limit=None):
+        """
+        取得某客戶所有分析紀錄，新到舊排序
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {self._COLUMNS} FROM analyses WHERE customer_id = ?"
+                " ORDER BY created_at DESC, id DESC LIMIT ?",
+                (customer_id, limit if limit is not None else -1)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def since(self, timestamp, customer_id=None):
+        """
+        取得 timestamp（epoch 秒）之後的所有分析紀錄，舊到新排序；可只查單一客戶
+        """
+        sql = f"SELECT {self._COLUMNS} FROM analyses WHERE created_at >= ?"
+        params = [timestamp]
+        if customer_id is not None:
+            sql += " AND customer_id = ?"
+            params.append(customer_id)
+        with self._connect() as conn:
+            rows = conn.execute(sql + " ORDER BY created_at, id", params).fetchall()
+        return [self._row(row) for row in rows]
+
+    def count(self, customer_id=None):
+        with self._connect() as conn:
+            if customer_id is None:
+                return conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            return conn.execute("SELECT COUNT(*) FROM analyses WHERE customer_id = ?", (customer_id,)).fetchone()[0]
+
+    def import_json_dir(self, results_dir=RESULTS_DIR, filename_prefix="result"):
+        """
+        匯入既有的 Results/{prefix}_<customer_id>.json，以檔案修改時間為分析時間；
+        重複匯入同一檔案不會新增紀錄。回傳新增的筆數
+        """
+        imported = 0
+        for path in sorted(glob.glob(os.path.join(results_dir, f"{filename_prefix}_*.json"))):
+            customer_id = os.path.basename(path)[len(filename_prefix) + 1:-len(".json")]
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"匯入 {path} 失敗：{e}")
+                continue
+            if self.append(customer_id, result, created_at=os.path.getmtime(path), source="import") is not None:
+                imported += 1
+        logger.info(f"已由 {results_dir} 匯入 {imported} 筆分析結果")
+        return imported
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """
+    取得程序內共用的 ResultStore（路徑可由 RESULTS_DB_PATH 設定）；結果庫為空時先匯入既有的 Results/*.json
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ResultStore()
+            if _default_store.count() == 0:
+                _default_store.import_json_dir()
+        return _default_store
+
+
+if __name__ == "__main__":
+    # 匯入既有 JSON 結果、查詢最新結果與歷史版本
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="AI 分析結果庫")
+    parser.add_argument("--db", help="資料庫路徑，預設 Results/results.sqlite3（可由 RESULTS_DB_PATH 設定）")
+    parser.add_argument("--import-dir", nargs="?", const=RESULTS_DIR, help="匯入 Results/result_*.json（預設 Results 資料夾）")
+    parser.add_argument("--customer", help="顯示指定客戶的所有分析版本")
+    parser.add_argument("--since", help="顯示此時間之後的分析（ISO 格式，如 2025-06-30T00:00:00）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = ResultStore(args.db)
+    if args.import_dir:
+        store.import_json_dir(args.import_dir)
+
+    def describe(record):
+        result = record["result"]
+        created_at = datetime.fromtimestamp(record["created_at"]).isoformat(timespec="seconds")
+        return (f"#{record['id']} {record['customer_id']} {created_at} [{record['source']}] "
+                f"總分 {result.get('total_score')}，等級 {result.get('grade')}")
+
+    if args.customer:
+        for record in store.history(args.customer):
+            print(describe(record))
+    if args.since:
+        for record in store.since(datetime.fromisoformat(args.since).timestamp()):
+            print(describe(record))
+    print(f"結果庫共 {store.count()} 筆分析：{store.path}")
@@ -0,0 +1,234 @@
+import logging
+import threading
+from functools import lru_cache
+
+import config_rules
+
+logger = logging.getLogger(__name__)
+
+
+# --- 清單欄位彙總方式 ---
+
+def _present(values):
+    return [v for v in values if v is not None and v != ""]
+
+
+def _agg_sum(values):
+    values = _present(values)
+    return sum(values) if values else None
+
+
+def _agg_any(values):
+    values = _present(values)
+    return any(values) if values else None
+
+
+def _agg_max(values):
+    values = _present(values)
+    return max(values) if values else None
+
+
+def _agg_first(values):
+    values = _present(values)
+    return values[0] if values else None
+
+
+def _agg_prefer_cancelled(values):
+    # 保單狀態：任一筆為「退保」即視為退保
+    values = _present(values)
+    if "退保" in values:
+        return "退保"
+    return values[0] if values else None
+
+
+def _agg_auto(values):
+    # 未指定時依值型別推斷：布林取 any、數值加總、其餘取第一個非空值
+    values = _present(values)
+    if not values:
+        return None
+    if all(isinstance(v, bool) for v in values):
+        return any(values)
+    if all(isinstance(v, (int, float)) for v in values):
+        return sum(values)
+    return values[0]
+
+
+AGGREGATORS = {
+    "sum": _agg_sum,
+    "any": _agg_any,
+    "max": _agg_max,
+    "first": _agg_first,
+    "prefer_cancelled": _agg_prefer_cancelled,
+    "auto": _agg_auto,
+}
+
+# 經過清單（如 claim_records、insurance_history）的 keyword 彙總方式
+LIST_AGGREGATIONS = {
+    "claim_records.claim_count": "sum",
+    "claim_records.total_claim_amount": "sum",
+    "claim_records.disputed": "any",
+    "insurance_history.status": "prefer_cancelled",
+    "insurance_history.cancel_reason": "first",
+}
+
+
+def _compile_path(keys, aggregate):
+    """依預先切好的 key tuple 建立取值函式；遇到 list 時以後段路徑的取值函式逐筆取值再彙總"""
+    if not keys:
+        return lambda data: data
+    head = keys[0]
+    rest = _compile_path(keys[1:], aggregate)
+
+    def access(data):
+        if isinstance(data, dict):
+            if head not in data:
+                return None
+            return rest(data[head])
+        if isinstance(data, list):
+            return aggregate([access(item) for item in data])
+        return None
+    return access
+
+
+@lru_cache(maxsize=None)
+def get_accessor(key_path: str, aggregate: str = None):
+    """
+    取得 dotted key path 的預編譯取值函式（同一路徑只編譯一次）
+    Args:
+        key_path (str): 如 "credit_alert.bad_debt"、"claim_records.total_claim_amount"
+        aggregate (str): 路徑經過 list 時的彙總方式（sum/any/max/first/prefer_cancelled/auto），
+            預設依 LIST_AGGREGATIONS，未列出者為 auto
+    Returns:
+        callable: accessor(data) -> 值，找不到時回傳 None
+    """
+    aggregate = aggregate or LIST_AGGREGATIONS.get(key_path, "auto")
+    return _compile_path(tuple(key_path.split(".")), AGGREGATORS[aggregate])
+
+
+def _keyword_tree(keywords):
+    """將 dotted keyword 清單轉為巢狀 dict 樹，如 claim_records.disputed → {"claim_records": {"disputed": {}}}"""
+    tree = {}
+    for keyword in keywords:
+        node = tree
+        for key in keyword.split("."):
+            node = node.setdefault(key, {})
+    return tree
+
+
+def _compile_projection(tree):
+    if not tree:
+        return lambda value: value
+    children = [(key, _compile_projection(subtree)) for key, subtree in tree.items()]
+
+    def project(value):
+        if isinstance(value, list):
+            return [project(item) for item in value]
+        if isinstance(value, dict):
+            return {key: child(value[key]) for key, child in children if key in value}
+        return value
+    return project
+
+
+@lru_cache(maxsize=None)
+def get_projector(keywords: tuple):
+    """
+    取得只保留指定 keywords（dotted path，清單欄位逐筆投影）的預編譯投影函式
+    """
+    return _compile_projection(_keyword_tree(keywords))
+
+
+class CompiledRule:
+    """一條 config_rules 規則的預編譯結果：中繼資料與各 keyword 的取值函式"""
+
+    __slots__ = ("group", "rule", "rule_class", "required", "description", "keywords", "accessors")
+
+    def __init__(self, group, rule):
+        self.group = group
+        self.rule = rule.get("rule")
+        self.rule_class = rule.get("class")
+        self.required = bool(rule.get("required", False))
+        self.description = rule.get("description", "")
+        self.keywords = tuple(rule.get("keywords", []))
+        self.accessors = {kw: get_accessor(kw) for kw in self.keywords}
+
+    def extract(self, customer_data):
+        """回傳此規則所有 keyword 的值 {keyword: value}"""
+        return {kw: accessor(customer_data) for kw, accessor in self.accessors.items()}
+
+
+def compile_rules(rules: dict):
+    """
+    將規則設定編譯為 {規則組名稱: [CompiledRule, ...]}
+    """
+    compiled = {}
+    for group_name, rule_group in rules.items():
+        if not isinstance(rule_group, list):
+            continue
+        compiled[group_name] = [CompiledRule(group_name, rule) for rule in rule_group if isinstance(rule, dict)]
+    return compiled
+
+
+# 於 import 時編譯一次，UI、payload 投影與本機計分共用
+COMPILED_RULES = compile_rules(config_rules.config_rules)
+
+
+def get_compiled_rules(rules: dict):
+    """
+    取得規則的編譯結果；傳入的正是 config_rules.config_rules 時直接沿用 import 時編譯好的版本
+    """
+    if rules is config_rules.config_rules:
+        return COMPILED_RULES
+    return compile_rules(rules)
+
+
+class RuleIndex:
+    """
+    規則查詢索引：單次走訪編譯後的規則，建立
+    keyword -> 類別 / 是否必要 / 規則名稱 / 描述，類別 -> 描述，以及類別 -> keywords 反查。
+    同一 keyword 出現在多個規則組時以最後出現者為準（與原本逐一建立對照表的結果相同）
+    """
+
+    __slots__ = ("rules", "keyword_class", "keyword_required", "keyword_rule", "keyword_description",
+                 "class_description", "class_keywords")
+
+    def __init__(self, rules: dict):
+        # 保留規則物件的參照，以 id(rules) 作為快取 key 時不會被其他物件重用
+        self.rules = rules
+        self.keyword_class = {}
+        self.keyword_required = {}
+        self.keyword_rule = {}
+        self.keyword_description = {}
+        self.class_description = {}
+        class_keywords = {}
+        for compiled_group in get_compiled_rules(rules).values():
+            for compiled in compiled_group:
+                self.class_description[compiled.rule_class] = compiled.description
+                seen = class_keywords.setdefault(compiled.rule_class, {})
+                for kw in compiled.keywords:
+                    self.keyword_class[kw] = compiled.rule_class
+                    self.keyword_required[kw] = compiled.required
+                    self.keyword_rule[kw] = compiled.rule
+                    self.keyword_description[kw] = compiled.description
+                    seen[kw] = None
+        self.class_keywords = {cls: tuple(keywords) for cls, keywords in class_keywords.items()}
+
+    def keywords_of(self, rule_class):
+        """類別底下的所有 keyword（依規則出現順序，不重複）"""
+        return self.class_keywords.get(rule_class, ())
+
+
+_default_rule_index = None
+_default_rule_index_lock = threading.Lock()
+
+
+def get_rule_index(rules: dict = None):
+    """
+    取得程序內共用的 RuleIndex（Streamlit 各頁面與 session 共用），預設為 config_rules.config_rules；
+    規則物件改變（如 config_rules 重新載入）時才重建
+    """
+    global _default_rule_index
+    rules = rules if rules is not None else config_rules.config_rules
+    with _default_rule_index_lock:
+        if _default_rule_index is None or _default_rule_index.rules is not rules:
+            _default_rule_index = RuleIndex(rules)
+        return _default_rule_index
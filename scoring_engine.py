@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import logging
+
+from rule_compiler import get_accessor, get_compiled_rules
+
+logger = logging.getLogger(__name__)
+
+# 分數區間對應等級（與 Langflow 評分工具說明一致）：A+ 65-70、A 55-64、B 45-54、C 44 以下
+GRADE_THRESHOLDS = [(65, "A+"), (55, "A"), (45, "B")]
+LOWEST_GRADE = "C"
+
+
+def _parse_wan(text):
+    """
+    從財力說明擷取金額（單位：萬），如「月收入5萬」→ 5、「無固定收入」→ 0
+    """
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return float(text) / 10000
+    match = re.search(r"(\d+(?:\.\d+)?)\s*萬", str(text or ""))
+    if match:
+        return float(match.group(1))
+    match = re.search(r"(\d+(?:\.\d+)?)\s*元", str(text or ""))
+    return float(match.group(1)) / 10000 if match else 0.0
+
+
+def _score_property_proof(value):
+    amount = _parse_wan(value)
+    if amount < 3:
+        return 1
+    if amount <= 6:
+        return 3
+    return 5
+
+
+def _score_credit_rating(value):
+    return {"AAA": 5, "AA": 4, "A": 3}.get(str(value or "").strip().upper(), 1)
+
+
+def _score_count(value):
+    count = int(value or 0)
+    if count == 0:
+        return 5
+    if count <= 2:
+        return 3
+    return 1
+
+
+def _score_flag(value):
+    return 1 if value else 5
+
+
+def _score_claim_amount(value):
+    amount = float(value or 0)
+    if amount <= 0:
+        return 5
+    if amount <= 100000:
+        return 3
+    return 1
+
+
+def _score_age(value):
+    age = int(value or 0)
+    if age <= 30:
+        return 5
+    if age <= 50:
+        return 3
+    return 1
+
+
+def _score_health_status(value):
+    return {"良好": 5, "一般": 3}.get(str(value or "").strip(), 1)
+
+
+def _score_policy_status(value):
+    return 1 if value == "退保" else 5
+
+
+def _score_cancel_reason(value):
+    if not value:
+        return 5
+    return 1 if "財務" in str(value) else 3
+
+
+FLAG_RULE = "False：5分；True：1分"
+REVIEW_RULE = "無：5分；有：1分"
+COUNT_RULE = "0次：5分；1-2次：3分；3次以上：1分"
+
+# keyword -> (規則描述, 計分函式)
+SCORING_RULES = {
+    "property_proof": ("3萬以下：1分；3~6萬：3分；6萬↑：5分", _score_property_proof),
+    "age": ("18~30歲：5分；31~50歲：3分；51歲以上：1分", _score_age),
+    "health_status": ("良好：5分；一般：3分；不佳：1分", _score_health_status),
+    "smoking": ("不吸菸：5分；吸菸：1分", _score_flag),
+    "credit_rating": ("AAA：5分；AA：4分；A：3分；BBB以下：1分", _score_credit_rating),
+    "credit_alert.credit_card_overdue_count": (COUNT_RULE, _score_count),
+    "credit_alert.bad_debt": (FLAG_RULE, _score_flag),
+    "credit_alert.joint_credit_warning": (FLAG_RULE, _score_flag),
+    "credit_alert.over_insurance": (FLAG_RULE, _score_flag),
+    "credit_alert.duplicate_insurance": (FLAG_RULE, _score_flag),
+    "credit_alert.abnormal_insurance": (FLAG_RULE, _score_flag),
+    "claim_records.claim_count": (COUNT_RULE, _score_count),
+    "claim_records.total_claim_amount": ("0元：5分；0元以上~10萬元以內：3分；10萬元以上：1分", _score_claim_amount),
+    "claim_records.disputed": (FLAG_RULE, _score_flag),
+    "insurance_history.status": ("投保中：5分；退保：1分", _score_policy_status),
+    "insurance_history.cancel_reason": ("無退保：5分；財務困難：1分；其他原因：3分", _score_cancel_reason),
+    "review_records.manual_reviewed": (REVIEW_RULE, _score_flag),
+    "review_records.rejected": (REVIEW_RULE, _score_flag),
+    "review_records.pending": (REVIEW_RULE, _score_flag),
+    "criminal_record.has_record": (FLAG_RULE, _score_flag),
+    "criminal_record.blacklist": (FLAG_RULE, _score_flag),
+    "suspicious_transaction.money_laundering": (FLAG_RULE, _score_flag),
+    "suspicious_transaction.terrorist_financing": (FLAG_RULE, _score_flag),
+}
+
+
+def resolve_keyword(data, key_path):
+    """
+    依 dotted key path 取值（使用 rule_compiler 預編譯的取值函式），清單欄位依 LIST_AGGREGATIONS 彙總，找不到回傳 None
+    """
+    return get_accessor(key_path)(data)
+
+
+def grade_for(total_score):
+    """
+    依總分對應等級
+    """
+    for threshold, grade in GRADE_THRESHOLDS:
+        if total_score >= threshold:
+            return grade
+    return LOWEST_GRADE
+
+
+def score_customer(customer_data: dict, rules: dict, product=None):
+    """
+    在本機依評分標準逐項計分，產生與 Results/result_*.json 相同結構的評分結果
+    Args:
+        customer_data (dict): 合併後的客戶資料（基本資訊＋過往紀錄）
+        rules (dict): config_rules 規則
+        product (str): 保單類別，預設取 customer_data["希望購買保單"]
+    Returns:
+        dict: {"score_table": [...], "score_formula": str, "total_score": int, "grade": str} 或 None
+    """
+    product = product or customer_data.get("希望購買保單")
+    compiled_group = get_compiled_rules(rules).get(f"{product}規則")
+    if compiled_group is None:
+        logger.error(f"找不到保單類別「{product}」對應的規則")
+        return None
+
+    score_table = []
+    for compiled_rule in compiled_group:
+        for keyword, accessor in compiled_rule.accessors.items():
+            if keyword not in SCORING_RULES:
+                logger.warning(f"未定義評分標準的項目：{keyword}")
+                continue
+            rule_desc, scorer = SCORING_RULES[keyword]
+            value = accessor(customer_data)
+            score_table.append({
+                "項目": keyword,
+                "值": value,
+                "規則": rule_desc,
+                "分數": scorer(value),
+            })
+
+    scores = [row["分數"] for row in score_table]
+    total_score = sum(scores)
+    return {
+        "score_table": score_table,
+        "score_formula": "+".join(str(s) for s in scores) + f"={total_score}",
+        "total_score": total_score,
+        "grade": grade_for(total_score),
+    }
+
+
+def compare_with_saved(local_result, saved_result):
+    """
+    比對本機評分與既有 AI 分析結果，回傳差異清單（空清單代表一致）
+    """
+    diffs = []
+    saved_scores = {row.get("項目"): row.get("分數") for row in saved_result.get("score_table", [])}
+    local_scores = {row["項目"]: row["分數"] for row in local_result["score_table"]}
+    for keyword in sorted(set(saved_scores) | set(local_scores)):
+        if saved_scores.get(keyword) != local_scores.get(keyword):
+            diffs.append(f"{keyword}: 本機 {local_scores.get(keyword)} / 既有 {saved_scores.get(keyword)}")
+    for field in ("total_score", "grade"):
+        if saved_result.get(field) != local_result[field]:
+            diffs.append(f"{field}: 本機 {local_result[field]} / 既有 {saved_result.get(field)}")
+    return diffs
+
+
+if __name__ == "__main__":
+    # 以既有 Results/result_*.json 驗證本機評分結果
+    import time
+    import config_rules
+    from customer_store import merge_customer_data
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(base_dir, "客戶基本資訊/基本資訊.json"), "r", encoding="utf-8") as f:
+        basic_info = json.load(f)
+    with open(os.path.join(base_dir, "客戶過往紀錄/過往紀錄.json"), "r", encoding="utf-8") as f:
+        history_by_id = {h.get("customer_id"): h for h in json.load(f)}
+
+    results_dir = os.path.join(base_dir, "Results")
+    for customer_base in basic_info:
+        customer_id = customer_base.get("customer_id")
+        customer_data = merge_customer_data(customer_base, history_by_id.get(customer_id))
+        started = time.perf_counter()
+        local_result = score_customer(customer_data, config_rules.config_rules)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        if local_result is None:
+            continue
+        print(f"{customer_id}：總分 {local_result['total_score']}，等級 {local_result['grade']}（{elapsed_us:.0f} µs）")
+
+        result_path = os.path.join(results_dir, f"result_{customer_id}.json")
+        if not os.path.exists(result_path):
+            continue
+        with open(result_path, "r", encoding="utf-8") as f:
+            saved_result = json.load(f)
+        diffs = compare_with_saved(local_result, saved_result)
+        if diffs:
+            print("  與既有結果差異：")
+            for diff in diffs:
+                print(f"    - {diff}")
+        else:
+            print("  與既有結果一致")
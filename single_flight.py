@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from env_flags import env_flag
+from metrics import AGENT_SINGLE_FLIGHT
+from result_writer import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# 跨程序模式下等待鎖的輪詢間隔與共享結果檔保留秒數
+LOCK_POLL_SECONDS = 0.1
+RESULT_TTL_SECONDS = 300
+
+
+def single_flight_enabled():
+    """是否合併相同的進行中請求，預設開啟，可由環境變數 SINGLE_FLIGHT=0 關閉"""
+    return env_flag("SINGLE_FLIGHT", True)
+
+
+class _Flight:
+    """一次進行中的上游呼叫：leader 完成後喚醒所有 follower"""
+
+    def __init__(self, key):
+        self.key = key
+        self.followers = 0
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def resolve(self, result=None, error=None):
+        self.result, self.error = result, error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """等待 leader 的結果；leader 失敗時拋出同一個例外，逾時回傳 None"""
+        if not self._done.wait(timeout):
+            logger.warning(f"等待進行中的相同請求逾時（{timeout} 秒）")
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _ProcessClaim:
+    """
+    跨程序的 leader 身分：持有 <key>.lock 期間即為唯一呼叫上游的程序；
+    shared 為 True 時表示已取得其他程序剛完成的結果（result），不需再呼叫
+    """
+
+    def __init__(self, directory=None, key=None):
+        self.directory = directory
+        self.key = key
+        self.shared = False
+        self.result = None
+        self._lock_file = None
+
+    @property
+    def result_path(self):
+        return os.path.join(self.directory, f"{self.key}.json")
+
+    @property
+    def lock_path(self):
+        return os.path.join(self.directory, f"{self.key}.lock")
+
+    def _locked(self):
+        """嘗試取得鎖；取得的若是已被 _cleanup 刪除的舊 lock 檔（路徑已指向新檔或不存在），改開目前的檔案重試"""
+        while _try_lock(self._lock_file):
+            if _is_current(self._lock_file, self.lock_path):
+                return True
+            self._lock_file.close()
+            self._lock_file = open(self.lock_path, "a+b")
+        return False
+
+    def acquire(self, timeout):
+        started = time.time()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_file = open(self.lock_path, "a+b")
+            if self._locked():
+                return self
+        except OSError as e:
+            logger.warning(f"無法建立 single-flight lock 檔，改為只在程序內合併：{e}")
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+            return self
+        # 其他程序正在呼叫：等它釋放鎖後讀取它寫出的結果
+        AGENT_SINGLE_FLIGHT.inc(role="process_follower")
+        while not self._locked():
+            if time.time() - started > timeout:
+                logger.warning(f"等待其他程序的相同請求逾時（{timeout} 秒），改為自行呼叫")
+                self._lock_file.close()
+                self._lock_file = None
+                return self
+            time.sleep(LOCK_POLL_SECONDS)
+        try:
+            with open(self.result_path, "r", encoding="utf-8") as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            published = None
+        # 只採用等待期間才完成的結果，避免拿到更早之前的舊結果
+        if published and published.get("finished_at", 0) >= started:
+            self.shared, self.result = True, published.get("result")
+        return self
+
+    def release(self, result=None):
+        if self._lock_file is None:
+            return
+        try:
+            if not self.shared:
+                try:
+                    atomic_write_json(self.result_path, {"finished_at": time.time(), "result": result}, indent=None)
+                except OSError as e:
+                    logger.warning(f"寫出共享結果失敗：{e}")
+            _unlock(self._lock_file)
+        finally:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def _try_lock(lock_file):
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _is_current(lock_file, path):
+    """已開啟的 lock 檔是否仍是 path 目前指向的檔案"""
+    try:
+        return os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path))
+    except OSError:
+        return False
+
+
+def _remove_idle_lock(path):
+    """
+    刪除目前沒有程序持有的 lock 檔。POSIX 在持有鎖時刪除，之前已開啟此檔的程序取得鎖後會發現檔案已被刪除而改開新檔；
+    Windows 上仍被其他程序開啟的檔案無法刪除（PermissionError），關閉後再刪除即可
+    """
+    try:
+        with open(path, "a+b") as lock_file:
+            if not _try_lock(lock_file):
+                return
+            if fcntl is not None:
+                os.remove(path)
+            _unlock(lock_file)
+        if fcntl is None:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+class SingleFlight:
+    """
+    進行中請求登記表：相同 key（相同客戶資料與規則）同時只有一個呼叫者（leader）實際呼叫上游，
+    其他呼叫者（follower）等待並取得同一份結果。
+    設定 lock_dir（或環境變數 SINGLE_FLIGHT_DIR）時，另以 lock file 在多個程序間協調。
+
+    用法：
+        result, shared = get_single_flight().do(key, lambda: call_upstream(...))
+    timeout 預設為 None（不另設期限）：follower 等到 leader 結束為止，leader 的呼叫本身須有逾時
+    """
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = lock_dir if lock_dir is not None else os.getenv("SINGLE_FLIGHT_DIR")
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+    def join(self, key):
+        """
+        登記一個請求
+        Returns:
+            tuple: (_Flight, 是否為 leader)；leader 完成後須呼叫 finish()，follower 呼叫 flight.wait()
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                AGENT_SINGLE_FLIGHT.inc(role="follower")
+                return flight, False
+            flight = self._flights[key] = _Flight(key)
+        AGENT_SINGLE_FLIGHT.inc(role="leader")
+        return flight, True
+
+    def finish(self, flight, result=None, error=None):
+        """leader 完成：移出登記表並喚醒 follower（之後的新請求會重新呼叫上游）"""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if flight.followers:
+            logger.info(f"相同請求共用一次上游呼叫（另有 {flight.followers} 個等待者）")
+        flight.resolve(result, error)
+
+    def claim(self, key, timeout=None):
+        """
+        leader 取得跨程序的呼叫權（未設定 lock_dir 時直接成為 leader），完成後須呼叫 release(result)；
+        timeout 為等待其他程序的秒數上限，None 時等到對方釋放鎖（程序結束時鎖亦會釋放）
+        """
+        if not self.lock_dir:
+            return _ProcessClaim()
+        self._cleanup()
+        return _ProcessClaim(self.lock_dir, key).acquire(timeout if timeout is not None else float("inf"))
+
+    def do(self, key, fn, timeout=None):
+        """
+        以 single-flight 方式執行 fn()
+        Returns:
+            tuple: (結果, 是否共用了其他呼叫者的結果)
+        """
+        flight, leader = self.join(key)
+        if not leader:
+            return flight.wait(timeout), True
+        result = None
+        try:
+            claim = self.claim(key, timeout)
+            try:
+                result = claim.result if claim.shared else fn()
+            finally:
+                claim.release(result)
+        except BaseException as e:
+            self.finish(flight, error=e)
+            raise
+        self.finish(flight, result)
+        return result, claim.shared
+
+    def in_flight(self):
+        """目前進行中的 key 數"""
+        with self._lock:
+            return len(self._flights)
+
+    def _cleanup(self):
+        # 最多每分鐘清理一次過期的共享結果檔與沒有程序持有的 lock 檔（每個 key 一個，不清理會無限累積）
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        try:
+            for entry in os.scandir(self.lock_dir):
+                if entry.name.endswith(".json") and now - entry.stat().st_mtime > RESULT_TTL_SECONDS:
+                    os.remove(entry.path)
+                elif entry.name.endswith(".lock"):
+                    _remove_idle_lock(entry.path)
+        except OSError:
+            pass
+
+
+_default_single_flight = None
+_default_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """取得程序內共用的 SingleFlight（跨程序模式由 SINGLE_FLIGHT_DIR 啟用）"""
+    global _default_single_flight
+    with _default_single_flight_lock:
+        if _default_single_flight is None:
+            _default_single_flight = SingleFlight()
+        return _default_single_flight
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模組皆位於專案根目錄（非套件），測試時加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
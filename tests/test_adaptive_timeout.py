@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from adaptive_timeout import RUN, STREAM, AdaptiveTimeouts, RollingHistogram, product_of
+
+
+def test_quantile_is_bucket_upper_bound():
+    histogram = RollingHistogram(buckets=(1, 2, 4, 8), window=60, slots=6)
+    for seconds in (0.5, 1.5, 1.5, 3, 7):
+        histogram.observe(seconds, now=0)
+    assert histogram.quantile(0.5, now=0) == (2, 5)
+    assert histogram.quantile(0.99, now=0) == (8, 5)
+    histogram.observe(100, now=0)
+    assert histogram.quantile(1.0, now=0) == (float("inf"), 6)
+
+
+def test_window_expiry_drops_old_slots():
+    histogram = RollingHistogram(buckets=(1, 10), window=60, slots=6)
+    histogram.observe(5, now=0)
+    histogram.observe(0.5, now=30)
+    assert sum(histogram.counts(now=30)) == 2
+    # 第 0 秒的區段在 60 秒後滑出視窗，只剩第 30 秒的觀測
+    assert histogram.counts(now=65) == [1, 0, 0]
+    assert histogram.quantile(0.99, now=65) == (1, 1)
+    assert histogram.quantile(0.99, now=200) == (None, 0)
+
+
+def test_snapshot_lists_cumulative_counts():
+    histogram = RollingHistogram(buckets=(1, 2, 4), window=60, slots=6)
+    for seconds in (0.5, 3, 3):
+        histogram.observe(seconds, now=0)
+    assert histogram.snapshot(now=0) == {"buckets": [(1, 1), (4, 3)], "count": 3}
+
+
+def test_timeout_uses_default_until_enough_samples():
+    timeouts = AdaptiveTimeouts(default=60, min_samples=3, headroom=2, min_timeout=1, max_timeout=100)
+    timeouts.observe(RUN, "醫療險", 4)
+    assert timeouts.timeout_for(RUN, "醫療險") == (60, "default")
+    for _ in range(2):
+        timeouts.observe(RUN, "醫療險", 4)
+    timeout, source = timeouts.timeout_for(RUN, "醫療險")
+    assert source == "observed"
+    assert 8 <= timeout <= 10
+    # 端點與保單類別各自獨立
+    assert timeouts.timeout_for(STREAM, "醫療險") == (60, "default")
+    assert timeouts.timeout_for(RUN, "壽險") == (60, "default")
+
+
+def test_timeout_is_clamped():
+    timeouts = AdaptiveTimeouts(min_samples=1, headroom=1.5, min_timeout=5, max_timeout=20)
+    timeouts.observe(RUN, "fast", 0.1)
+    timeouts.observe(RUN, "slow", 100)
+    assert timeouts.timeout_for(RUN, "fast")[0] == 5
+    assert timeouts.timeout_for(RUN, "slow")[0] == 20
+
+
+def test_disabled_uses_fixed_default():
+    timeouts = AdaptiveTimeouts(default=42, min_samples=1, enabled=False)
+    timeouts.observe(RUN, "x", 1)
+    assert timeouts.timeout_for(RUN, "x") == (42, "default")
+
+
+def test_measure_records_success_and_timeout_only():
+    timeouts = AdaptiveTimeouts(min_samples=1)
+    with timeouts.measure(RUN, "a") as sample:
+        sample["ok"] = True
+    with timeouts.measure(RUN, "b"):
+        pass
+    with pytest.raises(asyncio.TimeoutError):
+        with timeouts.measure(RUN, "c"):
+            raise asyncio.TimeoutError()
+    with pytest.raises(ConnectionError):
+        with timeouts.measure(RUN, "d"):
+            raise ConnectionError()
+    samples = {row["product"]: row["samples"] for row in timeouts.snapshot()}
+    assert samples == {"a": 1, "c": 1}
+
+
+def test_product_of():
+    assert product_of({"希望購買保單": "壽險"}) == "壽險"
+    assert product_of({}) == "unknown"
+    assert product_of(None) == "unknown"
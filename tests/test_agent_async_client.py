@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from agent_async_client import AgentAPIError, AgentClient
+from mock_langflow_server import start_in_thread
+from payload_builder import build_agent_payload
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**options):
+        options.setdefault("seed", 1)
+        server, url = start_in_thread(**options)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _payload(customer_id="C001"):
+    return build_agent_payload({"customer_id": customer_id, "希望購買保單": "醫療險"}, {}, slim=False)
+
+
+async def _post_many(url, count, timeout=5):
+    async with AgentClient(api_url=url, api_token="") as client:
+        return [await client.post_json(_payload(), timeout=timeout) for _ in range(count)]
+
+
+def test_post_json_reuses_keep_alive_connection(mock_server):
+    server, url = mock_server()
+    responses = asyncio.run(_post_many(url, 5))
+    assert [status for status, _ in responses] == [200] * 5
+    assert responses[0][1]["outputs"][0]["outputs"][0]["results"]["message"]["text"].startswith("```json")
+    stats = server.stats_snapshot()
+    assert stats["ok"] == 5
+    assert stats["connections"] == 1
+
+
+def test_post_json_timeout(mock_server):
+    _, url = mock_server(latency="1")
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(_post_many(url, 1, timeout=0.2))
+
+
+def test_post_json_non_2xx_raises_with_status(mock_server):
+    _, url = mock_server(error_rate=1.0, error_statuses=(503,))
+    with pytest.raises(AgentAPIError) as excinfo:
+        asyncio.run(_post_many(url, 1))
+    assert excinfo.value.status == 503
+
+
+def test_post_json_requires_token(mock_server):
+    _, url = mock_server(token="secret")
+
+    async def post(token):
+        async with AgentClient(api_url=url, api_token=token) as client:
+            return await client.post_json(_payload(), timeout=5)
+
+    assert asyncio.run(post("secret"))[0] == 200
+    with pytest.raises(AgentAPIError) as excinfo:
+        asyncio.run(post("wrong"))
+    assert excinfo.value.status == 403
+
+
+@pytest.mark.parametrize("kind", ["html", "truncated_json", "empty"])
+def test_post_json_malformed_body(mock_server, kind):
+    _, url = mock_server(malformed_rate=1.0, malformed_kinds=(kind,))
+    with pytest.raises(ValueError):
+        asyncio.run(_post_many(url, 1))
+
+
+def test_post_json_connection_refused():
+    # 沒有伺服器監聽的 port：httpx 的連線錯誤轉為內建 ConnectionError，供 resilience 判斷重試
+    server, url = start_in_thread()
+    server.shutdown()
+    server.server_close()
+    with pytest.raises(ConnectionError):
+        asyncio.run(_post_many(url, 1))
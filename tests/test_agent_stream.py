@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+import agent_async_client
+import analysis_snapshots
+from agent_api_client import analyze_customer_stream
+from agent_async_client import AgentAPIError, AgentClient
+from mock_langflow_server import load_replay_results, start_in_thread
+from payload_builder import build_agent_payload
+from rate_limiter import RateLimiter
+
+CUSTOMER = {"customer_id": "C00009", "希望購買保單": "財產保險"}
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**options):
+        options.setdefault("seed", 1)
+        options.setdefault("token_delay", 0)
+        server, url = start_in_thread(**options)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    # 分析快照與限流狀態不寫入/沿用專案的共用實例
+    monkeypatch.setattr(analysis_snapshots, "_default_snapshots", analysis_snapshots.AnalysisSnapshots(
+        str(tmp_path / "snapshots.sqlite3")))
+    monkeypatch.setattr(agent_async_client, "get_rate_limiter", lambda: RateLimiter())
+
+
+async def _collect(url, customer=CUSTOMER, timeout=5):
+    async with AgentClient(api_url=url, api_token="") as client:
+        payload = build_agent_payload(customer, {}, slim=False)
+        return [event async for event in client.stream_json(payload, timeout=timeout)]
+
+
+@pytest.mark.parametrize("sse", [False, True], ids=["ndjson", "sse"])
+def test_stream_json_events(mock_server, sse):
+    server, url = mock_server(sse=sse, chunk_chars=16)
+    events = asyncio.run(_collect(url))
+    names = [event["event"] for event in events]
+    assert names[0] == "add_message"
+    assert names[-1] == "end"
+    assert set(names[1:-1]) == {"token"}
+    # 逐段 token 組回的文字與 end 事件的完整結果一致
+    text = "".join(event["data"]["chunk"] for event in events if event["event"] == "token")
+    result = events[-1]["data"]["result"]
+    assert result["outputs"][0]["outputs"][0]["results"]["message"]["text"] == text
+    assert json.loads(text.strip("`").removeprefix("json")) == load_replay_results()["C00009"]
+
+
+def test_stream_json_timeout(mock_server):
+    _, url = mock_server(token_delay=0.05, chunk_chars=1)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(_collect(url, timeout=0.3))
+
+
+def test_stream_json_non_2xx(mock_server):
+    _, url = mock_server(error_rate=1.0, error_statuses=(502,))
+    with pytest.raises(AgentAPIError) as excinfo:
+        asyncio.run(_collect(url))
+    assert excinfo.value.status == 502
+
+
+@pytest.mark.parametrize("sse", [False, True], ids=["ndjson", "sse"])
+def test_analyze_customer_stream(mock_server, monkeypatch, sse):
+    _, url = mock_server(sse=sse)
+    monkeypatch.setenv("API_URL", url)
+    monkeypatch.setenv("API_TOKEN", "")
+    events = list(analyze_customer_stream(CUSTOMER, {}, timeout=5, use_cache=False))
+    assert events[-1]["event"] == "result"
+    assert [event["event"] for event in events[:-1]] == ["token"] * (len(events) - 1)
+    assert events[-1]["result"] == load_replay_results()["C00009"]
+    assert events[-1]["from_cache"] is False
+    assert events[-1]["complete"] is True
+    assert events[-2]["text"] == "".join(event["chunk"] for event in events[:-1])
+    # 完整結果才記錄分析快照
+    assert analysis_snapshots.get_analysis_snapshots().get("C00009") is not None
+
+
+def test_analyze_customer_stream_upstream_error(mock_server, monkeypatch):
+    _, url = mock_server(error_rate=1.0, error_statuses=(400,))
+    monkeypatch.setenv("API_URL", url)
+    monkeypatch.setenv("API_TOKEN", "")
+    events = list(analyze_customer_stream(CUSTOMER, {}, timeout=5, use_cache=False))
+    assert events == [{"event": "result", "result": None, "from_cache": False, "complete": False}]
+    assert analysis_snapshots.get_analysis_snapshots().get("C00009") is None
@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+import analysis_jobs
+from analysis_jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobExecutor
+
+RULES = {"醫療險": []}
+RESULT = {"total_score": 60, "grade": "A"}
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """以可控制的假分析取代實際 API 呼叫；release 設定前所有分析都會卡住"""
+    state = {"release": threading.Event(), "started": [], "saved": [], "result": RESULT, "error": None}
+    started_event = threading.Event()
+
+    def analyze_customer(customer_data, rules, timeout=None):
+        state["started"].append(customer_data["customer_id"])
+        started_event.set()
+        assert state["release"].wait(10)
+        if state["error"]:
+            raise state["error"]
+        return state["result"], False, True
+
+    state["started_event"] = started_event
+    monkeypatch.setattr(analysis_jobs, "analyze_customer", analyze_customer)
+    monkeypatch.setattr(analysis_jobs, "save_results",
+                        lambda result, customer_id, **kwargs: state["saved"].append((customer_id, kwargs["source"])))
+    return state
+
+
+@pytest.fixture
+def executor():
+    executor = JobExecutor(max_workers=1, max_finished=10, timeout=5, stream=False)
+    yield executor
+    executor._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _customer(customer_id):
+    return {"customer_id": customer_id, "name": f"客戶{customer_id}"}
+
+
+def test_duplicate_submit_returns_same_job(agent, executor):
+    job = executor.submit(_customer("C1"), RULES, owner="s1")
+    assert executor.submit(_customer("C1"), RULES, owner="s2") is job
+    # 規則不同（另一份物件）時視為不同工作
+    other = executor.submit(_customer("C1"), dict(RULES))
+    assert other is not job
+    agent["release"].set()
+    job.future.result(timeout=10)
+    other.future.result(timeout=10)
+    assert agent["started"] == ["C1", "C1"]
+    assert (job.status, job.result, job.stage) == (DONE, RESULT, "完成")
+    assert agent["saved"] == [("C1", "agent"), ("C1", "agent")]
+    # 已結束的工作不再沿用
+    assert executor.submit(_customer("C1"), RULES) is not job
+
+
+def test_cancel_only_queued_jobs(agent, executor):
+    running = executor.submit(_customer("C1"), RULES)
+    assert agent["started_event"].wait(10)
+    queued = executor.submit(_customer("C2"), RULES)
+    assert (running.status, queued.status) == (RUNNING, QUEUED)
+
+    assert executor.cancel(running.id) is False
+    assert executor.cancel(queued.id) is True
+    assert (queued.status, queued.stage) == (CANCELLED, "已取消")
+    assert executor.cancel(queued.id) is False
+    assert executor.cancel("unknown") is False
+
+    agent["release"].set()
+    running.future.result(timeout=10)
+    assert agent["started"] == ["C1"]
+    assert executor.counts() == {DONE: 1, CANCELLED: 1}
+
+
+def test_failed_analysis(agent, executor):
+    agent["release"].set()
+    agent["result"] = None
+    job = executor.submit(_customer("C1"), RULES)
+    job.future.result(timeout=10)
+    assert (job.status, job.error) == (FAILED, "API 呼叫失敗或回傳內容解析失敗")
+
+    agent["error"] = RuntimeError("boom")
+    job = executor.submit(_customer("C2"), RULES)
+    job.future.result(timeout=10)
+    assert (job.status, job.error, job.stage) == (FAILED, "RuntimeError: boom", "失敗")
+    assert job.customer_data is None
+    assert agent["saved"] == []
+
+
+def test_finished_jobs_are_pruned_and_filtered_by_owner(agent):
+    agent["release"].set()
+    executor = JobExecutor(max_workers=1, max_finished=2, timeout=5, stream=False)
+    try:
+        jobs = [executor.submit(_customer(f"C{i}"), RULES, owner="s1" if i % 2 else "s2") for i in range(4)]
+        for job in jobs:
+            job.future.result(timeout=10)
+        latest = executor.submit(_customer("C9"), RULES)
+        latest.future.result(timeout=10)
+    finally:
+        executor._executor.shutdown(wait=True)
+    # 送出 C9 時已結束 4 筆，只保留最新的 2 筆
+    assert executor.jobs() == [jobs[2], jobs[3], latest]
+    assert executor.jobs(owner="s1") == [jobs[3]]
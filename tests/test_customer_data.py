@@ -0,0 +1,103 @@
+import os
+import json
+
+import pytest
+
+import customer_data
+from customer_data import CustomerData, JsonArrayFile
+
+BASIC = [{"customer_id": "C1", "name": "甲"}, {"customer_id": "C2", "name": "乙"}]
+HISTORY = [{"customer_id": "C1", "claim_records": {"claim_count": 0}}]
+
+
+def _write(path, records, bump=0):
+    """寫入 JSON 陣列；bump 將 mtime 往後調整，避免同一時間刻度內的改寫被視為未異動"""
+    path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+    if bump:
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump * 1_000_000_000))
+
+
+@pytest.fixture
+def files(tmp_path):
+    basic, history = tmp_path / "basic.json", tmp_path / "history.json"
+    _write(basic, BASIC)
+    _write(history, HISTORY)
+    return basic, history
+
+
+def test_snapshot_is_reused_until_a_file_changes(files):
+    basic, history = files
+    data = CustomerData(str(basic), str(history))
+    first = data.snapshot()
+    customers, customer_dict, id_to_record = first
+    assert [c["customer_id"] for c in customers] == ["C1", "C2"]
+    assert customer_dict["乙"]["customer_id"] == "C2"
+    assert id_to_record["C1"]["claim_records"] == {"claim_count": 0}
+    assert data.snapshot() is first
+    assert [stats["version"] for stats in data.stats()] == [1, 1]
+
+    _write(history, HISTORY + [{"customer_id": "C2", "claim_records": {"claim_count": 3}}], bump=1)
+    second = data.snapshot()
+    assert second is not first
+    assert second[2]["C2"]["claim_records"] == {"claim_count": 3}
+    # 只有過往紀錄重新載入
+    assert [stats["version"] for stats in data.stats()] == [1, 2]
+
+
+def test_reload_keeps_unchanged_records(files):
+    basic, _ = files
+    cache = JsonArrayFile(str(basic), "customer_id")
+    assert cache.refresh() is True
+    c1, c2 = cache.by_key["C1"], cache.by_key["C2"]
+    assert cache.refresh() is False
+
+    _write(basic, [BASIC[0], dict(BASIC[1], name="乙改"), {"customer_id": "C3", "name": "丙"}], bump=1)
+    assert cache.refresh() is True
+    assert cache.by_key["C1"] is c1
+    assert cache.by_key["C2"] is not c2 and cache.by_key["C2"]["name"] == "乙改"
+    assert set(cache.by_key) == {"C1", "C2", "C3"}
+
+
+def test_atomic_replace_with_same_mtime_and_size_is_detected(files, tmp_path):
+    basic, _ = files
+    cache = JsonArrayFile(str(basic), "customer_id")
+    cache.refresh()
+    stat = os.stat(basic)
+    replacement = tmp_path / "basic.json.tmp"
+    _write(replacement, [dict(BASIC[0], name="丁"), BASIC[1]])
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, basic)
+    assert os.path.getsize(basic) == stat.st_size
+    assert cache.refresh() is True
+    assert cache.by_key["C1"]["name"] == "丁"
+
+
+@pytest.mark.parametrize("content", ["[{\"customer_id\": \"C1\"", "{\"customer_id\": \"C1\"}"])
+def test_bad_file_keeps_previous_records(files, content):
+    basic, history = files
+    data = CustomerData(str(basic), str(history))
+    before = data.snapshot()
+    basic.write_text(content, encoding="utf-8")
+    os.utime(basic, ns=(0, os.stat(history).st_mtime_ns + 1_000_000_000))
+    assert data.snapshot() is before
+    assert data.last_error
+    assert data.stats()[0]["error"] == data.last_error
+
+    _write(basic, BASIC[:1], bump=2)
+    assert [c["customer_id"] for c in data.snapshot()[0]] == ["C1"]
+    assert data.last_error is None
+
+
+def test_missing_file_reports_error(tmp_path, files):
+    _, history = files
+    data = CustomerData(str(tmp_path / "missing.json"), str(history))
+    customers, customer_dict, id_to_record = data.snapshot()
+    assert (customers, customer_dict) == ([], {})
+    assert "C1" in id_to_record
+    assert "missing.json" in data.last_error
+
+
+def test_get_customer_data_is_shared(monkeypatch):
+    monkeypatch.setattr(customer_data, "_default_customer_data", None)
+    assert customer_data.get_customer_data() is customer_data.get_customer_data()
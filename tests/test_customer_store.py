@@ -0,0 +1,70 @@
+import os
+import json
+import sqlite3
+
+from customer_store import CustomerRepository, merge_customer_data
+
+BASIC = [{"customer_id": "C2", "name": "乙", "希望購買保單": "壽險", "contact": {"phone": "1"}},
+         {"customer_id": "C1", "name": "甲", "希望購買保單": "醫療險"},
+         {"name": "沒有 ID"}]
+HISTORY = [{"customer_id": "C1", "credit_rating": "AA"}, {"customer_id": "C9", "credit_rating": "A"}]
+
+
+def _write(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_merge_customer_data_does_not_mutate_inputs():
+    base = {"customer_id": "C1", "contact": {"phone": "1"}}
+    merged = merge_customer_data(base, {"customer_id": "X", "credit_rating": "AA"})
+    merged["contact"]["phone"] = "2"
+    assert base == {"customer_id": "C1", "contact": {"phone": "1"}}
+    assert merged["customer_id"] == "C1" and merged["credit_rating"] == "AA"
+    assert merge_customer_data(None, None) == {}
+
+
+def test_lookups_by_id_and_name(tmp_path):
+    repo = CustomerRepository(str(tmp_path / "customers.sqlite3"))
+    assert repo.import_records(BASIC, HISTORY) == 3
+    assert repo.get("C1") == {"customer_id": "C1", "name": "甲", "希望購買保單": "醫療險", "credit_rating": "AA"}
+    assert repo.get_by_name("乙")["contact"] == {"phone": "1"}
+    assert repo.get("C404") is None and repo.get_by_name("無此人") is None
+    # 只有過往紀錄、沒有基本資訊的客戶
+    assert repo.get("C9") is None
+    assert repo.get_parts("C9") == (None, {"customer_id": "C9", "credit_rating": "A"})
+    assert repo.get_parts("C404") == (None, None)
+    assert repo.list_customers() == [("C1", "甲"), ("C2", "乙"), ("C9", None)]
+
+
+def test_name_lookup_uses_index(tmp_path):
+    repo = CustomerRepository(str(tmp_path / "customers.sqlite3"))
+    with sqlite3.connect(repo.path) as conn:
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT basic, history FROM customers WHERE name = ?", ("甲",)).fetchall()
+    assert any("idx_customers_name" in row[-1] for row in plan)
+
+
+def test_import_overwrites_and_replace_all(tmp_path):
+    repo = CustomerRepository(str(tmp_path / "customers.sqlite3"))
+    repo.import_records(BASIC, HISTORY)
+    repo.import_records([{"customer_id": "C1", "name": "甲2"}], [])
+    # 覆蓋整列：沒有一併提供的過往紀錄也會被清除
+    assert repo.get("C1") == {"customer_id": "C1", "name": "甲2"}
+    assert repo.count() == 3
+    repo.import_records([{"customer_id": "C3", "name": "丙"}], [], replace_all=True)
+    assert repo.list_customers() == [("C3", "丙")]
+
+
+def test_refresh_if_stale_follows_source_files(tmp_path):
+    basic_path, history_path = _write(tmp_path / "basic.json", BASIC), _write(tmp_path / "history.json", HISTORY)
+    repo = CustomerRepository(str(tmp_path / "customers.sqlite3"))
+    assert repo.refresh_if_stale(basic_path, history_path)
+    assert not repo.refresh_if_stale(basic_path, history_path)
+
+    _write(tmp_path / "basic.json", BASIC[:1])
+    stat = os.stat(basic_path)
+    os.utime(basic_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert repo.refresh_if_stale(basic_path, history_path)
+    # 全量重建：C1 只剩過往紀錄
+    assert repo.list_customers() == [("C1", None), ("C2", "乙"), ("C9", None)]
+    assert repo.get("C1") is None
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from customer_stream import hash_join, iter_customers, iter_json_array, merge_join
+
+BASIC = [{"customer_id": "C3", "name": "丙"}, {"customer_id": "C1", "name": "甲"}, {"customer_id": "C2", "name": "乙"}]
+HISTORY = [{"customer_id": "C2", "claim_records": {"claim_count": 1}},
+           {"customer_id": "C4", "claim_records": {"claim_count": 9}},
+           {"customer_id": "C3", "claim_records": {"claim_count": 0}}]
+EXPECTED = {"C1": {"customer_id": "C1", "name": "甲"},
+            "C2": {"customer_id": "C2", "name": "乙", "claim_records": {"claim_count": 1}},
+            "C3": {"customer_id": "C3", "name": "丙", "claim_records": {"claim_count": 0}}}
+
+
+def _write(path, records, indent=None):
+    path.write_text(json.dumps(records, ensure_ascii=False, indent=indent), encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64 * 1024])
+def test_iter_json_array_across_chunk_boundaries(tmp_path, chunk_size):
+    records = [{"id": "C1", "score": 12.5, "big": 1234567890, "exp": 1e-5, "flag": True, "none": None,
+                "text": '含"引號"與中文，', "items": [1, 22, 333]}, 42, -3.25, "字串", False, None, [], {}]
+    for indent in (None, 2):
+        path = _write(tmp_path / f"records_{indent}.json", records, indent)
+        assert list(iter_json_array(path, chunk_size=chunk_size)) == records
+
+
+def test_iter_json_array_rejects_bad_input(tmp_path):
+    empty = tmp_path / "empty.json"
+    empty.write_text("[]", encoding="utf-8")
+    assert list(iter_json_array(str(empty))) == []
+    not_array = _write(tmp_path / "object.json", {"customer_id": "C1"})
+    with pytest.raises(ValueError):
+        list(iter_json_array(not_array))
+    truncated = tmp_path / "truncated.json"
+    truncated.write_text('[{"customer_id": "C1"}, {"customer_id": "C', encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(truncated), chunk_size=4))
+
+
+def test_hash_join_handles_unsorted_input_and_missing_ids():
+    assert list(hash_join(BASIC, HISTORY)) == [EXPECTED["C3"], EXPECTED["C1"], EXPECTED["C2"]]
+
+
+def test_merge_join_with_sorted_input_and_missing_ids():
+    by_id = lambda record: record["customer_id"]  # noqa: E731
+    merged = list(merge_join(sorted(BASIC, key=by_id), sorted(HISTORY, key=by_id)))
+    assert merged == [EXPECTED["C1"], EXPECTED["C2"], EXPECTED["C3"]]
+
+
+@pytest.mark.parametrize("basic, history", [(BASIC, sorted(HISTORY, key=lambda r: r["customer_id"])),
+                                            (sorted(BASIC, key=lambda r: r["customer_id"]), HISTORY)])
+def test_merge_join_rejects_unsorted_input(basic, history):
+    with pytest.raises(ValueError):
+        list(merge_join(basic, history))
+
+
+def test_merge_join_skips_records_without_id():
+    merged = list(merge_join([{"name": "無 ID"}, {"customer_id": "C1"}], [{"claim_records": {}}, {"customer_id": "C1", "x": 1}]))
+    assert merged == [{"customer_id": "C1", "x": 1}]
+
+
+def test_iter_customers_defaults_to_hash_join_for_unsorted_files(tmp_path, monkeypatch):
+    monkeypatch.delenv("CUSTOMER_JOIN_STRATEGY", raising=False)
+    basic_path, history_path = _write(tmp_path / "basic.json", BASIC), _write(tmp_path / "history.json", HISTORY)
+    assert list(iter_customers(basic_path, history_path)) == [EXPECTED["C3"], EXPECTED["C1"], EXPECTED["C2"]]
+    with pytest.raises(ValueError):
+        list(iter_customers(basic_path, history_path, strategy="merge"))
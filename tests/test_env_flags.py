@@ -0,0 +1,28 @@
+import pytest
+
+from env_flags import env_flag
+from payload_builder import slim_payload_enabled
+
+
+@pytest.mark.parametrize("value, expected", [("1", True), ("true", True), (" YES ", True), ("0", False),
+                                             ("false", False), ("ture", False), ("on", False)])
+def test_only_allow_listed_values_enable(monkeypatch, value, expected):
+    monkeypatch.setenv("TEST_FLAG", value)
+    assert env_flag("TEST_FLAG") is expected
+    assert env_flag("TEST_FLAG", True) is expected
+
+
+def test_unset_or_blank_uses_default(monkeypatch):
+    monkeypatch.delenv("TEST_FLAG", raising=False)
+    assert env_flag("TEST_FLAG") is False
+    assert env_flag("TEST_FLAG", True) is True
+    monkeypatch.setenv("TEST_FLAG", "")
+    assert env_flag("TEST_FLAG") is False
+
+
+def test_slim_payload_is_opt_in(monkeypatch):
+    for value in ("", "typo", "0"):
+        monkeypatch.setenv("AGENT_SLIM_PAYLOAD", value)
+        assert not slim_payload_enabled()
+    monkeypatch.setenv("AGENT_SLIM_PAYLOAD", "1")
+    assert slim_payload_enabled()
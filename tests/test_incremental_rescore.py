@@ -0,0 +1,95 @@
+import copy
+
+import pytest
+
+import config_rules
+from analysis_snapshots import AnalysisSnapshots
+from customer_store import CustomerRepository
+from incremental_rescore import (FIELDS, NEW, PRODUCT, RULES, UNCHANGED, UNREFERENCED, RuleDependencies,
+                                 changed_paths, classify, plan_rescore)
+
+
+@pytest.fixture
+def customer(tmp_path):
+    repo = CustomerRepository(str(tmp_path / "customers.sqlite3"))
+    repo.import_json()
+    return next(repo.get(customer_id) for customer_id, *_ in repo.list_customers()
+                if repo.get(customer_id)["希望購買保單"] == "醫療險")
+
+
+@pytest.fixture
+def snapshot(tmp_path, customer):
+    snapshots = AnalysisSnapshots(str(tmp_path / "snapshots.sqlite3"))
+    snapshots.record(customer, config_rules.config_rules)
+    return snapshots.get(customer["customer_id"])
+
+
+def _classify(customer_data, snapshot, rules=None, **kwargs):
+    rules = rules if rules is not None else config_rules.config_rules
+    return classify(customer_data, snapshot, rules, RuleDependencies(rules), **kwargs)
+
+
+def test_changed_paths_for_nested_and_list_fields():
+    old = {"a": {"b": 1, "c": 2}, "items": [{"x": 1}, {"x": 2}], "gone": 1}
+    new = {"a": {"b": 1, "c": 3}, "items": [{"x": 1}, {"x": 5}], "added": 1}
+    assert changed_paths(old, new) == {"a.c", "items.x", "gone", "added"}
+    assert changed_paths(old, copy.deepcopy(old)) == set()
+    # 清單筆數不同時回傳清單本身
+    assert changed_paths({"items": [1]}, {"items": [1, 2]}) == {"items"}
+
+
+def test_rule_dependencies_map_paths_to_rule_classes():
+    dependencies = RuleDependencies(config_rules.config_rules)
+    assert dependencies.affected_classes("醫療險", ["contact.address"]) == []
+    bad_debt = dependencies.affected_classes("醫療險", ["credit_alert.bad_debt"])
+    assert bad_debt
+    # 上層物件整個被替換時，影響其下所有 keyword 的規則類別
+    assert set(bad_debt) <= set(dependencies.affected_classes("醫療險", ["credit_alert"]))
+    assert dependencies.affected_classes("不存在的保單", ["credit_alert"]) is None
+
+
+def test_new_and_unchanged_customers(customer, snapshot):
+    assert _classify(customer, None)["reason"] == NEW
+    decision = _classify(customer, snapshot)
+    assert (decision["dirty"], decision["reason"]) == (False, UNCHANGED)
+
+
+def test_unreferenced_change_is_skipped_by_default(customer, snapshot):
+    changed = copy.deepcopy(customer)
+    changed["contact"]["address"] = "新地址"
+    decision = _classify(changed, snapshot)
+    assert (decision["dirty"], decision["reason"], decision["paths"]) == (False, UNREFERENCED, ["contact.address"])
+
+    conservative = _classify(changed, snapshot, conservative=True)
+    assert (conservative["dirty"], conservative["reason"]) == (True, FIELDS)
+
+
+def test_referenced_change_is_dirty(customer, snapshot):
+    changed = copy.deepcopy(customer)
+    changed["credit_alert"]["bad_debt"] = not changed["credit_alert"]["bad_debt"]
+    decision = _classify(changed, snapshot)
+    assert (decision["dirty"], decision["reason"], decision["paths"]) == (True, FIELDS, ["credit_alert.bad_debt"])
+    assert decision["classes"]
+
+
+def test_product_and_rule_group_changes(customer, snapshot):
+    changed = dict(customer, 希望購買保單="壽險")
+    assert _classify(changed, snapshot)["reason"] == PRODUCT
+
+    rules = copy.deepcopy(config_rules.config_rules)
+    own_group = next(name for name in rules if name.startswith("醫療險"))
+    other_group = next(name for name in rules if not name.startswith("醫療險"))
+    rules[other_group] = rules[other_group][:-1]
+    assert _classify(customer, snapshot, rules)["reason"] == UNCHANGED
+    rules[own_group] = rules[own_group][:-1]
+    assert _classify(customer, snapshot, rules)["reason"] == RULES
+
+
+def test_plan_rescore_counts_avoided_calls(customer, snapshot):
+    address = copy.deepcopy(customer)
+    address["contact"]["address"] = "新地址"
+    plan = plan_rescore([address], snapshots={customer["customer_id"]: snapshot})
+    assert (plan["dirty"], plan["avoided"], plan["avoided_changed"]) == ([], 1, 1)
+
+    plan = plan_rescore([address], snapshots={customer["customer_id"]: snapshot}, conservative=True)
+    assert (len(plan["dirty"]), plan["avoided"]) == (1, 0)
@@ -0,0 +1,23 @@
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_client_does_not_start_exporters(tmp_path):
+    # 匯入 agent_api_client（Streamlit 頁面、測試、benchmark 皆會匯入）不應綁定 port 或啟動指標檔寫出 thread
+    env = dict(os.environ, METRICS_FILE=str(tmp_path / "metrics.prom"), METRICS_FILE_INTERVAL="0.01")
+    code = ("import time, threading, agent_api_client, metrics; time.sleep(0.2); "
+            "print(metrics._exporters_started, any(t.name == 'metrics-file' for t in threading.enumerate()))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True,
+                            timeout=60, check=True).stdout
+    assert output.split() == ["False", "False"]
+    assert not (tmp_path / "metrics.prom").exists()
+
+
+def test_start_exporters_writes_metrics_file(tmp_path):
+    env = dict(os.environ, METRICS_FILE=str(tmp_path / "metrics.prom"), METRICS_FILE_INTERVAL="0.01")
+    code = "import time, metrics; metrics.start_exporters(); metrics.start_exporters(); time.sleep(0.3)"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, timeout=60, check=True)
+    assert (tmp_path / "metrics.prom").exists()
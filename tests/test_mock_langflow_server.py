@@ -0,0 +1,148 @@
+import json
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+
+from mock_langflow_server import MALFORMED_KINDS, message_text, parse_latency, start_in_thread
+from payload_builder import build_agent_payload
+from response_parser import parse_agent_text
+
+CUSTOMER = {"customer_id": "C00009", "希望購買保單": "財產保險"}
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**options):
+        options.setdefault("seed", 1)
+        options.setdefault("token_delay", 0)
+        server, url = start_in_thread(**options)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _post(url, payload=None, body=None, headers=None):
+    """送出 POST 並回傳 (狀態碼, 標頭, 本文 bytes)，錯誤狀態碼不拋出例外"""
+    data = body if body is not None else json.dumps(payload or build_agent_payload(CUSTOMER, {}, slim=False)).encode("utf-8")
+    request = urllib.request.Request(url, data=data, method="POST",
+                                     headers=dict({"Content-Type": "application/json"}, **(headers or {})))
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        with e:
+            return e.code, e.headers, e.read()
+
+
+def _text(body):
+    return json.loads(body)["outputs"][0]["outputs"][0]["results"]["message"]["text"]
+
+
+@pytest.mark.parametrize("spec, low, high", [("0", 0, 0), (0.5, 0.5, 0.5), ("uniform:2:10", 2, 10),
+                                             ("normal:8:2", 0, None), ("lognormal:8:0.5", 0, None),
+                                             ("exp:5", 0, None), ("exp:0", 0, 0)])
+def test_parse_latency_samples_within_range(spec, low, high):
+    sample = parse_latency(spec)
+    rng = random.Random(1)
+    values = [sample(rng) for _ in range(200)]
+    assert min(values) >= low
+    if high is not None:
+        assert max(values) <= high
+
+
+def test_parse_latency_is_reproducible_with_seed():
+    sample = parse_latency("lognormal:8:0.5")
+    assert [sample(random.Random(7)) for _ in range(3)] == [sample(random.Random(7)) for _ in range(3)]
+
+
+@pytest.mark.parametrize("spec", ["gamma:1:2", "uniform:1", "normal:a:b", "slow"])
+def test_parse_latency_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        parse_latency(spec)
+
+
+def test_replays_saved_result(mock_server):
+    server, url = mock_server()
+    status, _, body = _post(url)
+    assert status == 200
+    assert _text(body) == message_text(server.replay["C00009"])
+    assert server.stats_snapshot()["ok"] == 1
+
+
+def test_rejects_invalid_payload_and_token(mock_server):
+    _, url = mock_server()
+    assert _post(url, body=b"not json")[0] == 422
+    assert _post(url, payload={"input_value": "{}"})[0] == 422
+
+    server, url = mock_server(token="secret")
+    assert _post(url)[0] == 403
+    assert _post(url, headers={"Authorization": "Bearer secret"})[0] == 200
+    assert server.stats_snapshot()["unauthorized"] == 1
+
+
+@pytest.mark.parametrize("status", [500, 502, 503])
+def test_injected_error_status(mock_server, status):
+    server, url = mock_server(error_rate=1.0, error_statuses=(status,))
+    code, headers, body = _post(url)
+    assert code == status
+    assert headers.get("Retry-After") is None
+    assert json.loads(body) == {"detail": f"injected error {status}"}
+    assert server.stats_snapshot()[f"status_{status}"] == 1
+
+
+def test_injected_429_carries_retry_after(mock_server):
+    _, url = mock_server(error_rate=1.0, error_statuses=(429,), retry_after=7)
+    code, headers, _ = _post(url)
+    assert (code, headers["Retry-After"]) == (429, "7")
+
+
+@pytest.mark.parametrize("kind", MALFORMED_KINDS)
+def test_malformed_kinds_fail_to_parse(mock_server, kind):
+    server, url = mock_server(malformed_rate=1.0, malformed_kinds=(kind,))
+    status, _, body = _post(url)
+    assert status == 200
+    assert server.stats_snapshot()[f"malformed_{kind}"] == 1
+    try:
+        text = _text(body)
+    except (ValueError, KeyError, IndexError):
+        # truncated_json / html / no_envelope / empty：外層結構本身無法取出文字
+        assert kind != "no_json_in_text"
+        return
+    assert kind == "no_json_in_text"
+    assert parse_agent_text(text)[0] is None
+
+
+def test_fault_rates_are_reproducible_with_seed(mock_server):
+    options = dict(seed=3, error_rate=0.3, malformed_rate=0.3, error_statuses=(500,))
+    sequences = []
+    for _ in range(2):
+        _, url = mock_server(**options)
+        sequences.append([_post(url)[0] for _ in range(10)])
+    assert sequences[0] == sequences[1]
+    assert 500 in sequences[0] and 200 in sequences[0]
+
+
+def test_quota_rejects_with_retry_after(mock_server):
+    server, url = mock_server(quota_rpm=2, quota_window=30.0)
+    assert [_post(url)[0] for _ in range(2)] == [200, 200]
+    status, headers, _ = _post(url)
+    assert status == 429
+    assert 1 <= int(headers["Retry-After"]) <= 30
+    stats = server.stats_snapshot()
+    # 被拒絕的請求不計入配額，也不進入故障抽樣
+    assert (stats["status_429_quota"], stats["requests"], stats["ok"]) == (1, 2, 2)
+
+
+def test_token_quota_counts_payload_size(mock_server):
+    server, url = mock_server(quota_tpm=3000, quota_overhead_tokens=2500, quota_window=30.0)
+    assert _post(url)[0] == 200
+    assert _post(url)[0] == 429
+    assert server.stats_snapshot()["status_429_quota"] == 1
@@ -0,0 +1,62 @@
+import json
+
+import pandas as pd
+import pytest
+
+import config_rules
+from customer_store import merge_customer_data
+from portfolio_scoring import BASIC_INFO_PATH, HISTORY_PATH, _normalize, flatten_portfolio, score_portfolio
+from scoring_engine import score_customer
+
+
+@pytest.fixture(scope="module")
+def customers():
+    with open(BASIC_INFO_PATH, "r", encoding="utf-8") as f:
+        basic_info = json.load(f)
+    with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+        history_info = json.load(f)
+    return basic_info, history_info
+
+
+def test_normalize_matches_json_normalize(customers):
+    for records in customers:
+        expected = pd.json_normalize(records)
+        actual = _normalize(records)
+        assert sorted(actual.columns) == sorted(expected.columns)
+        pd.testing.assert_frame_equal(actual[expected.columns], expected)
+
+
+def test_normalize_missing_nested_values():
+    records = [{"id": 1, "alert": {"a": True, "b": 1}}, {"id": 2, "alert": None}, {"id": 3}]
+    frame = _normalize(records)
+    assert list(frame.columns) == ["id", "alert.a", "alert.b"]
+    assert frame["alert.a"].tolist()[0] is True
+    assert frame["alert.b"].isna().tolist() == [False, True, True]
+
+
+def test_flatten_aggregates_list_fields(customers):
+    basic_info, history_info = customers
+    history_info = [dict(record) for record in history_info]
+    history_info[0].pop("claim_records", None)
+    history_info[1]["claim_records"] = []
+    history_info[2]["claim_records"] = ["非物件項目", {"claim_count": 2, "total_claim_amount": 10, "disputed": True},
+                                        {"claim_count": 1, "total_claim_amount": 5, "disputed": False}]
+    frame = flatten_portfolio(basic_info, history_info).set_index("customer_id")
+    assert "claim_records" not in frame
+    first, second, third = (record["customer_id"] for record in history_info[:3])
+    assert pd.isna(frame.loc[first, "claim_records.claim_count"])
+    assert pd.isna(frame.loc[second, "claim_records.claim_count"])
+    assert frame.loc[third, "claim_records.claim_count"] == 3
+    assert frame.loc[third, "claim_records.total_claim_amount"] == 15
+    assert bool(frame.loc[third, "claim_records.disputed"]) is True
+
+
+def test_score_portfolio_matches_scoring_engine(customers):
+    basic_info, history_info = customers
+    history_by_id = {record["customer_id"]: record for record in history_info}
+    scored = score_portfolio(flatten_portfolio(basic_info, history_info), config_rules.config_rules)
+    for customer_base, row in zip(basic_info, scored.itertuples(index=False)):
+        expected = score_customer(merge_customer_data(customer_base, history_by_id.get(customer_base["customer_id"])),
+                                  config_rules.config_rules)
+        if expected:
+            assert (row.total_score, row.grade) == (expected["total_score"], expected["grade"])
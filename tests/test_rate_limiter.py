@@ -0,0 +1,87 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+import agent_async_client
+from agent_async_client import AgentClient
+from mock_langflow_server import start_in_thread
+from payload_builder import build_agent_payload
+from rate_limiter import RateLimiter, TokenBucket, parse_retry_after
+
+
+def test_token_bucket_burst_then_refill_rate():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    now = bucket.updated
+    assert bucket.reserve(1, now) == 0
+    assert bucket.reserve(1, now) == 0
+    # 額度用完後依補充速度（每秒 1）排隊，後預約者等更久
+    assert bucket.reserve(1, now) == pytest.approx(1.0)
+    assert bucket.reserve(1, now) == pytest.approx(2.0)
+    assert bucket.reserve(1, now + 10) == 0
+
+
+def test_rate_limiter_schedules_against_rpm_and_tpm():
+    limiter = RateLimiter(tpm=6000, rpm=60, headroom=0.5)
+    assert limiter.reserve(1000) == 0
+    assert limiter.reserve(1000) == 0
+    assert limiter.reserve(1000) == pytest.approx(0.0, abs=0.01)
+    # TPM 突發額度 3000 已用完：第四筆依補充速度等 1000 / (3000 / 60) = 20 秒
+    assert limiter.reserve(1000) == pytest.approx(20.0, abs=0.1)
+
+
+def test_unlimited_rate_limiter_does_not_wait():
+    limiter = RateLimiter()
+    assert not limiter.enabled
+    assert asyncio.run(limiter.acquire(10 ** 6)) == 0
+
+
+def test_throttled_pauses_until_retry_after():
+    limiter = RateLimiter()
+    limiter.throttled(0.3)
+    started = time.monotonic()
+    waited = asyncio.run(limiter.acquire(100))
+    assert waited == pytest.approx(0.3, abs=0.05)
+    assert time.monotonic() - started >= 0.25
+    # 暫停結束後不再等待
+    assert asyncio.run(limiter.acquire(100)) == 0
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("3", 3.0),
+    ("0.5", 0.5),
+    ("-1", 0.0),
+    ("", None),
+    ("soon", None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    assert parse_retry_after(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=2)
+
+
+def test_post_json_honours_retry_after(monkeypatch):
+    # 配額每 1 秒 1 筆：第二筆先收到 429（Retry-After: 1），暫停後重送成功
+    limiter = RateLimiter()
+    monkeypatch.setattr(agent_async_client, "get_rate_limiter", lambda: limiter)
+    server, url = start_in_thread(quota_rpm=1, quota_window=1.0)
+    payload = build_agent_payload({"customer_id": "C00009"}, {}, slim=False)
+
+    async def post_twice():
+        async with AgentClient(api_url=url, api_token="") as client:
+            await client.post_json(payload, timeout=5)
+            started = time.monotonic()
+            status, _ = await client.post_json(payload, timeout=5)
+            return status, time.monotonic() - started
+
+    try:
+        status, elapsed = asyncio.run(post_twice())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert status == 200
+    assert elapsed >= 0.9
+    assert server.stats_snapshot()["status_429_quota"] == 1
@@ -0,0 +1,45 @@
+import copy
+
+import config_rules
+from report_html import beautify_rule_desc, build_score_table_html, build_score_table_rows
+from rule_compiler import RuleIndex, get_rule_index
+
+AI_RESULT = {"score_table": [
+    {"項目": "credit_rating", "規則": "AAA：5分；AA：4分", "分數": 5},
+    {"項目": "credit_alert.bad_debt", "規則": "False：5；True：1", "分數": 5},
+    {"項目": "age", "規則": "18~30歲：5分", "分數": 3},
+    {"項目": "unknown_field", "規則": "", "分數": 1},
+]}
+
+
+def test_get_rule_index_is_shared_until_rules_change():
+    index = get_rule_index()
+    assert get_rule_index(config_rules.config_rules) is index
+    reloaded = copy.deepcopy(config_rules.config_rules)
+    rebuilt = get_rule_index(reloaded)
+    assert rebuilt is not index and rebuilt.rules is reloaded
+    assert get_rule_index(config_rules.config_rules) is not rebuilt
+
+
+def test_rows_are_grouped_by_class_in_order():
+    index = RuleIndex(config_rules.config_rules)
+    grouped = build_score_table_rows(AI_RESULT, index)
+    assert list(grouped)[-1] == "未知"
+    assert [row["規則名稱"] for rows in grouped.values() for row in rows][-1] == "unknown_field"
+    assert sum(len(rows) for rows in grouped.values()) == len(AI_RESULT["score_table"])
+
+
+def test_score_table_html_spans_classes_and_beautifies_rules():
+    index = RuleIndex(config_rules.config_rules)
+    html = build_score_table_html(AI_RESULT, index)
+    grouped = build_score_table_rows(AI_RESULT, index)
+    assert html.count("<tr><td>") == len(AI_RESULT["score_table"])
+    assert html.count("rowspan=") == len(grouped)
+    assert "border-bottom:3.5px" in html
+    assert "border-bottom:3.5px" not in build_score_table_html(AI_RESULT, index, class_separator=False)
+
+
+def test_beautify_rule_desc():
+    html = beautify_rule_desc("AAA：5分；AA:4\n其他")
+    assert html.count("<li>") == 3 and "4分" in html
+    assert beautify_rule_desc("") == ""
@@ -0,0 +1,198 @@
+import asyncio
+import time
+
+import pytest
+
+from agent_async_client import AgentAPIError
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Resilience
+
+
+def _open_breaker(reset_timeout=0.05):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = _open_breaker(reset_timeout=30)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_single_probe_and_closes_on_success():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # 試探請求進行中，其他請求仍被拒絕
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_half_open_probe_failure_reopens():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_disabled_breaker_never_opens():
+    breaker = CircuitBreaker(failure_threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+        breaker.before_call()
+    assert breaker.state == CLOSED
+
+
+class _Upstream:
+    """依序拋出 errors 中的例外，之後回傳 "ok"；記錄呼叫次數"""
+
+    def __init__(self, *errors, delay=0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def _resilience(**options):
+    options.setdefault("backoff_base", 0)
+    options.setdefault("breaker", CircuitBreaker(failure_threshold=5, reset_timeout=30))
+    return Resilience(**options)
+
+
+def test_retries_5xx_then_succeeds():
+    upstream = _Upstream(AgentAPIError("503", status=503), ConnectionError("reset"))
+    assert asyncio.run(_resilience().call(upstream)) == "ok"
+    assert upstream.calls == 3
+
+
+def test_gives_up_after_retries():
+    upstream = _Upstream(*[AgentAPIError("502", status=502)] * 5)
+    with pytest.raises(AgentAPIError):
+        asyncio.run(_resilience(retries=2).call(upstream))
+    assert upstream.calls == 3
+
+
+def test_4xx_is_not_retried_and_not_counted_by_breaker():
+    resilience = _resilience(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30))
+    upstream = _Upstream(AgentAPIError("422", status=422))
+    with pytest.raises(AgentAPIError):
+        asyncio.run(resilience.call(upstream))
+    assert upstream.calls == 1
+    assert resilience.breaker.state == CLOSED
+
+
+def test_open_breaker_fails_fast_without_calling_upstream():
+    resilience = _resilience(breaker=_open_breaker(reset_timeout=30))
+    upstream = _Upstream()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilience.call(upstream))
+    assert upstream.calls == 0
+
+
+def test_breaker_opens_during_retries_and_stops_retrying():
+    resilience = _resilience(retries=5, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    upstream = _Upstream(*[AgentAPIError("500", status=500)] * 5)
+    with pytest.raises(AgentAPIError):
+        asyncio.run(resilience.call(upstream))
+    assert upstream.calls == 2
+    assert resilience.breaker.state == OPEN
+
+
+def test_half_open_probe_through_resilience():
+    resilience = _resilience(breaker=_open_breaker())
+    time.sleep(0.06)
+    assert asyncio.run(resilience.call(_Upstream())) == "ok"
+    assert resilience.breaker.state == CLOSED
+
+
+def test_stream_retries_only_before_first_item():
+    resilience = _resilience()
+    attempts = []
+
+    async def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("reset")
+        yield "a"
+        raise AgentAPIError("500", status=500)
+
+    async def consume():
+        items = []
+        async for item in resilience.stream(factory):
+            items.append(item)
+        return items
+
+    with pytest.raises(AgentAPIError):
+        asyncio.run(consume())
+    # 首次在產出前失敗而重試；第二次已產出內容，不再重試
+    assert len(attempts) == 2
+
+
+def test_hedge_sends_second_request_when_primary_is_slow():
+    resilience = _resilience(hedge=True, hedge_min_samples=1)
+    resilience.latency.observe(0.02)
+    delays = iter([1.0, 0.0])
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(next(delays))
+        return len(calls)
+
+    started = time.monotonic()
+    assert asyncio.run(resilience.call(upstream)) == 2
+    assert time.monotonic() - started < 0.5
+
+
+def test_timeout_is_not_retried_by_default():
+    upstream = _Upstream(asyncio.TimeoutError(), asyncio.TimeoutError())
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(_resilience().call(upstream))
+    assert upstream.calls == 1
+    assert asyncio.run(_resilience(retry_on_timeout=True).call(_Upstream(asyncio.TimeoutError()))) == "ok"
+
+
+def test_malformed_body_is_neutral_for_breaker():
+    resilience = _resilience(breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    resilience.breaker.record_failure()
+    with pytest.raises(ValueError):
+        asyncio.run(resilience.call(_Upstream(ValueError("invalid JSON body"))))
+    # 格式錯誤不重設也不增加失敗計數
+    assert resilience.breaker.failures == 1
+    assert resilience.breaker.state == CLOSED
+
+
+def test_malformed_probe_releases_half_open_slot():
+    resilience = _resilience(breaker=_open_breaker())
+    time.sleep(0.06)
+    with pytest.raises(ValueError):
+        asyncio.run(resilience.call(_Upstream(ValueError("invalid JSON body"))))
+    assert resilience.breaker.state == HALF_OPEN
+    # 下一個請求可以再次試探
+    assert asyncio.run(resilience.call(_Upstream())) == "ok"
+    assert resilience.breaker.state == CLOSED
@@ -0,0 +1,101 @@
+import json
+import time
+
+import pytest
+
+from response_parser import TRUNCATION_MARK, find_message_text, parse_agent_response, parse_agent_text
+
+RESULT = {
+    "score_table": [{"項目": "age", "分數": 5}, {"項目": "credit_rating", "分數": 3}],
+    "score_formula": "5+3=8",
+    "total_score": 8,
+    "grade": "C",
+    "優點": ["信用良好"],
+    "專家綜合說明": "整體風險偏低，建議承保。",
+}
+TEXT = json.dumps(RESULT, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("text", [
+    TEXT,
+    f"```json\n{TEXT}\n```",
+    f"以下為分析結果：\n```json\n{TEXT}\n```\n以上。",
+    # 格式範例與錯誤訊息不採用，取第一個含必備欄位的物件
+    f'範例：{{"score_table": "..."}}\n錯誤：{{"error": "none"}}\n```json\n{TEXT}\n```',
+    # 說明文字中的非 JSON 大括號
+    f"計算方式為 {{分數}} 加總\n{TEXT}",
+    # 整段回覆被多包一層引號
+    json.dumps(TEXT, ensure_ascii=False),
+])
+def test_complete_results_in_various_wrappings(text):
+    assert parse_agent_text(text) == (RESULT, "ok")
+
+
+@pytest.mark.parametrize("text", ["", "無法分析此客戶", '{"error": "rate limited"}', '{"score_table": "x", "total_score": 1, "grade": "A"}',
+                                  "{分數} 與 {等級}", None])
+def test_non_results_fail(text):
+    assert parse_agent_text(text) == (None, "failed")
+
+
+def test_truncated_result_is_repaired_with_complete_members_only():
+    ordered = {"total_score": 8, "grade": "C", "score_table": RESULT["score_table"], "優點": ["信用良好", "收入穩定"],
+               "專家綜合說明": "整體風險偏低，建議承保。"}
+    text = json.dumps(ordered, ensure_ascii=False)
+    cut = text[:text.index("收入穩定") + 2]
+    result, status = parse_agent_text(cut)
+    assert status == "repaired"
+    assert result["score_table"] == RESULT["score_table"] and result["優點"] == ["信用良好"]
+    assert "專家綜合說明" not in result
+
+    # 截斷在可保留的文字欄位中間：保留已收到的部分並加上截斷標記
+    cut = text[:text.index("建議承保")]
+    result, status = parse_agent_text(cut)
+    assert status == "repaired" and result["專家綜合說明"] == "整體風險偏低，" + TRUNCATION_MARK
+
+
+def test_truncation_before_required_fields_fails():
+    cut = TEXT[:TEXT.index('"total_score"')]
+    assert parse_agent_text(cut) == (None, "failed")
+
+
+def test_number_at_end_is_treated_as_truncated():
+    text = '{"score_table": [], "grade": "A", "total_score": 6'
+    assert parse_agent_text(text) == (None, "failed")
+
+
+def test_repair_scans_truncated_text_once():
+    # 截斷物件內有大量「{」：只修復一次，不對每個「{」重新解析（原本為平方時間）
+    head = '{"score_table": [], "grade": "A", "total_score": 1, "items": ['
+    text = head + '{"a": 1}, ' * 20000 + '{"a": '
+    started = time.perf_counter()
+    result, status = parse_agent_text(text)
+    assert time.perf_counter() - started < 2
+    assert status == "repaired" and len(result["items"]) == 20000
+
+
+def test_excessive_nesting_fails_instead_of_raising():
+    text = '{"score_table": [], "grade": "A", "total_score": 1, "x": ' + "[" * 100000
+    assert parse_agent_text(text) == (None, "failed")
+
+
+def _envelope(message):
+    return {"outputs": [{"outputs": [{"results": {"message": message}}]}]}
+
+
+@pytest.mark.parametrize("response", [
+    _envelope({"text": TEXT}),
+    _envelope({"data": {"text": TEXT}}),
+    _envelope(TEXT),
+    {"outputs": [{"outputs": [{"messages": [{"message": TEXT}]}]}]},
+    {"outputs": [{"outputs": [{"artifacts": {"message": TEXT}}]}]},
+    {"session_id": "s", "result": {"nested": [{"text": TEXT}]}},
+    TEXT,
+])
+def test_envelope_variants(response):
+    assert find_message_text(response) == TEXT
+    assert parse_agent_response(response) == (RESULT, "ok", TEXT)
+
+
+def test_missing_text():
+    assert parse_agent_response({"outputs": []}) == (None, "no_text", None)
+    assert parse_agent_response(None) == (None, "no_text", None)
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache, cache_key, canonical_json, rules_fingerprint
+
+RULES = {"醫療險規則": [{"rule": "基本資料", "keywords": ["age"], "class": "基本資料"}]}
+
+
+class _Clock:
+    """每次讀取前進 1 秒，LRU 順序與過期判斷不受系統時間解析度影響"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(time=fake.time))
+    return fake
+
+
+def _customer(n):
+    return {"customer_id": f"C{n}", "name": f"客戶{n}", "age": 30 + n}
+
+
+def test_key_is_stable_across_key_order_and_sensitive_to_content():
+    customer = {"customer_id": "C1", "age": 30, "credit_alert": {"bad_debt": False, "over_insurance": True}}
+    reordered = {"credit_alert": {"over_insurance": True, "bad_debt": False}, "age": 30, "customer_id": "C1"}
+    assert canonical_json(customer) == canonical_json(reordered)
+    assert cache_key(customer, RULES) == cache_key(reordered, RULES)
+    assert cache_key(dict(customer, age=31), RULES) != cache_key(customer, RULES)
+    changed_rules = {"醫療險規則": [dict(RULES["醫療險規則"][0], keywords=["age", "smoking"])]}
+    assert rules_fingerprint(changed_rules) != rules_fingerprint(RULES)
+    assert cache_key(customer, changed_rules) != cache_key(customer, RULES)
+
+
+def test_hit_miss_counts_are_kept_per_process_and_in_the_database(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(path, max_entries=10, max_age_seconds=0)
+    assert cache.get(_customer(1), RULES) is None
+    cache.put(_customer(1), RULES, {"total_score": 60})
+    assert cache.get(_customer(1), RULES) == {"total_score": 60}
+    assert cache.get(_customer(2), RULES) is None
+
+    other_process = ResultCache(path, max_entries=10, max_age_seconds=0)
+    assert other_process.get(_customer(1), RULES) == {"total_score": 60}
+    assert cache.stats() == {"hits": 1, "misses": 2, "total_hits": 2, "total_misses": 2, "entries": 1}
+    assert other_process.stats()["hits"] == 1
+
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), max_entries=2, max_age_seconds=0)
+    cache.put(_customer(1), RULES, {"n": 1})
+    cache.put(_customer(2), RULES, {"n": 2})
+    # 讀取 C1 使其成為最近使用，之後寫入 C3 時淘汰 C2
+    assert cache.get(_customer(1), RULES) == {"n": 1}
+    cache.put(_customer(3), RULES, {"n": 3})
+    assert cache.stats()["entries"] == 2
+    assert cache.get(_customer(2), RULES) is None
+    assert cache.get(_customer(1), RULES) == {"n": 1}
+    assert cache.get(_customer(3), RULES) == {"n": 3}
+
+
+def test_expired_entries_miss_and_are_evicted(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), max_entries=0, max_age_seconds=3)
+    cache.put(_customer(1), RULES, {"n": 1})
+    assert cache.get(_customer(1), RULES) == {"n": 1}
+    clock.advance(5)
+    assert cache.get(_customer(1), RULES) is None
+    cache.put(_customer(2), RULES, {"n": 2})
+    assert cache.stats()["entries"] == 1
+
+
+def test_invalidate_by_customer(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), max_entries=10, max_age_seconds=0)
+    for n in (1, 2):
+        cache.put(_customer(n), RULES, {"n": n})
+    cache.invalidate("C1")
+    assert cache.get(_customer(1), RULES) is None
+    assert cache.get(_customer(2), RULES) == {"n": 2}
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import threading
+import multiprocessing
+
+from result_writer import WriteBehindWriter, _stress_reader, _stress_writer, atomic_write_json
+from results_store import ResultStore
+
+WRITERS = 4
+READERS = 2
+WRITES = 25
+
+
+def test_atomic_write_json_leaves_no_temp_files(tmp_path):
+    path = tmp_path / "result_C1.json"
+    atomic_write_json(str(path), {"total_score": 1})
+    atomic_write_json(str(path), {"total_score": 2})
+    assert json.loads(path.read_text(encoding="utf-8")) == {"total_score": 2}
+    assert os.listdir(tmp_path) == ["result_C1.json"]
+
+
+def test_concurrent_writers_and_readers(tmp_path):
+    path = str(tmp_path / "result_STRESS.json")
+    store_path = str(tmp_path / "results.sqlite3")
+    ResultStore(store_path)
+    stop_event = multiprocessing.Event()
+    result_queue = multiprocessing.Queue()
+    readers = [multiprocessing.Process(target=_stress_reader, args=(path, stop_event, result_queue))
+               for _ in range(READERS)]
+    for process in readers:
+        process.start()
+    with multiprocessing.Pool(WRITERS) as pool:
+        pool.starmap(_stress_writer, [(path, store_path, n, WRITES, False) for n in range(WRITERS)])
+    stop_event.set()
+    counts = [result_queue.get(timeout=30) for _ in readers]
+    for process in readers:
+        process.join()
+
+    assert sum(reads for reads, _ in counts) > 0
+    assert sum(errors for _, errors in counts) == 0
+    store = ResultStore(store_path)
+    assert store.count() == WRITERS * WRITES
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == store.latest("STRESS")["result"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_write_behind_writes_in_submission_order(tmp_path):
+    path = str(tmp_path / "result_C1.json")
+    writer = WriteBehindWriter(lambda data: atomic_write_json(path, data))
+    put = writer._queue.put
+    first_put = threading.Event()
+
+    def slow_put(item, *args, **kwargs):
+        # 第一筆取得序號後延遲排入佇列，讓第二筆有機會搶先
+        if not first_put.is_set():
+            first_put.set()
+            time.sleep(0.2)
+        put(item, *args, **kwargs)
+
+    writer._queue.put = slow_put
+    older = threading.Thread(target=writer.submit, args=("C1", {"v": "older"}))
+    older.start()
+    assert first_put.wait(5)
+    writer.submit("C1", {"v": "newer"})
+    older.join()
+    assert writer.flush(timeout=10)
+    assert writer.pending("C1") is None
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"v": "newer"}
+
+
+def test_pending_returns_latest_until_written():
+    release = threading.Event()
+    writer = WriteBehindWriter(lambda data: release.wait(5))
+    writer.submit("C1", {"v": 1})
+    writer.submit("C1", {"v": 2})
+    assert writer.pending("C1") == {"v": 2}
+    release.set()
+    assert writer.flush(timeout=10)
+    assert writer.pending("C1") is None
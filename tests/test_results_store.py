@@ -0,0 +1,76 @@
+import os
+import json
+
+import pytest
+
+import results_store
+from agent_api_client import load_latest_result, save_results
+from results_store import ResultStore
+
+RULES = {"醫療險規則": []}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / "results.sqlite3"))
+
+
+def test_unique_index_skips_identical_rows(store):
+    first = store.append("C1", {"total_score": 60}, rules=RULES, created_at=100.0)
+    assert first is not None
+    assert store.append("C1", {"total_score": 60}, created_at=100.0) is None
+    # 同一時間但內容不同、或同內容但時間不同，皆為新版本
+    assert store.append("C1", {"total_score": 61}, created_at=100.0) is not None
+    assert store.append("C1", {"total_score": 60}, created_at=101.0) is not None
+    assert store.count("C1") == 3 and store.count() == 3
+
+
+def test_latest_history_and_since(store):
+    store.append("C1", {"v": 1}, created_at=100.0)
+    store.append("C2", {"v": 9}, created_at=150.0)
+    store.append("C1", {"v": 2}, created_at=200.0, source="cache")
+    # 同一時間以 id 決定先後
+    store.append("C1", {"v": 3}, created_at=200.0)
+
+    latest = store.latest("C1")
+    assert latest["result"] == {"v": 3} and latest["source"] == "agent"
+    assert store.latest_result("C404") is None
+    assert [r["result"]["v"] for r in store.history("C1")] == [3, 2, 1]
+    assert [r["result"]["v"] for r in store.history("C1", limit=2)] == [3, 2]
+    assert [r["result"]["v"] for r in store.since(150.0)] == [9, 2, 3]
+    assert [r["result"]["v"] for r in store.since(150.0, customer_id="C1")] == [2, 3]
+    assert store.since(201.0) == []
+
+
+def test_rules_fingerprint_is_recorded(store):
+    store.append("C1", {"v": 1}, rules=RULES, created_at=1.0)
+    store.append("C1", {"v": 2}, created_at=2.0)
+    fingerprints = [r["rules_fingerprint"] for r in store.history("C1")]
+    assert fingerprints[0] is None and len(fingerprints[1]) == 64
+
+
+def test_import_json_dir_is_idempotent(store, tmp_path):
+    results_dir = tmp_path / "Results"
+    results_dir.mkdir()
+    (results_dir / "result_C1.json").write_text(json.dumps({"total_score": 60}), encoding="utf-8")
+    (results_dir / "result_C2.json").write_text("{broken", encoding="utf-8")
+    (results_dir / "other_C3.json").write_text("{}", encoding="utf-8")
+    assert store.import_json_dir(str(results_dir)) == 1
+    assert store.import_json_dir(str(results_dir)) == 0
+    record = store.latest("C1")
+    assert record["source"] == "import"
+    assert record["created_at"] == os.path.getmtime(results_dir / "result_C1.json")
+
+
+def test_save_results_skips_duplicate_cache_rows(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(results_store, "_default_store", store)
+    monkeypatch.setenv("RESULTS_DIR", str(tmp_path / "out"))
+    save_results({"total_score": 60}, "C1", rules=RULES, background=False)
+    save_results({"total_score": 60}, "C1", rules=RULES, background=False, source="cache")
+    assert store.count("C1") == 1
+    save_results({"total_score": 62}, "C1", rules=RULES, background=False, source="cache")
+    assert [r["source"] for r in store.history("C1")] == ["cache", "agent"]
+    with open(tmp_path / "out" / "result_C1.json", "r", encoding="utf-8") as f:
+        assert json.load(f) == {"total_score": 62}
+    assert load_latest_result("C1") == {"total_score": 62}
+    assert load_latest_result("C404") is None
@@ -0,0 +1,88 @@
+import config_rules
+from rule_compiler import (COMPILED_RULES, RuleIndex, compile_rules, get_accessor, get_compiled_rules,
+                           get_projector)
+
+CUSTOMER = {
+    "customer_id": "C1",
+    "credit_alert": {"bad_debt": True, "credit_card_overdue_count": 0},
+    "claim_records": [
+        {"claim_count": 1, "total_claim_amount": 30000, "disputed": False},
+        {"claim_count": 2, "total_claim_amount": None, "disputed": True},
+    ],
+    "insurance_history": [
+        {"status": "投保中", "cancel_reason": ""},
+        {"status": "退保", "cancel_reason": "財務困難"},
+    ],
+    "review_records": {"pending": False},
+}
+
+
+def test_dotted_paths():
+    assert get_accessor("credit_alert.bad_debt")(CUSTOMER) is True
+    # 值為 0 / False 時不可當成找不到
+    assert get_accessor("credit_alert.credit_card_overdue_count")(CUSTOMER) == 0
+    assert get_accessor("review_records.pending")(CUSTOMER) is False
+    assert get_accessor("credit_alert.missing")(CUSTOMER) is None
+    assert get_accessor("missing.deeper")(CUSTOMER) is None
+    # 中途遇到非 dict / list 的值
+    assert get_accessor("customer_id.length")(CUSTOMER) is None
+    assert get_accessor("credit_alert")(CUSTOMER) == CUSTOMER["credit_alert"]
+
+
+def test_list_aggregations():
+    assert get_accessor("claim_records.claim_count")(CUSTOMER) == 3
+    # 空值不計入加總
+    assert get_accessor("claim_records.total_claim_amount")(CUSTOMER) == 30000
+    assert get_accessor("claim_records.disputed")(CUSTOMER) is True
+    assert get_accessor("insurance_history.status")(CUSTOMER) == "退保"
+    # first 略過空字串
+    assert get_accessor("insurance_history.cancel_reason")(CUSTOMER) == "財務困難"
+    assert get_accessor("claim_records.claim_count", "max")(CUSTOMER) == 2
+    assert get_accessor("claim_records.claim_count")({"claim_records": []}) is None
+
+
+def test_auto_aggregation_by_value_type():
+    data = {"items": [{"flag": False, "n": 1.5, "s": ""}, {"flag": True, "n": 2, "s": "b"}]}
+    assert get_accessor("items.flag")(data) is True
+    assert get_accessor("items.n")(data) == 3.5
+    assert get_accessor("items.s")(data) == "b"
+
+
+def test_accessors_are_compiled_once():
+    assert get_accessor("credit_alert.bad_debt") is get_accessor("credit_alert.bad_debt")
+    assert get_projector(("a.b",)) is get_projector(("a.b",))
+
+
+def test_projector_keeps_only_keyword_paths():
+    project = get_projector(("credit_alert.bad_debt", "claim_records.disputed", "missing.field"))
+    assert project(CUSTOMER) == {
+        "credit_alert": {"bad_debt": True},
+        "claim_records": [{"disputed": False}, {"disputed": True}],
+    }
+
+
+def test_compile_rules_skips_malformed_entries():
+    compiled = compile_rules({"醫療險規則": [{"rule": "r", "keywords": ["age"], "class": "c"}, "not a rule"],
+                              "comment": "not a group"})
+    assert list(compiled) == ["醫療險規則"]
+    rule = compiled["醫療險規則"][0]
+    assert (rule.rule, rule.rule_class, rule.required, rule.keywords) == ("r", "c", False, ("age",))
+    assert rule.extract({"age": 40}) == {"age": 40}
+
+
+def test_config_rules_are_compiled_at_import():
+    assert get_compiled_rules(config_rules.config_rules) is COMPILED_RULES
+    assert set(COMPILED_RULES) == set(config_rules.config_rules)
+
+
+def test_rule_index_last_group_wins_and_keeps_keyword_order():
+    rules = {
+        "A規則": [{"rule": "r1", "keywords": ["x", "y"], "class": "甲", "required": True, "description": "d1"}],
+        "B規則": [{"rule": "r2", "keywords": ["y", "x"], "class": "甲", "required": False, "description": "d2"}],
+    }
+    index = RuleIndex(rules)
+    assert index.keyword_required == {"x": False, "y": False}
+    assert index.keyword_rule["x"] == "r2"
+    assert index.class_description == {"甲": "d2"}
+    assert index.keywords_of("甲") == ("x", "y")
+    assert index.keywords_of("不存在") == ()
@@ -0,0 +1,81 @@
+import os
+import json
+
+import pytest
+
+import config_rules
+from customer_store import merge_customer_data
+from scoring_engine import SCORING_RULES, _parse_wan, compare_with_saved, grade_for, score_customer
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BASE_DIR, "Results")
+
+# 既有 AI 結果中與評分標準不符之處（本機, 既有）；其餘項目必須一致
+KNOWN_MISMATCHES = {
+    # 66 分屬 A+（65-70），AI 給 A
+    "C00009": {"grade": ("A+", "A")},
+    # credit_rating 值為 A（3 分），AI 給 5 分，總分因此多 2 分
+    "C00010": {"credit_rating": (3, 5), "total_score": (62, 64)},
+    # 各項分數與本機一致，但 AI 的加總有誤（各項合計 68）
+    "C00011": {"total_score": (68, 72)},
+    # 各項分數與本機一致，但 AI 的加總有誤（各項合計 43）
+    "C00013": {"total_score": (43, 42)},
+}
+
+
+def _load(relative_path):
+    with open(os.path.join(BASE_DIR, relative_path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _customers():
+    history_by_id = {h.get("customer_id"): h for h in _load("客戶過往紀錄/過往紀錄.json")}
+    return {c["customer_id"]: merge_customer_data(c, history_by_id.get(c["customer_id"]))
+            for c in _load("客戶基本資訊/基本資訊.json")}
+
+
+SAVED_IDS = sorted(name[len("result_"):-len(".json")] for name in os.listdir(RESULTS_DIR)
+                   if name.startswith("result_") and name.endswith(".json"))
+
+
+def test_saved_results_exist():
+    assert set(KNOWN_MISMATCHES) <= set(SAVED_IDS)
+
+
+@pytest.mark.parametrize("customer_id", SAVED_IDS)
+def test_matches_saved_results_except_known_mismatches(customer_id):
+    saved = _load(os.path.join("Results", f"result_{customer_id}.json"))
+    local = score_customer(_customers()[customer_id], config_rules.config_rules)
+    assert [row["項目"] for row in local["score_table"]] == [row["項目"] for row in saved["score_table"]]
+
+    known = KNOWN_MISMATCHES.get(customer_id, {})
+    expected = sorted(f"{field}: 本機 {ours} / 既有 {theirs}" for field, (ours, theirs) in known.items())
+    assert sorted(compare_with_saved(local, saved)) == expected
+
+
+@pytest.mark.parametrize("customer_id", SAVED_IDS)
+def test_local_result_is_self_consistent(customer_id):
+    local = score_customer(_customers()[customer_id], config_rules.config_rules)
+    assert local["total_score"] == sum(row["分數"] for row in local["score_table"])
+    assert local["score_formula"].endswith(f"={local['total_score']}")
+    assert local["grade"] == grade_for(local["total_score"])
+
+
+@pytest.mark.parametrize("total, grade", [(70, "A+"), (65, "A+"), (64, "A"), (55, "A"), (54, "B"), (45, "B"), (44, "C")])
+def test_grade_boundaries(total, grade):
+    assert grade_for(total) == grade
+
+
+@pytest.mark.parametrize("text, amount", [("月收入5萬", 5), ("存款 12.5 萬", 12.5), ("30000元", 3), ("無固定收入", 0),
+                                          (60000, 6)])
+def test_parse_wan(text, amount):
+    assert _parse_wan(text) == amount
+
+
+def test_every_rule_keyword_has_a_scorer():
+    keywords = {kw for group in config_rules.config_rules.values() for rule in group for kw in rule["keywords"]}
+    assert keywords <= set(SCORING_RULES)
+
+
+def test_unknown_product_returns_none():
+    assert score_customer({"希望購買保單": "不存在的保單"}, config_rules.config_rules) is None
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_join_leader_and_follower_share_result():
+    flights = SingleFlight()
+    flight, leader = flights.join("k")
+    same, follower_is_leader = flights.join("k")
+    assert leader and not follower_is_leader and same is flight
+    assert flights.in_flight() == 1
+    flights.finish(flight, {"score": 1})
+    assert same.wait(1) == {"score": 1}
+    assert flights.in_flight() == 0
+    # 完成後的新請求重新成為 leader
+    assert flights.join("k")[1]
+
+
+def test_do_calls_upstream_once_for_concurrent_callers():
+    flights = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def upstream():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", upstream, timeout=5)))
+    leader.start()
+    started.wait(1)
+    followers = [threading.Thread(target=lambda: results.append(flights.do("k", upstream, timeout=5)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+
+
+def test_follower_timeout_returns_none():
+    flights = SingleFlight()
+    flight, _ = flights.join("k")
+    follower, leader = flights.join("k")
+    assert not leader
+    started = time.monotonic()
+    assert follower.wait(0.05) is None
+    assert time.monotonic() - started < 1
+    flights.finish(flight, "late")
+    assert follower.wait(0) == "late"
+
+
+def test_leader_error_propagates_to_followers():
+    flights = SingleFlight()
+    flight, _ = flights.join("k")
+    follower, _ = flights.join("k")
+    flights.finish(flight, error=TimeoutError("upstream"))
+    with pytest.raises(TimeoutError):
+        follower.wait(1)
+
+
+def test_process_claim_shares_result_between_processes(tmp_path):
+    # 兩個 SingleFlight 各自開啟 lock 檔，等同兩個程序
+    first, second = SingleFlight(lock_dir=str(tmp_path)), SingleFlight(lock_dir=str(tmp_path))
+    claim = first.claim("k", 5)
+    assert not claim.shared
+    waited = []
+    thread = threading.Thread(target=lambda: waited.append(second.claim("k", 5)))
+    thread.start()
+    time.sleep(0.2)
+    claim.release({"score": 2})
+    thread.join(5)
+    assert waited[0].shared and waited[0].result == {"score": 2}
+    waited[0].release()
+
+
+def test_process_claim_timeout_falls_back_to_own_call(tmp_path):
+    first, second = SingleFlight(lock_dir=str(tmp_path)), SingleFlight(lock_dir=str(tmp_path))
+    claim = first.claim("k", 5)
+    other = second.claim("k", 0.2)
+    assert not other.shared and other.result is None
+    claim.release("done")
+
+
+def test_do_follower_waits_for_leader_without_deadline():
+    # leader 重試、退避可能遠超過單次逾時；follower 預設不另設期限，取得 leader 最後的結果
+    flights = SingleFlight()
+    started = threading.Event()
+
+    def slow_upstream():
+        started.set()
+        time.sleep(0.5)
+        return "after retries"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", slow_upstream)))
+    leader.start()
+    started.wait(1)
+    assert flights.do("k", slow_upstream) == ("after retries", True)
+    leader.join()
+    assert results == [("after retries", False)]
+
+
+def test_cleanup_removes_idle_lock_files(tmp_path):
+    flights = SingleFlight(lock_dir=str(tmp_path))
+    for key in ("a", "b"):
+        flights.claim(key).release("done")
+    held = flights.claim("held")
+    flights._last_cleanup = 0
+    flights._cleanup()
+    remaining = sorted(name for name in os.listdir(tmp_path) if name.endswith(".lock"))
+    # 仍被持有的 lock 檔不會被刪除
+    assert remaining == ["held.lock"]
+    held.release("done")
+
+
+def test_claim_survives_lock_file_removed_while_waiting(tmp_path):
+    # follower 等待期間 lock 檔被清理並由其他程序重建：取得舊檔的鎖後須改用新檔，不能與新 leader 同時成為 leader
+    first, second, third = (SingleFlight(lock_dir=str(tmp_path)) for _ in range(3))
+    claim = first.claim("k", 5)
+    waited = []
+    thread = threading.Thread(target=lambda: waited.append(second.claim("k", 5)))
+    thread.start()
+    time.sleep(0.2)
+    os.remove(tmp_path / "k.lock")
+    leader = third.claim("k", 5)
+    assert not leader.shared
+    claim.release("old")
+    thread.join(0.5)
+    assert thread.is_alive()
+    leader.release({"score": 3})
+    thread.join(5)
+    assert waited[0].shared and waited[0].result == {"score": 3}
+    waited[0].release()
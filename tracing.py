@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+
+from env_flags import env_flag
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Results", "traces.jsonl")
+# 程序內保留最近幾筆 trace 供頁面顯示
+MAX_RECENT_TRACES = 50
+# 寫檔緩衝：累積到一定行數或距上次寫出超過一定秒數時一次寫出
+FLUSH_LINES = 256
+FLUSH_INTERVAL = 1.0
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+_write_lock = threading.Lock()
+_buffer = []
+_last_flush = 0.0
+
+
+def tracing_enabled():
+    """是否寫出 trace 檔，預設開啟，可由環境變數 TRACING=0 關閉（關閉時仍保留程序內的最近 trace）"""
+    return env_flag("TRACING", True)
+
+
+def trace_path():
+    return os.getenv("TRACE_PATH", DEFAULT_TRACE_PATH)
+
+
+class Span:
+    """
+    一段計時區間：建立時開始計時並成為目前 context 的 span（其後建立的 span 皆為其子 span），
+    end() 或離開 with 區塊時結束並寫出一行 JSON 至 trace 檔
+    """
+
+    def __init__(self, name, attrs=None, new_trace=False):
+        parent = None if new_trace else _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = dict(attrs or {})
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self._token = _current_span.set(self)
+
+    def set(self, **attrs):
+        """加註屬性（如狀態碼、是否命中快取）"""
+        self.attrs.update(attrs)
+
+    def end(self, error=None):
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 在不同 context 結束（如 generator 於其他 thread 被回收），只需不再作為目前 span
+            pass
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": "error" if error is not None else "ok",
+            "attrs": self.attrs,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        _record(record)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc if exc_type is not None and not issubclass(exc_type, GeneratorExit) else None)
+        return False
+
+
+def span(name, new_trace=False, **attrs):
+    """
+    開始一個 span，可直接用於 with：
+        with span("agent.call", customer_id=...) as s:
+            ...
+            s.set(status=200)
+    new_trace=True 時不接續目前的 span，另起一筆 trace
+    """
+    return Span(name, attrs, new_trace=new_trace)
+
+
+def _record(record):
+    with _recent_lock:
+        spans = _recent.get(record["trace_id"])
+        if spans is None:
+            spans = _recent[record["trace_id"]] = []
+            if len(_recent) > MAX_RECENT_TRACES:
+                _recent.popitem(last=False)
+        else:
+            _recent.move_to_end(record["trace_id"])
+        spans.append(record)
+    if not tracing_enabled():
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _write_lock:
+        _buffer.append(line)
+        if len(_buffer) >= FLUSH_LINES or time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+            _flush_locked()
+
+
+def _flush_locked():
+    global _last_flush
+    _last_flush = time.monotonic()
+    if not _buffer:
+        return
+    data = "".join(_buffer).encode("utf-8")
+    _buffer.clear()
+    path = trace_path()
+    try:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # 整批完整的行以單次 append 寫出，多個程序同時寫入也不會交錯在同一行內
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.warning(f"寫入 trace 檔失敗：{e}")
+
+
+def flush():
+    """立即寫出緩衝中的 span（程序結束時會自動呼叫）"""
+    with _write_lock:
+        _flush_locked()
+
+
+atexit.register(flush)
+
+
+def get_trace(trace_id):
+    """取得程序內某筆 trace 已結束的 span，依開始時間排序"""
+    with _recent_lock:
+        spans = list(_recent.get(trace_id, []))
+    return sorted(spans, key=lambda record: record["start"])
+
+
+def read_traces(path=None, trace_id=None):
+    """
+    讀取 trace 檔，回傳 {trace_id: [span, ...]}（依檔案中出現順序）；可只取單一 trace
+    """
+    traces = OrderedDict()
+    with open(path or trace_path(), "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if trace_id is None or record.get("trace_id") == trace_id:
+                traces.setdefault(record["trace_id"], []).append(record)
+    return traces
+
+
+def waterfall(spans):
+    """
+    將同一筆 trace 的 span 整理為瀑布圖資料：依開始時間排序並計算深度與相對起點
+    Returns:
+        list: [{"name", "depth", "offset_ms", "duration_ms", "status", "attrs"}, ...]
+    """
+    if not spans:
+        return []
+    by_id = {record["span_id"]: record for record in spans}
+    origin = min(record["start"] for record in spans)
+
+    def depth(record):
+        level = 0
+        while record.get("parent_id") in by_id:
+            record = by_id[record["parent_id"]]
+            level += 1
+        return level
+
+    return [{"name": record["name"], "depth": depth(record), "offset_ms": (record["start"] - origin) * 1000,
+             "duration_ms": record["duration_ms"], "status": record["status"], "attrs": record.get("attrs", {})}
+            for record in sorted(spans, key=lambda record: record["start"])]
+
+
+if __name__ == "__main__":
+    # 彙總 trace 檔中各 span 的耗時，並以文字瀑布圖顯示最近一筆（或指定的）trace
+    import argparse
+
+    parser = argparse.ArgumentParser(description="trace 檔彙總與瀑布圖")
+    parser.add_argument("--path", help=f"trace 檔路徑，預設 {DEFAULT_TRACE_PATH}（可由 TRACE_PATH 設定）")
+    parser.add_argument("--trace", help="顯示指定 trace_id 的瀑布圖，預設為最後一筆")
+    args = parser.parse_args()
+
+    traces = read_traces(args.path)
+    durations = {}
+    for spans in traces.values():
+        for record in spans:
+            durations.setdefault(record["name"], []).append(record["duration_ms"])
+    print(f"{'span':<24}{'次數':>8}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}")
+    for name, values in sorted(durations.items()):
+        values.sort()
+        print(f"{name:<24}{len(values):>8}{values[len(values) // 2]:>12.1f}"
+              f"{values[min(len(values) - 1, int(len(values) * 0.95))]:>12.1f}{values[-1]:>12.1f}")
+
+    trace_id = args.trace or (next(reversed(traces)) if traces else None)
+    if trace_id in traces:
+        rows = waterfall(traces[trace_id])
+        total = max(row["offset_ms"] + row["duration_ms"] for row in rows) or 1
+        print(f"\ntrace {trace_id}（{total:.1f} ms）")
+        for row in rows:
+            start = int(row["offset_ms"] / total * 40)
+            width = max(1, int(row["duration_ms"] / total * 40))
+            label = "  " * row["depth"] + row["name"]
+            print(f"{label:<28}{' ' * start}{'█' * width:<{41 - start}}{row['duration_ms']:>10.1f} ms")
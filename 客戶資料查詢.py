@@ -1,62 +1,25 @@
 
 # 匯入套件與對應表
 import streamlit as st
-import json
-import os
-from agent_api_client import call_agent_api, extract_final_results, save_results
+from agent_api_client import load_latest_result
+from analysis_jobs import DONE, get_job_executor
+from customer_data import load_customer_data
+from customer_store import merge_customer_data
+from metrics import start_exporters
 import config_rules
 from 中文規則對應 import all_field_zh
+from report_html import build_score_table_html
+from rule_compiler import get_rule_index
 
-# 工具函式
-def get_class_desc_map():
-    # 建立 類別 -> 描述 對照表
-    class_desc_map = {}
-    for rule_group in config_rules.config_rules.values():
-        for rule in rule_group:
-            class_desc_map[rule["class"]] = rule.get("description", "")
-    return class_desc_map
+# 依 METRICS_PORT / METRICS_FILE 啟動指標輸出（每個程序只啟動一次，Streamlit rerun 不會重複啟動）
+start_exporters()
 
-def get_rule_class_map():
-    # 建立 項目 -> 類別 對照表
-    rule_class_map = {}
-    for rule_group in config_rules.config_rules.values():
-        for rule in rule_group:
-            for kw in rule["keywords"]:
-                rule_class_map[kw] = rule["class"]
-    return rule_class_map
-
-def get_rule_required_map():
-    # 建立 項目 -> 必要性 對照表
-    rule_required_map = {}
-    for rule_group in config_rules.config_rules.values():
-        for rule in rule_group:
-            for kw in rule["keywords"]:
-                rule_required_map[kw] = "必要" if rule.get("required", False) else "選擇"
-    return rule_required_map
-
-def get_rule_name_map():
-    # 建立 項目 -> 規則中文名稱 對照表
-    rule_name_map = {}
-    for rule_group in config_rules.config_rules.values():
-        for rule in rule_group:
-            for kw in rule["keywords"]:
-                rule_name_map[kw] = rule["rule"]
-    return rule_name_map
-
-# 讀取基本資料
-with open("客戶基本資訊/基本資訊.json", "r", encoding="utf-8") as f:
-    customers = json.load(f)
-
-# 讀取過往紀錄
-with open("客戶過往紀錄/過往紀錄.json", "r", encoding="utf-8") as f:
-    records = json.load(f)
-
-customer_dict = {c["name"]: c for c in customers}
-id_to_record = {r["customer_id"]: r for r in records}
+# 讀取基本資料與過往紀錄（跨 session 共用，檔案異動時自動重新載入）
+customers, customer_dict, id_to_record = load_customer_data()
 
 st.title("客戶資料查詢")
 
-names = [c["name"] for c in customers]
+names = list(customer_dict)
 selected_name = st.selectbox("請選擇客戶姓名", names)
 
 if selected_name:
@@ -116,23 +79,22 @@ if selected_name:
 
     # 智慧分析承保 Agent 按鈕
     if st.button("智慧分析承保 Agent"):
-        # 合併基本資料與過往紀錄
-        customer_data = customer.copy()
-        if record:
-            for k, v in record.items():
-                if k != "customer_id":
-                    customer_data[k] = v
-        # 呼叫 API 並儲存
-        result = call_agent_api(customer_data, config_rules.config_rules)
-        if result:
-            final_result = extract_final_results(result)
-            if final_result:
-                save_results(final_result, customer["customer_id"])
-                st.success("AI 分析已完成並儲存！")
-            else:
-                st.error("AI 回傳內容解析失敗")
+        # 合併基本資料與過往紀錄（深複製，快取中的資料跨 session 共用，不可就地修改）
+        customer_data = merge_customer_data(customer, record)
+        # 加入背景分析佇列（與分析頁共用），不阻塞頁面；完成後結果存入結果庫
+        job = get_job_executor().submit(customer_data, config_rules.config_rules, label=customer["name"])
+        st.session_state.setdefault("analysis_jobs", {})[customer["customer_id"]] = job.id
+        st.info("已加入分析佇列，完成後按「顯示 AI 智慧分析結果」查看。")
+
+    # 此客戶最近一次送出的背景分析進度
+    job = get_job_executor().get(st.session_state.get("analysis_jobs", {}).get(customer["customer_id"]))
+    if job is not None:
+        if job.status == DONE:
+            st.success("資料未變動，已套用先前的 AI 分析結果！" if job.from_cache else "AI 分析已完成並儲存！")
+        elif job.finished:
+            st.error(job.error or "API 呼叫或回傳內容解析失敗")
         else:
-            st.error("API 呼叫失敗")
+            st.info(f"{job.stage}（{job.elapsed():.0f} 秒），完成後按「顯示 AI 智慧分析結果」查看。")
 
     # 僅在按下按鈕後顯示 AI 分析結果
     if "show_ai_result" not in st.session_state:
@@ -143,10 +105,9 @@ if selected_name:
 
     if st.session_state["show_ai_result"]:
         import streamlit.components.v1 as components
-        result_path = f"Results/result_{customer['customer_id']}.json"
-        if os.path.exists(result_path):
-            with open(result_path, "r", encoding="utf-8") as f:
-                ai_result = json.load(f)
+        # 結果庫中最新一次的分析結果
+        ai_result = load_latest_result(customer['customer_id'])
+        if ai_result:
 
             # 分數評級區塊
             st.markdown("""
@@ -194,88 +155,7 @@ if selected_name:
 
             # 規則合規情況表格（無標題，直接顯示）
             # 產生 HTML 表格，規則名稱 hover 顯示規則說明
-            from collections import OrderedDict
-            rule_class_map = get_rule_class_map()
-            rule_required_map = get_rule_required_map()
-            class_desc_map = get_class_desc_map()
-            table_data = []
-            rule_explain_map = {item.get("項目", ""): item.get("規則", "") for item in ai_result.get("score_table", [])}
-            for item in ai_result.get("score_table", []):
-                keyword = item.get("項目", "")
-                required = rule_required_map.get(keyword, "選擇")
-                if required == "必要":
-                    required_str = "✦ 必要"
-                else:
-                    required_str = "○ 選擇"
-                table_data.append({
-                    "分數": item.get("分數", ""),
-                    "規則名稱": keyword,
-                    "規則名稱顯示": all_field_zh.get(keyword, keyword),
-                    "必要性": required_str,
-                    "類別": rule_class_map.get(keyword, "未知")
-                })
-            grouped = OrderedDict()
-            for row in table_data:
-                grouped.setdefault(row["類別"], []).append(row)
-            class_colors = ["#e6f2ff", "#f9f9d1", "#e8f6e8", "#ffe6e6", "#f3e6ff", "#fff2cc"]
-            class_color_map = {}
-            for idx, k in enumerate(grouped.keys()):
-                class_color_map[k] = class_colors[idx % len(class_colors)]
-            html = '''<style>
-            .score-table th, .score-table td { border:1px solid #bbb; border-bottom:3.5px solid #2c5c88; padding:8px 12px; text-align:center; font-size:16px; }
-            .score-table th { background:#2c5c88; color:#fff; }
-            .score-table .class-cell { cursor: pointer; position:relative; }
-            .class-tooltip { display:none; position:absolute; left:100%; top:50%; transform:translateY(-50%); background:#fff; color:#222; border:1.5px solid #2c5c88; border-radius:10px; padding:16px 28px; min-width:260px; max-width:480px; box-shadow:0 4px 16px #888; z-index:99999; font-size:16px; text-align:left; white-space:pre-line; word-break:break-all; }
-            .class-cell:hover .class-tooltip { display:block; }
-            .score-table .rule-link { color: #222; text-decoration: none; cursor: default; position:relative; }
-            .score-table td { background:#fff; }
-            .rule-tooltip { display:none; position:absolute; left:100%; top:50%; transform:translateY(-50%); background:#fff; color:#222; border:1.5px solid #1a5fb4; border-radius:8px; padding:10px 16px; min-width:180px; max-width:320px; box-shadow:0 2px 8px #888; z-index:9999; font-size:15px; white-space:pre-line; }
-            .rule-link:hover .rule-tooltip { display:block; }
-            </style>
-            <div><table class="score-table" style="border-collapse:collapse;width:100%;min-width:600px;">
-            <tr><th>分數</th><th>規則名稱</th><th>必要性</th><th>類別</th></tr>
-            '''
-            for idx, (cls, rows) in enumerate(grouped.items()):
-                rowspan = len(rows)
-                color = class_color_map[cls]
-                for i, row in enumerate(rows):
-                    html += "<tr>"
-                    html += f"<td>{row['分數']}</td>"
-                    rule_key = row['規則名稱']
-                    rule_desc = rule_explain_map.get(rule_key, '')
-                    def beautify_rule_desc(desc):
-                        import re
-                        items = re.split(r'[；;\n]+', desc)
-                        items = [i.strip() for i in items if i.strip()]
-                        html_list = []
-                        for item in items:
-                            if '：' in item:
-                                k, v = item.split('：', 1)
-                                v = v.strip()
-                                if not v.endswith('分'):
-                                    v = v + '分'
-                                html_list.append(f'<li>📊 <b>{k}</b>：<span style="color:#1a5fb4;font-weight:bold">{v}</span></li>')
-                            elif ':' in item:
-                                k, v = item.split(':', 1)
-                                v = v.strip()
-                                if not v.endswith('分'):
-                                    v = v + '分'
-                                html_list.append(f'<li>📊 <b>{k}</b>：<span style="color:#1a5fb4;font-weight:bold">{v}</span></li>')
-                            else:
-                                html_list.append(f'<li>{item}</li>')
-                        return '<ul style="margin:0 0 0 1em;padding:0;list-style:none;text-align:left;">' + ''.join(html_list) + '</ul>' if html_list else desc
-                    beautified = beautify_rule_desc(rule_desc)
-                    html += f"<td><span class='rule-link'>{row['規則名稱顯示']}<span class='rule-tooltip'>{beautified}</span></span></td>"
-                    html += f"<td>{row['必要性']}</td>"
-                    if i == 0:
-                        desc = class_desc_map.get(cls, "")
-                        html += f"<td rowspan='{rowspan}' class='class-cell' style='background:{color};font-weight:bold;min-width:90px;position:relative;'>{cls}"
-                        if desc:
-                            html += f"<span class='class-tooltip'><b>📂 {cls}</b><br>{desc}</span>"
-                        html += "</td>"
-                    html += "</tr>"
-            html += "</table></div>"
-
+            html = build_score_table_html(ai_result, get_rule_index(config_rules.config_rules))
             st.markdown("#### 規則合規情況")
             components.html(html, height=800, scrolling=False)
 
@@ -312,98 +192,10 @@ if selected_name:
 
 
             # 細項分數表格
-            rule_class_map = get_rule_class_map()
-            rule_required_map = get_rule_required_map()
-            class_desc_map = get_class_desc_map()
             # 對話框狀態
             if "rule_dialog" not in st.session_state:
                 st.session_state["rule_dialog"] = None
-            # 準備分數細項資料
-            table_data = []
-            rule_explain_map = {item.get("項目", ""): item.get("規則", "") for item in ai_result.get("score_table", [])}
-            for item in ai_result.get("score_table", []):
-                keyword = item.get("項目", "")
-                required = rule_required_map.get(keyword, "選擇")
-                if required == "必要":
-                    required_str = "✦ 必要"
-                else:
-                    required_str = "○ 選擇"
-                table_data.append({
-                    "分數": item.get("分數", ""),
-                    "規則名稱": keyword,
-                    "規則名稱顯示": all_field_zh.get(keyword, keyword),
-                    "必要性": required_str,
-                    "類別": rule_class_map.get(keyword, "未知")
-                })
-            # 依類別 groupby，計算 rowspan
-            from collections import OrderedDict
-            grouped = OrderedDict()
-            for row in table_data:
-                grouped.setdefault(row["類別"], []).append(row)
-            # 類別底色
-            class_colors = ["#e6f2ff", "#f9f9d1", "#e8f6e8", "#ffe6e6", "#f3e6ff", "#fff2cc"]
-            class_color_map = {}
-            for idx, k in enumerate(grouped.keys()):
-                class_color_map[k] = class_colors[idx % len(class_colors)]
-            # 產生 HTML 表格，規則名稱 hover 顯示規則說明
-            html = '''<style>
-            .score-table th, .score-table td { border:1px solid #bbb; padding:8px 12px; text-align:center; font-size:16px; }
-            .score-table th { background:#2c5c88; color:#fff; }
-            .score-table .class-cell { cursor: pointer; position:relative; }
-            .class-tooltip { display:none; position:absolute; left:100%; top:50%; transform:translateY(-50%); background:#fff; color:#222; border:1.5px solid #2c5c88; border-radius:10px; padding:16px 28px; min-width:260px; max-width:480px; box-shadow:0 4px 16px #888; z-index:99999; font-size:16px; text-align:left; white-space:pre-line; word-break:break-all; }
-            .class-cell:hover .class-tooltip { display:block; }
-            .score-table .rule-link { color: #222; text-decoration: none; cursor: default; position:relative; }
-            .score-table td { background:#fff; }
-            .rule-tooltip { display:none; position:absolute; left:100%; top:50%; transform:translateY(-50%); background:#fff; color:#222; border:1.5px solid #1a5fb4; border-radius:8px; padding:10px 16px; min-width:180px; max-width:320px; box-shadow:0 2px 8px #888; z-index:9999; font-size:15px; white-space:pre-line; }
-            .rule-link:hover .rule-tooltip { display:block; }
-            </style>
-            <div><table class="score-table" style="border-collapse:collapse;width:100%;min-width:600px;">
-            <tr><th>分數</th><th>規則名稱</th><th>必要性</th><th>類別</th></tr>
-            '''
-            for idx, (cls, rows) in enumerate(grouped.items()):
-                rowspan = len(rows)
-                color = class_color_map[cls]
-                for i, row in enumerate(rows):
-                    html += "<tr>"
-                    html += f"<td>{row['分數']}</td>"
-                    rule_key = row['規則名稱']
-                    rule_desc = rule_explain_map.get(rule_key, '')
-                    # 條列式美化規則說明
-                    def beautify_rule_desc(desc):
-                        import re
-                        # 將 "；" 或 ";" 或 "\n" 分割
-                        items = re.split(r'[；;\n]+', desc)
-                        items = [i.strip() for i in items if i.strip()]
-                        # 將 "：" 或 ":" 分割分數
-                        html_list = []
-                        for item in items:
-                            if '：' in item:
-                                k, v = item.split('：', 1)
-                                v = v.strip()
-                                if not v.endswith('分'):
-                                    v = v + '分'
-                                html_list.append(f'<li>📊 <b>{k}</b>：<span style="color:#1a5fb4;font-weight:bold">{v}</span></li>')
-                            elif ':' in item:
-                                k, v = item.split(':', 1)
-                                v = v.strip()
-                                if not v.endswith('分'):
-                                    v = v + '分'
-                                html_list.append(f'<li>📊 <b>{k}</b>：<span style="color:#1a5fb4;font-weight:bold">{v}</span></li>')
-                            else:
-                                html_list.append(f'<li>{item}</li>')
-                        return '<ul style="margin:0 0 0 1em;padding:0;list-style:none;text-align:left;">' + ''.join(html_list) + '</ul>' if html_list else desc
-                    beautified = beautify_rule_desc(rule_desc)
-                    # 規則名稱加上 hover 條列美化說明
-                    html += f"<td><span class='rule-link'>{row['規則名稱顯示']}<span class='rule-tooltip'>{beautified}</span></span></td>"
-                    html += f"<td>{row['必要性']}</td>"
-                    if i == 0:
-                        desc = class_desc_map.get(cls, "")
-                        # 美化類別 hover 浮窗
-                        html += f"<td rowspan='{rowspan}' class='class-cell' style='background:{color};font-weight:bold;min-width:90px;position:relative;'>{cls}"
-                        if desc:
-                            html += f"<span class='class-tooltip'><b>📂 {cls}</b><br>{desc}</span>"
-                        html += "</td>"
-                    html += "</tr>"
-            html += "</table></div>"
+            # 依類別合併儲存格，規則名稱 hover 顯示規則說明
+            html = build_score_table_html(ai_result, get_rule_index(config_rules.config_rules), class_separator=False)
         else:
             st.info("尚未有 AI 分析結果")
\ No newline at end of file